@@ -0,0 +1,127 @@
+# Runtime statistics for robot.py and remote_control.py; copy this file to
+# both boards. Each loop reports its iterations with tick(), and once every
+# PERIOD_MS snapshot() rolls the counters into the next record of a ring
+# allocated up front. The newest record is what the diagnostics
+# characteristic serves, as little endian int32 fields:
+#   0  ticks_ms of the snapshot
+#   1  free heap, bytes
+#   2  allocated heap, bytes
+#   3  periods so far in which the heap shrank, so at least one garbage
+#      collection ran
+#   4  BLE reads in the period
+#   5  BLE notifications in the period
+#   6  servo writes in the period
+#   7  idle collections the robot's gc_task ran so far (0 on the remote)
+#   8  longest of those so far, us
+#   9  motion ticks over their budget so far (0 on the remote)
+#  10  then for every task: iterations in the period, average and longest
+#      iteration in us
+# The fields counted so far are written by their owner and never reset,
+# so the robot's second core can count overruns without a lock. The heap
+# is only sampled by snapshot(): gc.mem_alloc() walks the whole allocation
+# table under the GC lock, about a millisecond on the RP2040, far too slow
+# for tick().
+
+import gc
+import time
+from array import array
+
+PERIOD_MS = 1000
+RECORDS = 16
+
+F_MS = 0
+F_FREE = 1
+F_ALLOC = 2
+F_GCS = 3
+F_READS = 4
+F_NOTIFIES = 5
+F_SERVO_WRITES = 6
+F_IDLE_GCS = 7
+F_GC_MAX_US = 8
+F_OVERRUNS = 9
+FIELDS = 10
+TASK_FIELDS = 3  # iterations, average us, longest us
+
+
+class Stats:
+    def __init__(self, tasks):
+        count = len(tasks)
+        self.tasks = tasks
+        self.ticks = array('i', [0] * count)
+        self.busy_us = array('i', [0] * count)
+        self.max_us = array('i', [0] * count)
+        self.reads = 0
+        self.notifies = 0
+        self.servo_writes = 0
+        self.gcs = 0
+        self.idle_gcs = 0
+        self.gc_max_us = 0
+        self.overruns = 0
+        self._alloc = gc.mem_alloc()
+        self.width = FIELDS + TASK_FIELDS * count
+        self.ring = array('i', [0] * (RECORDS * self.width))
+        # A view of each record, made once so snapshots allocate nothing
+        self.records = tuple(memoryview(self.ring)[i * self.width:(i + 1) * self.width]
+                             for i in range(RECORDS))
+        self.head = 0
+
+    def tick(self, task, t0):
+        """ Count one iteration of task, which started at ticks_us() t0.
+        Allocates nothing and leaves the heap alone, so it is safe on the
+        second core. """
+        us = time.ticks_diff(time.ticks_us(), t0)
+        self.ticks[task] += 1
+        self.busy_us[task] += us
+        if us > self.max_us[task]:
+            self.max_us[task] = us
+
+    def snapshot(self):
+        """ Store the period's counters as the next record, start a new
+        period and return the record """
+        ring = self.ring
+        base = self.head * self.width
+        alloc = gc.mem_alloc()
+        # The heap only shrinks when it is collected
+        if alloc < self._alloc:
+            self.gcs += 1
+        self._alloc = alloc
+        ring[base + F_MS] = time.ticks_ms()
+        ring[base + F_FREE] = gc.mem_free()
+        ring[base + F_ALLOC] = alloc
+        ring[base + F_GCS] = self.gcs
+        ring[base + F_READS] = self.reads
+        ring[base + F_NOTIFIES] = self.notifies
+        ring[base + F_SERVO_WRITES] = self.servo_writes
+        ring[base + F_IDLE_GCS] = self.idle_gcs
+        ring[base + F_GC_MAX_US] = self.gc_max_us
+        ring[base + F_OVERRUNS] = self.overruns
+        self.reads = 0
+        self.notifies = 0
+        self.servo_writes = 0
+        offset = base + FIELDS
+        for task in range(len(self.tasks)):
+            ticks = self.ticks[task]
+            ring[offset] = ticks
+            ring[offset + 1] = self.busy_us[task] // ticks if ticks else 0
+            ring[offset + 2] = self.max_us[task]
+            self.ticks[task] = 0
+            self.busy_us[task] = 0
+            self.max_us[task] = 0
+            offset += TASK_FIELDS
+        record = self.records[self.head]
+        self.head = (self.head + 1) % RECORDS
+        return record
+
+    def report(self, record):
+        """ One line summary of a record, for the REPL """
+        parts = ["heap %d/%d gc %d reads %d notifies %d servo %d "
+                 "idle gc %d max %dus overruns %d" % (
+                     record[F_FREE], record[F_ALLOC], record[F_GCS], record[F_READS],
+                     record[F_NOTIFIES], record[F_SERVO_WRITES], record[F_IDLE_GCS],
+                     record[F_GC_MAX_US], record[F_OVERRUNS])]
+        offset = FIELDS
+        for name in self.tasks:
+            parts.append("%s %d avg %dus max %dus" % (
+                name, record[offset], record[offset + 1], record[offset + 2]))
+            offset += TASK_FIELDS
+        return ", ".join(parts)
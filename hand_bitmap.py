@@ -0,0 +1,41 @@
+# The Thing splash image, converted from hand.pbm so the remote doesn't have
+# to open and parse the file at boot. 60x60 pixels in framebuf.MONO_HLSB
+# order, 8 bytes per row. Freeze this module to keep DATA in flash.
+
+from micropython import const
+
+WIDTH = const(60)
+HEIGHT = const(60)
+
+DATA = (
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xf8\x00\x0f\xff\xf0\xff\xff\xff\xe0\x00\x01\xff\xf0'
+    b'\xff\xff\xff\x80\x00\x00\x7f\xf0\xff\xff\xff\x00\x00\x00\x1f\xf0'
+    b'\xff\xff\xfe\x00\x00\x00\x1f\xf0\xff\xff\xfc\x00\x08\x00\x0f\xf0'
+    b'\xff\xff\xf8\x00\xc0\x00\x1f\xf0\xff\xff\xf0\x00\x00\x01\xff\xf0'
+    b'\xff\xff\xe0\x00\x00\x00\xff\xf0\xff\xff\xe0\x00\x00\x00\xff\xf0'
+    b'\xff\xff\xc0\x00\x00\x80\xff\xf0\xff\xff\xc0\x00\x00\xf1\xff\xf0'
+    b'\xff\xff\x80\x00\x00\x7f\xff\xf0\xff\xff\x00\x00\x00\x3f\xff\xf0'
+    b'\xff\xff\x00\x00\x0c\x7f\xff\xf0\xff\xfe\x00\x01\x04\x3f\xff\xf0'
+    b'\xff\xfe\x00\x03\x84\x7f\xff\xf0\xff\xfc\x00\x03\xcf\xff\xff\xf0'
+    b'\xff\xfc\x00\x01\xff\xff\xff\xf0\xff\xf8\x00\x00\x7f\xff\xff\xf0'
+    b'\xff\xf8\x00\x00\x07\xff\xff\xf0\xff\xf8\x00\x00\x00\x7f\xff\xf0'
+    b'\xff\xf0\x00\x00\x00\x1f\xff\xf0\xff\xf0\x00\x00\x00\x0f\xff\xf0'
+    b'\xff\xf0\x00\x00\x00\x0f\xff\xf0\xff\xf0\x00\x28\x00\x1f\xff\xf0'
+    b'\xff\xe0\x01\xff\xc0\x3f\xff\xf0\xff\xe0\x03\xff\xff\xff\xff\xf0'
+    b'\xff\xc0\x07\xff\xff\xff\xff\xf0\xff\xc0\x07\xff\xff\xff\xff\xf0'
+    b'\xff\xc0\x0f\xff\xff\xff\xff\xf0\xff\xc0\x0f\xff\xff\xff\xff\xf0'
+    b'\xff\xfa\xbf\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+    b'\xff\xff\xff\xff\xff\xff\xff\xf0\xff\xff\xff\xff\xff\xff\xff\xf0'
+)
@@ -13,6 +13,14 @@ import time
 
 import ssd1306
 import framebuf
+import hand_bitmap
+import diagnostics
+
+# Hot path logging: _DEBUG is a const, so with it at 0 the compiler drops
+# every "if _DEBUG:" block and the prints cost nothing at run time.
+_DEBUG = const(0)
+
+boot_ms = time.ticks_ms()
 
 i2c = I2C(0, sda=Pin(0), scl=Pin(1))
 display = ssd1306.SSD1306_I2C(128, 64, i2c)
@@ -21,33 +29,105 @@ display = ssd1306.SSD1306_I2C(128, 64, i2c)
 def clear_display():
     display.fill(0)
     display.show()
+
+
+# ---------- Display manager -----------
+#
+# Labels are drawn into the frame buffer and only the SSD1306 pages (8 pixel
+# rows) they touch are sent over I2C. display_task does the drawing, at most
+# once every DISPLAY_FRAME_MS, so a slow I2C transfer never holds up the
+# input loop, and a label that is already on screen is not redrawn.
+
+DISPLAY_FRAME_MS = 50
+PAGE_BYTES = 128
+
+LABEL_X = 20
+LABEL_Y = 40
+
+_pages = [memoryview(display.buffer)[p * PAGE_BYTES:(p + 1) * PAGE_BYTES] for p in range(8)]
+_dirty_pages = 0
+_label = None
+_wanted_label = None
+display_event = asyncio.Event()
+
+
+def mark_dirty(y, height):
+    """ Mark the pages covering rows y to y + height - 1 for sending """
+    global _dirty_pages
+    for page in range(y // 8, (y + height + 7) // 8):
+        _dirty_pages |= 1 << page
+
+
+def push_pages():
+    """ Send the dirty pages of the frame buffer to the display """
+    global _dirty_pages
+    for page in range(8):
+        if _dirty_pages & (1 << page):
+            display.write_cmd(0x21)  # Column address range
+            display.write_cmd(0)
+            display.write_cmd(127)
+            display.write_cmd(0x22)  # Page address range
+            display.write_cmd(page)
+            display.write_cmd(page)
+            display.write_data(_pages[page])
+    _dirty_pages = 0
+
+
+def show_label(label):
+    """ Ask display_task to put label on the screen """
+    global _wanted_label
+    _wanted_label = label
+    display_event.set()
+
+
+async def display_task():
+    global _label
+    await intro_done.wait()
+    while True:
+        while _wanted_label == _label and not _dirty_pages:
+            display_event.clear()
+            await display_event.wait()
+        t0 = time.ticks_us()
+        if _wanted_label != _label:
+            _label = _wanted_label
+            display.fill_rect(0, LABEL_Y, 128, 8, 0)
+            if _label:
+                display.text(_label, LABEL_X, LABEL_Y)
+            mark_dirty(LABEL_Y, 8)
+        if _dirty_pages:
+            push_pages()
+        stats.tick(TASK_DISPLAY, t0)
+        await asyncio.sleep_ms(DISPLAY_FRAME_MS)
     
 # ---------- Display image of Thing on display -----------
-
-display.text('The THING', 28, 0)
-
-
-with open('hand.pbm', 'rb') as f:
-    f.readline() 
-    f.readline() 
-    f.readline() 
-    data = bytearray(f.read())
-fbuf = framebuf.FrameBuffer(data, 60, 61, framebuf.MONO_HLSB)
-display.blit(fbuf, 35, 12, 0)
-
-display.show()
-time.sleep(2)
-display.fill(0)
-display.text("INITIALIZING", 15, 30)
-display.show()
-time.sleep(1)
-display.text("CAPACITOR CHARGE",0, 40)
-display.show()
-time.sleep(1)
-display.text("READY!", 40, 50)
-display.show()
-time.sleep(2)
-clear_display()
+#
+# The intro runs as its own task next to advertising, so the robot can
+# connect while it plays. A connection cuts it short.
+
+intro_done = asyncio.Event()
+
+
+async def intro_task():
+    try:
+        display.text('The THING', 28, 0)
+        fbuf = framebuf.FrameBuffer(bytearray(hand_bitmap.DATA), hand_bitmap.WIDTH,
+                                    hand_bitmap.HEIGHT, framebuf.MONO_HLSB)
+        display.blit(fbuf, 35, 12, 0)
+        display.show()
+        await asyncio.sleep_ms(2000)
+        display.fill(0)
+        display.text("INITIALIZING", 15, 30)
+        display.show()
+        await asyncio.sleep_ms(1000)
+        display.text("CAPACITOR CHARGE",0, 40)
+        display.show()
+        await asyncio.sleep_ms(1000)
+        display.text("READY!", 40, 50)
+        display.show()
+        await asyncio.sleep_ms(2000)
+    finally:
+        clear_display()
+        intro_done.set()
 
 # --------------------------------------------------------
 
@@ -105,16 +185,40 @@ _BUTTON_UUID = bluetooth.UUID(0x2A6E)
 
 _BLE_APPEARANCE_GENERIC_REMOTE_CONTROL = const(384)
 
-# Advertising frequency
-ADV_INTERVAL_MS = 250_000
+# Link profiles: (label, advertising interval in us). They trade input
+# latency for battery life. The robot holds the matching scan and connection
+# intervals, and learns the selected profile from the top two bits of the
+# button mask. Holding white and black together moves to the next profile.
+LINK_PROFILES = (
+    ("LOW LATENCY", 20_000),
+    ("BALANCED", 250_000),
+    ("BATTERY SAVER", 1_000_000),
+)
+PROFILE_FILE = "profile.txt"
+
+
+def load_profile():
+    try:
+        with open(PROFILE_FILE) as f:
+            profile = int(f.read())
+        if 0 <= profile < len(LINK_PROFILES):
+            return profile
+    except (OSError, ValueError):
+        pass
+    return 1
+
+
+link_profile = load_profile()
 
 device_info = aioble.Service(_ENV_SENSE_UUID)
 
 connection = None
 
-# Create characteristics for device info
+# Create characteristics for device info. Robots cache this remote's GATT
+# handles by serial number; bump the model number whenever the services or
+# characteristics change so they rediscover.
 aioble.Characteristic(device_info, bluetooth.UUID(MANUFACTURER_ID), read=True, initial="TheThingRemote")
-aioble.Characteristic(device_info, bluetooth.UUID(MODEL_NUMBER_ID), read=True, initial="1.0")
+aioble.Characteristic(device_info, bluetooth.UUID(MODEL_NUMBER_ID), read=True, initial="1.1")
 aioble.Characteristic(device_info, bluetooth.UUID(SERIAL_NUMBER_ID), read=True, initial=uid())
 aioble.Characteristic(device_info, bluetooth.UUID(HARDWARE_REVISION_ID), read=True, initial=sys.version)
 aioble.Characteristic(device_info, bluetooth.UUID(BLE_VERSION_ID), read=True, initial="1.0")
@@ -125,98 +229,226 @@ button_characteristic = aioble.Characteristic(
     remote_service, _BUTTON_UUID, read=True, notify=True
 )
 
+# Runtime statistics, laid out as in diagnostics.py
+_DIAG_UUID = bluetooth.UUID("7e1a0001-5468-696e-6720-446961670000")
+_DIAG_STATS_UUID = bluetooth.UUID("7e1a0002-5468-696e-6720-446961670000")
+diag_service = aioble.Service(_DIAG_UUID)
+diag_characteristic = aioble.Characteristic(diag_service, _DIAG_STATS_UUID, read=True)
+
 print('registering services')
-aioble.register_services(remote_service, device_info)
+aioble.register_services(remote_service, device_info, diag_service)
+
+TASK_REMOTE = const(0)
+TASK_DISPLAY = const(1)
+TASK_BLINK = const(2)
+
+stats = diagnostics.Stats(("remote", "display", "blink"))
 
 connected = False
 
+# ---------- Input encoder -----------
+#
+# Inputs are sampled every SAMPLE_MS. Buttons are debounced and the
+# thumbsticks are quantized with a dead zone, and a frame is only sent when
+# the input state changes. While anything is held, the frame is repeated
+# every HEARTBEAT_MS so the robot knows the input is still there.
+#
+# Every notification carries the whole input state in one frame:
+#   0  header, 0x80 | FRAME_VERSION (legacy commands are plain ASCII)
+#   1  sequence number
+#   2  button mask, bit 0 green, red, blue, yellow, white, bit 5 black;
+#      bits 6 and 7 hold the link profile
+#   3  left thumbstick 1 (ADC 26), signed -127..127
+#   4  left thumbstick 2 (ADC 27)
+#   5  right thumbstick 1 (ADC 28)
+
+SAMPLE_MS = 10
+DEBOUNCE_SAMPLES = 3
+HEARTBEAT_MS = 500  # 0 turns the heartbeat off
+
+FRAME_VERSION = 1
+FRAME_HEADER = 0x80 | FRAME_VERSION
+FRAME_LEN = 6
+FRAME_BUTTONS = 2
+FRAME_AXES = 3
+BUTTON_MASK = 0x3F
+PROFILE_SHIFT = 6
+PROFILE_COMBO = (1 << 4) | (1 << 5)  # White and black
+
+AXIS_DEADZONE = 4000  # Raw ADC counts around the centre that read as 0
+AXIS_STEP = 4  # Change in a quantized axis needed before it is re-sent
+
+# A stick label is shown past the outer threshold and cleared once the
+# stick is back inside the inner one
+STICK_HIGH_ENTER = 40000
+STICK_HIGH_EXIT = 36000
+STICK_LOW_ENTER = 20000
+STICK_LOW_EXIT = 24000
+
+# In button mask bit order
+BUTTONS = (
+    (green_button, green_led, "FINGER STAMP"),
+    (red_button, red_led, "CROUCH POS"),
+    (blue_button, blue_led, "STAND POS"),
+    (yellow_button, yellow_led, "POINT FINGER"),
+    (white_button, white_led, "LED ON"),
+    (black_button, black_led, "BOW DOWN"),
+)
+
+# (adc, high label, low label), in frame axis order
+STICKS = (
+    (left_thumb1, "CROUCH FWD", "CROUCH BWD"),
+    (left_thumb2, None, None),
+    (right_thumb1, "STAND WALK", None),
+)
+
+frame = bytearray(FRAME_LEN)
+frame[0] = FRAME_HEADER
+frame[FRAME_BUTTONS] = link_profile << PROFILE_SHIFT
+combo_held = False
+
+button_count = bytearray(len(BUTTONS))  # Samples that disagreed with a button
+stick_state = [0] * len(STICKS)  # -1, 0 or 1 for each stick's label
+
+last_sent_ms = 0
+
+
+def debounce(i):
+    """ Update button i in the frame and return True if it changed """
+    bit = 1 << i
+    raw = BUTTONS[i][0].value()
+    if bool(raw) == bool(frame[FRAME_BUTTONS] & bit):
+        button_count[i] = 0
+        return False
+    button_count[i] += 1
+    if button_count[i] < DEBOUNCE_SAMPLES:
+        return False
+    frame[FRAME_BUTTONS] ^= bit
+    button_count[i] = 0
+    return True
+
+
+def quantize(raw):
+    """ Map a raw ADC reading to -127..127 around the centre """
+    value = raw - 32768
+    if -AXIS_DEADZONE < value < AXIS_DEADZONE:
+        return 0
+    value = value * 127 // 32767
+    return -127 if value < -127 else 127 if value > 127 else value
+
+
+def axis(i):
+    value = frame[FRAME_AXES + i]
+    return value - 256 if value > 127 else value
+
+
+def stick_zone(value, zone):
+    """ Thumbstick position as -1, 0 or 1, with hysteresis around the thresholds """
+    if value > (STICK_HIGH_EXIT if zone == 1 else STICK_HIGH_ENTER):
+        return 1
+    if value < (STICK_LOW_EXIT if zone == -1 else STICK_LOW_ENTER):
+        return -1
+    return 0
+
+
+def send():
+    global last_sent_ms
+    frame[1] = (frame[1] + 1) & 0xFF
+    button_characteristic.write(frame)
+    button_characteristic.notify(connection, frame)
+    stats.notifies += 1
+    last_sent_ms = time.ticks_ms()
+
+
+def held():
+    """ True while any button is down or a stick is out of the centre """
+    if frame[FRAME_BUTTONS] & BUTTON_MASK:
+        return True
+    for i in range(len(STICKS)):
+        if frame[FRAME_AXES + i]:
+            return True
+    return False
+
+
+def next_profile():
+    """ Switch to the next link profile and remember it """
+    global link_profile
+    link_profile = (link_profile + 1) % len(LINK_PROFILES)
+    frame[FRAME_BUTTONS] = (frame[FRAME_BUTTONS] & BUTTON_MASK) | (link_profile << PROFILE_SHIFT)
+    show_label(LINK_PROFILES[link_profile][0])
+    try:
+        with open(PROFILE_FILE, "w") as f:
+            f.write(str(link_profile))
+    except OSError as e:
+        print("Could not save link profile:", e)
+
+
+def sample_inputs():
+    """ Update the frame from the inputs and return True if it changed """
+    global combo_held
+    changed = False
+    for i in range(len(BUTTONS)):
+        if debounce(i):
+            changed = True
+            if frame[FRAME_BUTTONS] & (1 << i):
+                pin, button_led, label = BUTTONS[i]
+                turn_off_leds()
+                button_led.value(1)
+                show_label(label)
+    combo = (frame[FRAME_BUTTONS] & PROFILE_COMBO) == PROFILE_COMBO
+    if combo and not combo_held:
+        next_profile()
+    combo_held = combo
+    for i in range(len(STICKS)):
+        adc, high_label, low_label = STICKS[i]
+        raw = adc.read_u16()
+        value = quantize(raw)
+        old = axis(i)
+        if abs(value - old) >= AXIS_STEP or (value == 0) != (old == 0):
+            frame[FRAME_AXES + i] = value & 0xFF
+            changed = True
+        zone = stick_zone(raw, stick_state[i])
+        if zone != stick_state[i]:
+            stick_state[i] = zone
+            label = high_label if zone == 1 else low_label if zone == -1 else None
+            if label:
+                show_label(label)
+    return changed
+
+
 async def remote_task():
-    """ Send the event to the connected device """
+    """ Send input changes to the connected device """
+    was_connected = False
     while True:
-        left_thumb1_value = left_thumb1.read_u16()
-        right_thumb1_value = right_thumb1.read_u16()
+        t0 = time.ticks_us()
+        changed = sample_inputs()
         if not connected:
-            print('not connected')
+            if _DEBUG:
+                print('not connected')
+            was_connected = False
+            stats.tick(TASK_REMOTE, t0)
             await asyncio.sleep_ms(1000)
             continue
-        if green_button.value():
-            button_characteristic.write(b"g")   
-            button_characteristic.notify(connection,b"g")
-            turn_off_leds()
-            green_led.value(1)
-            clear_display()
-            display.text("FINGER STAMP", 20, 40)
-            display.show()
-        if red_button.value():
-            button_characteristic.write(b"r")   
-            button_characteristic.notify(connection,b"r")
-            turn_off_leds()
-            red_led.value(1)
-            clear_display()
-            display.text("CROUCH POS", 20, 40)
-            display.show()
-        if blue_button.value():
-            button_characteristic.write(b"b")   
-            button_characteristic.notify(connection,b"b")
-            turn_off_leds()
-            blue_led.value(1)
-            clear_display()
-            display.text("STAND POS", 20, 40)
-            display.show()
-        if yellow_button.value():
-            button_characteristic.write(b"y")   
-            button_characteristic.notify(connection,b"y")
-            turn_off_leds()
-            yellow_led.value(1)
-            clear_display()
-            display.text("POINT FINGER", 20, 40)
-            display.show()
-        if white_button.value():
-            button_characteristic.write(b"w")   
-            button_characteristic.notify(connection,b"w")
-            turn_off_leds()
-            white_led.value(1)
-            clear_display()
-            display.text("LED ON", 20, 40)
-            display.show()
-        if black_button.value():
-            button_characteristic.write(b"k")   
-            button_characteristic.notify(connection,b"k")
-            turn_off_leds()
-            black_led.value(1)
-            clear_display()
-            display.text("BOW DOWN", 20, 40)
-            display.show()
-        if left_thumb1_value > 40000:
-            button_characteristic.write(b"x")   
-            button_characteristic.notify(connection,b"x")
-            clear_display()
-            display.text("CROUCH FWD", 20, 40)
-            display.show()
-        if left_thumb1_value < 20000:
-            button_characteristic.write(b"z")   
-            button_characteristic.notify(connection,b"z")
-            clear_display()
-            display.text("CROUCH BWD", 20, 40)
-            display.show()
-        if right_thumb1_value > 40000:
-            button_characteristic.write(b"v")   
-            button_characteristic.notify(connection,b"v")
-            clear_display()
-            display.text("STAND WALK", 20, 40)
-            display.show()
-        else:
-            button_characteristic.write(b"!")
-        await asyncio.sleep_ms(10)
+        if not was_connected:
+            # Tell a freshly connected robot what is currently held
+            was_connected = True
+            changed = True
+        if not changed and HEARTBEAT_MS and held():
+            changed = time.ticks_diff(time.ticks_ms(), last_sent_ms) >= HEARTBEAT_MS
+        if changed:
+            send()
+        stats.tick(TASK_REMOTE, t0)
+        await asyncio.sleep_ms(SAMPLE_MS)
             
    
 async def peripheral_task():
     print('peripheral task started')
     global connected, connection
+    print("advertising", time.ticks_diff(time.ticks_ms(), boot_ms), "ms after boot")
     while True:
         connected = False
         async with await aioble.advertise(
-            ADV_INTERVAL_MS, 
+            LINK_PROFILES[link_profile][1],
             name="TheThing", 
             appearance=_BLE_APPEARANCE_GENERIC_REMOTE_CONTROL, 
             services=[_ENV_SENSE_TEMP_UUID]
@@ -224,6 +456,8 @@ async def peripheral_task():
             print("Connection from", connection.device)
             connected = True
             print(f"connected: {connected}")
+            if intro and not intro_done.is_set():
+                intro.cancel()
             await connection.disconnected(timeout_ms=None)
             print(f'disconnected')
         
@@ -232,8 +466,10 @@ async def blink_task():
     print('blink task started')
     toggle = True
     while True:
+        t0 = time.ticks_us()
         led.value(toggle)
         toggle = not toggle
+        stats.tick(TASK_BLINK, t0)
         blink = 1000
         if connected:
             blink = 1000
@@ -241,13 +477,28 @@ async def blink_task():
             blink = 250
         await asyncio.sleep_ms(blink)
         
+async def diagnostics_task():
+    while True:
+        await asyncio.sleep_ms(diagnostics.PERIOD_MS)
+        record = stats.snapshot()
+        diag_characteristic.write(record)
+        if _DEBUG:
+            print(stats.report(record))
+
+intro = None
+
 async def main():
+    global intro
+    intro = asyncio.create_task(intro_task())
     tasks = [
         asyncio.create_task(peripheral_task()),
         asyncio.create_task(blink_task()),
         asyncio.create_task(remote_task()),
+        asyncio.create_task(display_task()),
+        asyncio.create_task(diagnostics_task()),
     ]
     await asyncio.gather(*tasks)
 
-asyncio.run(main())
+if __name__ == "__main__":
+    asyncio.run(main())
 
@@ -1,21 +1,36 @@
 from machine import Pin
 import time
-from servo import Servo
+from array import array
 
 import aioble
 import bluetooth
+import gc
 import machine
+import json
+import os
 import uasyncio as asyncio
+import _thread
+from micropython import const
+
+import diagnostics
+
+# Hot path logging: _DEBUG is a const, so with it at 0 the compiler drops
+# every "if _DEBUG:" block and the prints cost nothing at run time.
+_DEBUG = const(0)
 
 # Bluetooth UUIDS can be found online at https://www.bluetooth.com/specifications/gatt/services/
 _REMOTE_UUID = bluetooth.UUID(0x1848)
 _ENV_SENSE_UUID = bluetooth.UUID(0x1800) 
 _REMOTE_CHARACTERISTICS_UUID = bluetooth.UUID(0x2A6E)
+_DEVICE_INFO_UUID = bluetooth.UUID(0x180A)
+_MODEL_NUMBER_UUID = bluetooth.UUID(0x2A24)
+_SERIAL_NUMBER_UUID = bluetooth.UUID(0x2A25)
+_DIAG_UUID = bluetooth.UUID("7e1a0001-5468-696e-6720-446961670000")
+_DIAG_STATS_UUID = bluetooth.UUID("7e1a0002-5468-696e-6720-446961670000")
 
 # Pico onboard LED for bluetooth connectivity indication
 led = machine.Pin("LED", machine.Pin.OUT)
 connected = False
-alive = False
 
 wrist_led = Pin(16, Pin.OUT)
 wrist_led.value(0)
@@ -44,37 +59,414 @@ tt = 14
 # Knuckles servo Pin definition
 w = 15
 
-# Create servo objects for all the joints
-# Index Finger
-i_b = Servo(pin_id=ib)
-i_m = Servo(pin_id=im)
-i_t = Servo(pin_id=it)
-# Middle Finger
-m_b = Servo(pin_id=mb)
-m_m = Servo(pin_id=mm)
-m_t = Servo(pin_id=mt)
-# Ring FInger
-r_b = Servo(pin_id=rb)
-r_m = Servo(pin_id=rm)
-r_t = Servo(pin_id=rt)
-# Pinky 
-p_b = Servo(pin_id=pb)
-p_m = Servo(pin_id=pm)
-p_t = Servo(pin_id=pt)
-# Thumb
-t_b = Servo(pin_id=tb)
-t_m = Servo(pin_id=tm)
-t_t = Servo(pin_id=tt)
-# Knuckles
-wrt = Servo(pin_id=w)
+JOINTS = 16
+
+# Pin of every joint. Gesture tables and per-joint arrays use this order.
+JOINT_PINS = (ib, im, it, mb, mm, mt, rb, rm, rt, pb, pm, pt, tb, tm, tt, w)
+
+# Angle of a joint that a pose leaves alone, or that hasn't been written yet
+KEEP = const(-32768)
+
+
+# Servo pulse width in us at 0 and 180 degrees, in JOINT_PINS order
+SERVO_FREQ = 50
+SERVO_MIN_US = array('H', [544] * JOINTS)
+SERVO_MAX_US = array('H', [2400] * JOINTS)
+
+ANGLES = 181  # Entries in each joint's duty table, 0 to 180 degrees
+
+# Neutral (straight finger) angle of every joint as the gestures were
+# designed, in JOINT_PINS order. Gestures are offsets from these.
+NEUTRAL = array('h', (76, 15, 55, 87, 44, 58, 85, 35, 60, 88, 45, 45, 88, 48, 78, 90))
+
+# ---------- Calibration -----------
+#
+# Each joint has a calibrated neutral, the angle the servo really goes to for
+# its design NEUTRAL, a low and high limit, a direction and a trim, all in
+# degrees. They are baked into the joint's duty table, so a commanded angle
+# costs the same lookup as before and anything past the limits is clamped.
+# The record is kept on flash as one block:
+#   0  b"CL", version, joint count
+#   4  one byte per joint for each field below; trim is stored + CAL_TRIM_BIAS
+CAL_FILE = "calibration.bin"
+CAL_VERSION = 1
+CAL_HEADER = 4
+CAL_NEUTRAL = const(0)
+CAL_LOW = const(1)
+CAL_HIGH = const(2)
+CAL_REVERSED = const(3)
+CAL_TRIM = const(4)
+CAL_FIELDS = 5
+CAL_SIZE = CAL_HEADER + CAL_FIELDS * JOINTS
+CAL_TRIM_BIAS = 128
+
+calibration = bytearray(CAL_SIZE)
+
+
+def default_calibration():
+    calibration[0:CAL_HEADER] = bytes((ord("C"), ord("L"), CAL_VERSION, JOINTS))
+    for j in range(JOINTS):
+        set_cal(CAL_NEUTRAL, j, NEUTRAL[j])
+        set_cal(CAL_LOW, j, 0)
+        set_cal(CAL_HIGH, j, 180)
+        set_cal(CAL_REVERSED, j, 0)
+        set_cal(CAL_TRIM, j, CAL_TRIM_BIAS)
+
+
+def cal(field, j):
+    return calibration[CAL_HEADER + field * JOINTS + j]
+
+
+def set_cal(field, j, value):
+    calibration[CAL_HEADER + field * JOINTS + j] = value
+
+
+def load_calibration():
+    """ Read the record in one go; fall back to the design angles """
+    try:
+        with open(CAL_FILE, "rb") as f:
+            if f.readinto(calibration) == CAL_SIZE and \
+                    calibration[0:CAL_HEADER] == bytes((ord("C"), ord("L"), CAL_VERSION, JOINTS)):
+                return
+    except OSError:
+        pass
+    default_calibration()
+
+
+def save_calibration():
+    try:
+        with open(CAL_FILE, "wb") as f:
+            f.write(calibration)
+    except OSError as e:
+        print("Could not save calibration:", e)
+
+
+load_calibration()
+
+
+# Servo outputs. GPIO n is channel n & 1 (A or B) of PWM slice n >> 1 & 7,
+# so the joints on GPIO 0 to 15 take both channels of all eight slices. The
+# hand keeps every channel's compare value packed the way the slices' CC
+# registers hold them, B in the top half of one word per slice, and writes
+# a pose with one mem32 store per slice that changed; 16 bit stores won't
+# do, since the RP2040 copies them into both halves of a register. CC is
+# double buffered and only takes the new value when the slice wraps, and
+# the slices are started together, so all 16 pulses rise on the same edge;
+# flush() holds off while the counters are about to wrap, so a pose always
+# lands whole in one PWM frame. A servo pulse is under an
+# eighth of the period, so a packed word stays a small int and packing
+# allocates nothing. The register addresses don't fit a small int, so the
+# CC addresses are worked out once rather than added up on every write.
+PWM_BASE = 0x40050000
+PWM_EN = 0x400500A0  # Enable bit of every slice, to start them at once
+PWM_SLICE = const(0x14)  # Bytes between the registers of consecutive slices
+PWM_CTR = const(0x08)
+PWM_CC = const(0x0C)
+PWM_TOP = const(0x10)
+SLICES = 8
+FLUSH_MARGIN = const(1000)  # Counts before the wrap that flush() waits out, ~300 us
+
+
+def duty_table(j, top):
+    """ PWM compare value, for a slice that wraps at top, for every whole
+    commanded angle of joint j from 0 to 180 degrees, through the joint's
+    calibration """
+    period_us = 1_000_000 // SERVO_FREQ
+    min_us = SERVO_MIN_US[j]
+    max_us = SERVO_MAX_US[j]
+    neutral = cal(CAL_NEUTRAL, j) + cal(CAL_TRIM, j) - CAL_TRIM_BIAS
+    direction = -1 if cal(CAL_REVERSED, j) else 1
+    low = cal(CAL_LOW, j)
+    high = cal(CAL_HIGH, j)
+    table = array('H', [0] * ANGLES)
+    for angle in range(ANGLES):
+        a = neutral + direction * (angle - NEUTRAL[j])
+        a = min(max(a, low, 0), high, 180)
+        us = min_us + (max_us - min_us) * a // 180
+        table[angle] = us * (top + 1) // period_us
+    return table
+
+
+class Hand:
+    """ Owns the PWM outputs of all the joints and the last angle written to
+    each. Poses are staged with set()/set_pose() and commit() only writes the
+    joints whose angle actually changed, as a lookup in the joint's duty table.
+    Angles outside 0 to 180 degrees are clamped, and the duty tables clamp
+    again to the joint's calibrated limits. Once the motion core is running
+    only it writes the hand; everything else goes through start_move(). """
+
+    def __init__(self, pins):
+        # machine.PWM hands the pins to the slices and sets their period
+        self.pwms = []
+        self.channel = bytearray(JOINTS)  # slice * 2 + channel of each joint
+        slices = 0
+        used = 0  # Mask of the channels taken so far
+        for j in range(JOINTS):
+            pwm = machine.PWM(Pin(pins[j]))
+            pwm.freq(SERVO_FREQ)
+            self.pwms.append(pwm)
+            channel = (pins[j] >> 1 & 7) << 1 | pins[j] & 1
+            if used & (1 << channel):
+                raise ValueError("joints share a PWM channel", pins[j])
+            used |= 1 << channel
+            self.channel[j] = channel
+            slices |= 1 << (channel >> 1)
+        self.top = machine.mem32[PWM_BASE + (self.channel[0] >> 1) * PWM_SLICE + PWM_TOP] & 0xFFFF
+        self.duty = [duty_table(j, self.top) for j in range(JOINTS)]
+        self.cc = array('I', [0] * SLICES)
+        self.cc_address = tuple(PWM_BASE + s * PWM_SLICE + PWM_CC for s in range(SLICES))
+        # The slices count in step, so one counter tells when they all wrap
+        self.ctr_address = PWM_BASE + (self.channel[0] >> 1) * PWM_SLICE + PWM_CTR
+        # No pulses until the first commit, then in step across the slices
+        enabled = machine.mem32[PWM_EN]
+        machine.mem32[PWM_EN] = enabled & ~slices
+        for s in range(SLICES):
+            if slices & (1 << s):
+                machine.mem32[self.cc_address[s]] = 0
+                machine.mem32[PWM_BASE + s * PWM_SLICE + PWM_CTR] = 0
+        machine.mem32[PWM_EN] = enabled | slices
+        self.angles = array('h', [KEEP] * JOINTS)
+        self._pending = array('h', self.angles)
+        self.writes = 0
+        self.skipped = 0
+
+    def set(self, j, angle):
+        self._pending[j] = angle
+
+    def set_pose(self, pose):
+        for j in range(JOINTS):
+            if pose[j] != KEEP:
+                self._pending[j] = pose[j]
+
+    def pack(self, j, angle):
+        """ Put joint j's compare value for angle into the packed registers
+        and return the mask of the slice it is on """
+        angle = 0 if angle < 0 else 180 if angle > 180 else angle
+        count = self.duty[j][angle]
+        channel = self.channel[j]
+        s = channel >> 1
+        if channel & 1:
+            self.cc[s] = self.cc[s] & 0xFFFF | count << 16
+        else:
+            self.cc[s] = self.cc[s] >> 16 << 16 | count
+        return 1 << s
+
+    def flush(self, slices):
+        """ Store the packed registers of the slices in the mask """
+        cc = self.cc
+        address = self.cc_address
+        while self.top - machine.mem32[self.ctr_address] < FLUSH_MARGIN:
+            pass
+        for s in range(SLICES):
+            if slices & (1 << s):
+                machine.mem32[address[s]] = cc[s]
+
+    def write(self, j, angle):
+        """ Write one joint straight away """
+        self.flush(self.pack(j, angle))
+
+    def recalibrate(self, j):
+        """ Rebuild joint j's duty table after its calibration changed; forget()
+        the joint to have it written again """
+        self.duty[j] = duty_table(j, self.top)
+
+    def commit(self):
+        angles = self.angles
+        pending = self._pending
+        duty = self.duty
+        channels = self.channel
+        cc = self.cc
+        slices = 0
+        for j in range(JOINTS):
+            angle = pending[j]
+            if angle == angles[j]:
+                if angle != KEEP:
+                    self.skipped += 1
+                continue
+            angles[j] = angle
+            # pack(), without a call per joint
+            angle = 0 if angle < 0 else 180 if angle > 180 else angle
+            count = duty[j][angle]
+            channel = channels[j]
+            s = channel >> 1
+            if channel & 1:
+                cc[s] = cc[s] & 0xFFFF | count << 16
+            else:
+                cc[s] = cc[s] >> 16 << 16 | count
+            slices |= 1 << s
+            self.writes += 1
+        if slices:
+            self.flush(slices)
+
+
+hand = Hand(JOINT_PINS)
 
 delay_ms = 20
 
+# Single byte commands sent by the remote
+CMD_CROUCH = const(0x72)         # r
+CMD_GET_UP = const(0x62)         # b
+CMD_FINGER_STAMP = const(0x67)   # g
+CMD_POINT_FINGER = const(0x79)   # y
+CMD_BOW_DOWN = const(0x77)       # w
+CMD_RISE_UP = const(0x6B)        # k
+CMD_WALK_FORWARD = const(0x78)   # x
+CMD_WALK_BACKWARD = const(0x7A)  # z
+CMD_STAND_WALK = const(0x76)     # v
+CMD_IDLE = const(0x21)           # !
+# Recordings bound to a button, CMD_PLAYBACK + button bit; never sent by a remote
+CMD_PLAYBACK = const(0x100)
+
+# Input frames from the remote. Legacy remotes send the single byte
+# commands above; a frame starts with a byte that has the top bit set.
+#   0  header, 0x80 | FRAME_VERSION
+#   1  sequence number
+#   2  button mask, bit 0 green, red, blue, yellow, white, bit 5 black;
+#      bits 6 and 7 hold the link profile chosen on the remote
+#   3  left thumbstick 1, signed -127..127 (crouch walk)
+#   4  left thumbstick 2
+#   5  right thumbstick 1 (stand walk)
+FRAME_VERSION = 1
+FRAME_LEN = 6
+FRAME_BUTTONS = 2
+FRAME_AXES = 3
+BUTTON_MASK = 0x3F
+PROFILE_SHIFT = 6
+PROFILE_COMBO = const(0x30)  # white | black, switches the profile on the remote
+
+# Command for each button, in mask bit order
+BUTTON_COMMANDS = (CMD_FINGER_STAMP, CMD_CROUCH, CMD_GET_UP, CMD_POINT_FINGER, CMD_BOW_DOWN, CMD_RISE_UP)
+
+# How far a stick has to be pushed to walk, out of 127
+AXIS_THRESHOLD = 28
+
+# Latest thumbstick positions, -127..127
+axes = array('b', (0, 0, 0))
+
+# Dispatch policies
+QUEUE = const(0)    # Run after the current gesture; a newer command replaces it
+PREEMPT = const(1)  # Cancel the current gesture and run straight away
+HOLD = const(2)     # Walks: run while the stick is held, dropped if already running
+STOP = const(3)     # Stop a held walk; no gesture of its own
+
+# Gesture and policy for every command byte, so dispatching a command is
+# one index whatever it is. Gestures are filled in at the end of the file,
+# once they are all defined; bytes that map to nothing stay None.
+COMMAND_GESTURES = [None] * 256
+COMMAND_POLICY = bytearray(256)  # QUEUE unless set below
+COMMAND_POLICY[CMD_CROUCH] = PREEMPT
+COMMAND_POLICY[CMD_IDLE] = STOP
+COMMAND_POLICY[CMD_WALK_FORWARD] = HOLD
+COMMAND_POLICY[CMD_WALK_BACKWARD] = HOLD
+COMMAND_POLICY[CMD_STAND_WALK] = HOLD
+
+
+def command_policy(command):
+    return COMMAND_POLICY[command] if command < CMD_PLAYBACK else QUEUE
+
+# A held walk stops if the remote goes quiet for this long, for remotes that
+# never send a release
+HOLD_TIMEOUT_MS = 1000
+
+
+class Dispatcher:
+    """ Decides what happens to each command from the remote. At most one
+    gesture runs and at most one command waits behind it. A held walk gives
+    way to any other command. """
+
+    def __init__(self):
+        self.task = None
+        self.running = None
+        self.running_gesture = None
+        self.running_policy = QUEUE
+        self.pending = None
+        self.held = None
+        self.held_ms = 0
+        self._generation = 0
+
+    def submit(self, command):
+        gesture = lookup_gesture(command)
+        policy = command_policy(command)
+        if policy == STOP:
+            self.held = None
+            if self.running_policy == HOLD:
+                self.cancel()
+            if self.pending is not None and command_policy(self.pending) == HOLD:
+                self.pending = None
+            return
+        if gesture is None:
+            return
+        if policy == HOLD:
+            self.held = command
+            self.held_ms = time.ticks_ms()
+        if self.running is None:
+            self._start(command, gesture, policy)
+        elif gesture is self.running_gesture:
+            # Same gesture requested again while it is still moving; a walk
+            # picks up a change of direction from held
+            pass
+        elif policy == PREEMPT or self.running_policy == HOLD:
+            self.pending = None
+            self.cancel()
+            self._start(command, gesture, policy)
+        else:
+            self.pending = command
+
+    def holding(self, command):
+        """ True while the remote keeps asking for the held command """
+        return self.held == command and \
+            time.ticks_diff(time.ticks_ms(), self.held_ms) < HOLD_TIMEOUT_MS
+
+    def cancel(self):
+        """ Cancel the running gesture, if any """
+        if self.task is not None:
+            self.task.cancel()
+        self._generation += 1
+        self.task = None
+        self.running = None
+        self.running_gesture = None
+        self.running_policy = QUEUE
+
+    def stop(self):
+        """ Cancel everything, e.g. when the remote goes away """
+        self.pending = None
+        self.held = None
+        self.cancel()
+
+    def _start(self, command, gesture, policy):
+        self._generation += 1
+        self.running = command
+        self.running_gesture = gesture
+        self.running_policy = policy
+        self.task = asyncio.create_task(self._run(gesture, self._generation))
+
+    async def _run(self, gesture, generation):
+        try:
+            await run_gesture(gesture)
+        finally:
+            if generation == self._generation:
+                self.task = None
+                self.running = None
+                self.running_gesture = None
+                self.running_policy = QUEUE
+                if self.pending is not None:
+                    command = self.pending
+                    self.pending = None
+                    self.submit(command)
+
+
+dispatcher = Dispatcher()
+
+# Longest time the event loop went without a tick during the current gesture
+STALL_MONITOR_MS = 5
+max_stall_ms = 0
+
 
 async def find_remote():
-    # Scan for 5 seconds, in active mode, with very low interval/window (to
-    # maximise detection rate).
-    async with aioble.scan(5000, interval_us=30000, window_us=30000, active=True) as scanner:
+    # Scan for 5 seconds, in active mode, with the interval/window of the
+    # current link profile.
+    scan_interval, scan_window, _, _ = LINK_PROFILES[link_profile]
+    async with aioble.scan(5000, interval_us=scan_interval, window_us=scan_window, active=True) as scanner:
         async for result in scanner:
 
             # See if it matches our name
@@ -93,962 +485,1912 @@ async def blink_task():
     
     toggle = True
     
-    while True and alive:
+    while True:
+        t0 = time.ticks_us()
         led.value(toggle)
         toggle = not toggle
-        # print(f'blink {toggle}, connected: {connected}')
+        stats.tick(TASK_BLINK, t0)
         if connected:
             blink = 1000
         else:
             blink = 250
         await asyncio.sleep_ms(blink)
 
-async def peripheral_task():
-    print('starting peripheral task')
-    global connected
-    connected = False
+# Live calibration. Holding green and black together on the remote enters
+# and leaves calibration mode; leaving saves the record to flash. In the mode
+# the hand holds its neutral pose and the buttons edit one joint at a time:
+CAL_COMBO = const(0x21)  # green | black
+CAL_NEXT_JOINT = const(0x01)  # green
+CAL_NEXT_FIELD = const(0x02)  # red
+CAL_UP = const(0x04)          # blue
+CAL_DOWN = const(0x08)        # yellow
+CAL_REVERT = const(0x10)      # white, reload the record from flash
+CAL_FIELD_NAMES = ("neutral", "low", "high", "reversed", "trim")
+
+calibrating = False
+cal_joint = 0
+cal_field = CAL_NEUTRAL
+
+
+_cal_pose = array('h', NEUTRAL)
+
+
+def show_calibration():
+    """ Hold the neutral pose, with the selected joint showing its field """
+    for j in range(JOINTS):
+        _cal_pose[j] = NEUTRAL[j]
+    if cal_field == CAL_LOW:
+        _cal_pose[cal_joint] = 0
+    elif cal_field == CAL_HIGH:
+        _cal_pose[cal_joint] = 180
+    elif cal_field == CAL_REVERSED:
+        _cal_pose[cal_joint] = NEUTRAL[cal_joint] + 20
+    start_move(_cal_pose, 0, STEP)
+    value = cal(cal_field, cal_joint)
+    if cal_field == CAL_TRIM:
+        value -= CAL_TRIM_BIAS
+    print("calibrate joint", cal_joint, CAL_FIELD_NAMES[cal_field], value)
+
+
+def toggle_calibration():
+    global calibrating, cal_joint, cal_field
+    calibrating = not calibrating
+    dispatcher.stop()
+    if calibrating:
+        cal_joint = 0
+        cal_field = CAL_NEUTRAL
+        show_calibration()
+    else:
+        save_calibration()
+        print("calibration saved")
+
+
+def calibrate_buttons(pressed):
+    """ Apply newly pressed buttons to the calibration being edited """
+    global cal_joint, cal_field
+    if pressed & CAL_NEXT_JOINT:
+        cal_joint = (cal_joint + 1) % JOINTS
+    if pressed & CAL_NEXT_FIELD:
+        cal_field = (cal_field + 1) % CAL_FIELDS
+    step = (1 if pressed & CAL_UP else 0) - (1 if pressed & CAL_DOWN else 0)
+    if step:
+        limit = 1 if cal_field == CAL_REVERSED else 255 if cal_field == CAL_TRIM else 180
+        set_cal(cal_field, cal_joint, min(max(cal(cal_field, cal_joint) + step, 0), limit))
+        hand.recalibrate(cal_joint)
+        forget(1 << cal_joint)
+    if pressed & CAL_REVERT:
+        load_calibration()
+        for j in range(JOINTS):
+            hand.recalibrate(j)
+        forget((1 << JOINTS) - 1)
+    if pressed:
+        show_calibration()
+
+_last_seq = -1
+_last_buttons = 0
+_modifier_used = False  # Another button went down while black was held
+
+def reset_decoder():
+    """ Forget the previous frame, e.g. when a remote (re)connects """
+    global _last_seq, _last_buttons, _modifier_used
+    _last_seq = -1
+    _last_buttons = 0
+    _modifier_used = False
+    for i in range(len(axes)):
+        axes[i] = 0
+
+def decode(data):
+    """ Submit the commands in a frame or a run of legacy command bytes """
+    global _last_seq, _last_buttons, _modifier_used
+    if not data:
+        return
+    if not data[0] & 0x80:
+        for command in data:
+            dispatcher.submit(command)
+        return
+    if data[0] != 0x80 | FRAME_VERSION or len(data) < FRAME_LEN:
+        if _DEBUG:
+            print("unknown frame", data[0])
+        return
+    if data[1] == _last_seq:
+        return
+    _last_seq = data[1]
+    profile = data[FRAME_BUTTONS] >> PROFILE_SHIFT
+    if profile != link_profile and profile < len(LINK_PROFILES):
+        change_profile(profile)
+    buttons = data[FRAME_BUTTONS] & BUTTON_MASK
+    pressed = buttons & ~_last_buttons
+    released = _last_buttons & ~buttons
+    _last_buttons = buttons
+    # Black is a modifier. Its own gesture runs when it is let go, and only
+    # if nothing else went down while it was held.
+    if pressed & RECORD_BUTTON:
+        _modifier_used = bool(buttons & ~RECORD_BUTTON)
+    elif buttons & RECORD_BUTTON and pressed:
+        _modifier_used = True
+    if buttons & CAL_COMBO == CAL_COMBO and pressed & CAL_COMBO:
+        toggle_calibration()
+        return
+    if buttons & PROFILE_COMBO == PROFILE_COMBO and pressed & PROFILE_COMBO:
+        # The remote is switching profile; neither button is a gesture here
+        dispatcher.stop()
+        return
+    if calibrating:
+        calibrate_buttons(pressed)
+        return
+    if buttons & RECORD_BUTTON and pressed & RECORD_SLOTS:
+        dispatcher.stop()
+        bit = 1
+        while not pressed & RECORD_SLOTS & (1 << bit):
+            bit += 1
+        toggle_recording(record_slot if record_slot >= 0 else bit)
+        return
+    tapped = pressed & ~RECORD_BUTTON
+    if released & RECORD_BUTTON and not _modifier_used and record_slot < 0:
+        tapped |= RECORD_BUTTON
+    for bit in range(len(BUTTON_COMMANDS)):
+        if tapped & (1 << bit):
+            if recorded & (1 << bit):
+                dispatcher.submit(CMD_PLAYBACK + bit)
+            else:
+                dispatcher.submit(BUTTON_COMMANDS[bit])
+    for i in range(len(axes)):
+        value = data[FRAME_AXES + i]
+        axes[i] = value - 256 if value > 127 else value
+    # Sticks are levels: keep asking for the walk while one is held
+    if axes[0] > AXIS_THRESHOLD:
+        dispatcher.submit(CMD_WALK_FORWARD)
+    elif axes[0] < -AXIS_THRESHOLD:
+        dispatcher.submit(CMD_WALK_BACKWARD)
+    elif axes[2] > AXIS_THRESHOLD:
+        dispatcher.submit(CMD_STAND_WALK)
+    elif not buttons:
+        dispatcher.submit(CMD_IDLE)
+
+async def receive_notifications(characteristic):
+    """ Queue every command the remote pushes to us """
+    while True:
+        data = await characteristic.notified()
+        t0 = time.ticks_us()
+        stats.notifies += 1
+        decode(data)
+        stats.tick(TASK_RECEIVE, t0)
+
+async def receive_polling(characteristic):
+    """ Fallback for when the remote can't notify; read the value every 10 ms """
+    print("Polling remote characteristic")
+    last = None
+    while True:
+        data = await characteristic.read()
+        t0 = time.ticks_us()
+        stats.reads += 1
+        if data != last:
+            last = data
+            decode(data)
+        stats.tick(TASK_RECEIVE, t0)
+        await asyncio.sleep_ms(10)
+
+# ---------- Connection supervisor -----------
+#
+# peripheral_task runs forever: find the remote, connect, discover its
+# characteristic, stream commands, and after any failure back off and start
+# over.
+#
+# REMOTE_FILE caches every remote we have talked to, keyed by the serial
+# number in its device info service, with its address and the GATT handles
+# discovery found. A reconnect goes straight to the last remote's address,
+# reads its serial and model number through the cached handles, and if
+# both still match skips service and characteristic discovery entirely.
+# The remote bumps its model number whenever its GATT layout changes.
+
+REMOTE_FILE = "remote.json"
+CONNECT_TIMEOUT_MS = 3000
+BACKOFF_MIN_MS = 100
+BACKOFF_MAX_MS = 5000
+
+# Link states
+STATE_SCAN = const(0)
+STATE_CONNECT = const(1)
+STATE_DISCOVER = const(2)
+STATE_STREAM = const(3)
+STATE_BACKOFF = const(4)
+
+link_state = STATE_SCAN
+link_connection = None
+link_switching = False  # A profile switch is waiting for the link to drop
+
+# Link profiles, selected on the remote: (scan interval us, scan window us,
+# min connection interval us, max connection interval us). The remote
+# advertises at the matching rate. Slave latency and supervision timeout
+# are left to the stack, as MicroPython's gap_connect can't set them.
+LINK_PROFILES = (
+    (30_000, 30_000, 7_500, 15_000),      # Low latency
+    (60_000, 30_000, 30_000, 50_000),     # Balanced
+    (100_000, 20_000, 100_000, 200_000),  # Battery saver
+)
+link_profile = 1
+
+
+def load_cache():
+    try:
+        with open(REMOTE_FILE) as f:
+            cache = json.load(f)
+        if "remotes" in cache:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"last": None, "remotes": {}, "profile": 1}
+
+
+def save_cache(cache):
+    try:
+        with open(REMOTE_FILE, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print("Could not save remote cache:", e)
+
+
+def forget_remote(cache):
+    """ Drop the last remote's cached handles so the next connect rediscovers """
+    cache["remotes"].pop(cache["last"], None)
+    cache["last"] = None
+    save_cache(cache)
+
+
+def handles(service, characteristic):
+    return [service._start_handle, service._end_handle, characteristic._end_handle,
+            characteristic._value_handle, characteristic.properties]
+
+
+def cached_characteristic(connection, service_uuid, uuid, handles):
+    """ Rebuild the objects aioble's discovery would have produced """
+    start, end, char_end, value, properties = handles
+    service = aioble.client.ClientService(connection, start, end, service_uuid)
+    return aioble.client.ClientCharacteristic(service, char_end, value, properties, uuid)
+
+
+async def read_text(characteristic):
+    stats.reads += 1
+    return (await characteristic.read()).decode()
+
+
+def change_profile(profile):
+    """ Switch link profile and reconnect so the new connection interval
+    applies. Every frame carries the profile until the link drops, so only
+    the first one on a link switches. """
+    global link_profile, link_switching
+    if link_switching:
+        return
+    link_switching = True
+    print("Link profile", profile)
+    link_profile = profile
+    cache = load_cache()
+    cache["profile"] = profile
+    save_cache(cache)
+    if link_connection:
+        asyncio.create_task(link_connection.disconnect())
+
+
+async def connect(device):
+    _, _, min_interval, max_interval = LINK_PROFILES[link_profile]
+    return await device.connect(timeout_ms=CONNECT_TIMEOUT_MS,
+                                min_conn_interval_us=min_interval,
+                                max_conn_interval_us=max_interval)
+
+
+async def connect_remote(remote):
+    """ Connect to the remembered remote, or scan for one """
+    global link_state
+    if remote:
+        link_state = STATE_CONNECT
+        device = aioble.Device(remote["addr_type"], bytes(remote["addr"]))
+        try:
+            print("Connecting to known remote", device)
+            return await connect(device), True
+        except (asyncio.TimeoutError, OSError):
+            print("Known remote not answering, scanning")
+    link_state = STATE_SCAN
     device = await find_remote()
     if not device:
         print("Robot Remote not found")
-        return
+        return None, False
+    link_state = STATE_CONNECT
+    print("Connecting to", device)
+    return await connect(device), False
+
+
+async def cached_discovery(connection, serial, remote):
+    """ The control characteristic from the cache, or None if the cached
+    handles don't belong to this remote any more """
     try:
-        print("Connecting to", device)
-        connection = await device.connect()
-        
-    except asyncio.TimeoutError:
-        print("Timeout during connection")
-        return
-      
-    async with connection:
-        print("Connected")
-        connected = True
-        alive = True
-        while True and alive:
-            try:
-                robot_service = await connection.service(_REMOTE_UUID)
-                print(robot_service)
-                control_characteristic = await robot_service.characteristic(_REMOTE_CHARACTERISTICS_UUID)
-                print(control_characteristic)
-            except asyncio.TimeoutError:
-                print("Timeout discovering services/characteristics")
-                return
-            while True:
-                if control_characteristic != None:
-                    try:
-                        command = await control_characteristic.read()
-                        if command == b'r':
-                            print("a button pressed")
-                            crouch_pos()
-                        if command == b'b':
-                            print("b button pressed")
-                            get_up()
-                        if command == b'g':
-                            print("x button pressed")
-                            finger_stamp()
-                        if command == b'y':
-                            print("y button pressed")
-                            point_finger()
-                        if command == b'w':
-                            print("y button pressed")
-                            bow_down()
-                        if command == b'k':
-                            print("y button pressed")
-                            rise_up()
-                        if command == b'x':
-                            print("y button pressed")
-                            crouch_walk_forward()
-                        if command == b'z':
-                            print("y button pressed")
-                            crouch_walk_backward()
-                        if command == b'v':
-                            print("y button pressed")
-                            stand_walk()
-                    except TypeError:
-                        print(f'something went wrong; remote disconnected?')
-                        connected = False
-                        alive = False
-                        return
-                    except asyncio.TimeoutError:
-                        print(f'something went wrong; timeout error?')
-                        connected = False
-                        alive = False
-                        return
-                    except asyncio.GattError:
-                        print(f'something went wrong; Gatt error - did the remote die?')
-                        connected = False
-                        alive = False
-                        return
-                else:
-                    print('no characteristic')
-                await asyncio.sleep_ms(10)
+        info_serial = cached_characteristic(connection, _DEVICE_INFO_UUID,
+                                            _SERIAL_NUMBER_UUID, remote["serial"])
+        if await read_text(info_serial) != serial:
+            print("Different remote at this address")
+            return None
+        info_model = cached_characteristic(connection, _DEVICE_INFO_UUID,
+                                           _MODEL_NUMBER_UUID, remote["model"])
+        if await read_text(info_model) != remote["version"]:
+            print("Remote firmware changed, rediscovering")
+            return None
+    except aioble.GattError:
+        return None
+    return cached_characteristic(connection, _REMOTE_UUID,
+                                 _REMOTE_CHARACTERISTICS_UUID, remote["control"])
+
+
+async def full_discovery(connection, cache):
+    """ Discover the control characteristic and cache its handles """
+    robot_service = await connection.service(_REMOTE_UUID)
+    print(robot_service)
+    if robot_service is None:
+        return None
+    control_characteristic = await robot_service.characteristic(_REMOTE_CHARACTERISTICS_UUID)
+    print(control_characteristic)
+    if control_characteristic is None:
+        return None
+    info = await connection.service(_DEVICE_INFO_UUID)
+    if info is None:
+        return control_characteristic
+    info_serial = await info.characteristic(_SERIAL_NUMBER_UUID)
+    info_model = await info.characteristic(_MODEL_NUMBER_UUID)
+    if info_serial is None or info_model is None:
+        return control_characteristic
+    serial = await read_text(info_serial)
+    device = connection.device
+    cache["last"] = serial
+    cache["remotes"][serial] = {
+        "addr_type": device.addr_type,
+        "addr": list(device.addr),
+        "version": await read_text(info_model),
+        "control": handles(robot_service, control_characteristic),
+        "serial": handles(info, info_serial),
+        "model": handles(info, info_model),
+    }
+    save_cache(cache)
+    return control_characteristic
+
+
+async def stream(characteristic):
+    """ Feed commands from the remote to the dispatcher until the link drops """
+    try:
+        await characteristic.subscribe(notify=True)
+        print("Subscribed to remote notifications")
+        receive = receive_notifications
+    except (ValueError, aioble.GattError) as e:
+        print("Could not subscribe to remote:", e)
+        receive = receive_polling
+    await receive(characteristic)
+
+
+async def peripheral_task():
+    print('starting peripheral task')
+    global connected, link_state, link_connection, link_profile, link_switching
+    backoff = BACKOFF_MIN_MS
+    while True:
+        connected = False
+        link_switching = False
+        cache = load_cache()
+        link_profile = cache.get("profile", 1)
+        serial = cache["last"]
+        remote = cache["remotes"].get(serial)
+        known = False
+        try:
+            connection, known = await connect_remote(remote)
+            if connection:
+                link_connection = connection
+                async with connection:
+                    print("Connected")
+                    link_state = STATE_DISCOVER
+                    characteristic = None
+                    if known:
+                        characteristic = await cached_discovery(connection, serial, remote)
+                    if characteristic is None:
+                        known = False
+                        characteristic = await full_discovery(connection, cache)
+                    if characteristic is None:
+                        print('no characteristic')
+                    else:
+                        link_state = STATE_STREAM
+                        connected = True
+                        reset_decoder()
+                        backoff = BACKOFF_MIN_MS
+                        await stream(characteristic)
+        except TypeError:
+            print(f'something went wrong; remote disconnected?')
+        except asyncio.TimeoutError:
+            print(f'something went wrong; timeout error?')
+        except aioble.GattError:
+            print(f'something went wrong; Gatt error - did the remote die?')
+            if known:
+                # The cached handles may be stale; rediscover next time
+                forget_remote(cache)
+        except aioble.DeviceDisconnectedError:
+            print(f'remote disconnected')
+        except Exception as e:
+            # Anything else (an OSError from the stack, a bug in decoding)
+            # must not end the supervisor: log it, back off and start over
+            print('something went wrong;', repr(e))
+        connected = False
+        link_connection = None
+        dispatcher.stop()
+        link_state = STATE_BACKOFF
+        await asyncio.sleep_ms(backoff)
+        backoff = min(backoff * 2, BACKOFF_MAX_MS)
+
+def lookup_gesture(command):
+    """ Return the gesture mapped to a command byte from the remote """
+    if command >= CMD_PLAYBACK:
+        return PLAYBACKS[command - CMD_PLAYBACK]
+    return COMMAND_GESTURES[command]
+
+async def run_gesture(gesture):
+    """ Run one gesture and report how long the event loop was held up """
+    global max_stall_ms
+    max_stall_ms = 0
+    start = time.ticks_ms()
+    try:
+        await gesture()
+    except asyncio.CancelledError:
+        if _DEBUG:
+            print("gesture cancelled")
+        raise
+    finally:
+        if _DEBUG:
+            print("gesture took", time.ticks_diff(time.ticks_ms(), start),
+                  "ms, max loop stall", max_stall_ms, "ms")
+
+async def stall_monitor_task():
+    """ Track the longest gap between scheduler ticks """
+    global max_stall_ms
+    last = time.ticks_ms()
+    while True:
+        await asyncio.sleep_ms(STALL_MONITOR_MS)
+        t0 = time.ticks_us()
+        now = time.ticks_ms()
+        stall = time.ticks_diff(now, last) - STALL_MONITOR_MS
+        if stall > max_stall_ms:
+            max_stall_ms = stall
+        last = now
+        stats.tick(TASK_STALL, t0)
+
+# ---------- Diagnostics -----------
+#
+# Loops count their iterations in stats, and every diagnostics.PERIOD_MS
+# the counters become a record that the diagnostics characteristic serves
+# (see diagnostics.py for the layout). The robot is the remote's central,
+# so diag_advertise_task advertises it as DIAG_NAME alongside the link for
+# a phone or a laptop to connect and read the record.
+
+TASK_MOTION = const(0)
+TASK_STALL = const(1)
+TASK_RECEIVE = const(2)
+TASK_RECORD = const(3)
+TASK_BLINK = const(4)
+
+stats = diagnostics.Stats(("motion", "stall", "receive", "record", "blink"))
+
+diag_service = aioble.Service(_DIAG_UUID)
+diag_characteristic = aioble.Characteristic(diag_service, _DIAG_STATS_UUID, read=True)
+aioble.register_services(diag_service)
+
+DIAG_NAME = "TheThingRobot"
+DIAG_ADV_INTERVAL_US = 500_000  # Nothing waits on this connection
+
+
+async def diagnostics_task():
+    last_writes = hand.writes
+    while True:
+        await asyncio.sleep_ms(diagnostics.PERIOD_MS)
+        stats.servo_writes = hand.writes - last_writes
+        last_writes = hand.writes
+        record = stats.snapshot()
+        diag_characteristic.write(record)
+        if _DEBUG:
+            print(stats.report(record))
+
+
+async def diag_advertise_task():
+    while True:
+        try:
+            async with await aioble.advertise(
+                DIAG_ADV_INTERVAL_US,
+                name=DIAG_NAME,
+                services=[_DIAG_UUID]
+            ) as connection:
+                print("diagnostics connection from", connection.device)
+                await connection.disconnected(timeout_ms=None)
+        except Exception as e:
+            # The stack may refuse to advertise while it connects to the
+            # remote; that must not take the link down with it
+            print('diagnostics advertising failed;', repr(e))
+            await asyncio.sleep_ms(BACKOFF_MAX_MS)
+
+# ---------- Garbage collection -----------
+#
+# A collection stops everything for a few ms, and MicroPython runs one
+# whenever an allocation finds the heap full, which is as likely to be in
+# the middle of a gesture as anywhere. gc_task collects in the idle windows
+# between gestures instead: nothing running or moving for GC_IDLE_MS. The
+# threshold is a backstop that collects automatically once GC_RESERVE is
+# all that is left, in case the hand never goes idle (a walk held for
+# minutes); gestures allocate little enough that it is seldom reached.
+# gc.mem_alloc() walks the heap's allocation table under the GC lock,
+# nearly as long as a small collection, so it is only read once the hand
+# has gone idle, and then at most every GC_CHECK_MS while it stays idle.
+
+GC_POLL_MS = 50
+GC_IDLE_MS = 200
+GC_CHECK_MS = 1000
+GC_MIN_ALLOC = 1024  # Not worth a collection below this
+GC_RESERVE = 16384
+
+
+def hand_idle():
+    return dispatcher.running is None and not busy_channels()
+
+
+async def gc_task():
+    gc.collect()
+    gc.threshold(max(gc.mem_free() - GC_RESERVE, GC_MIN_ALLOC))
+    base = gc.mem_alloc()
+    idle_since = time.ticks_ms()
+    checked = None  # ticks_ms of the last heap check in this idle window
+    while True:
+        await asyncio.sleep_ms(GC_POLL_MS)
+        now = time.ticks_ms()
+        if not hand_idle():
+            idle_since = now
+            checked = None
+            continue
+        if time.ticks_diff(now, idle_since) < GC_IDLE_MS:
+            continue
+        if checked is not None and time.ticks_diff(now, checked) < GC_CHECK_MS:
+            continue
+        checked = now
+        if gc.mem_alloc() - base >= GC_MIN_ALLOC:
+            t0 = time.ticks_us()
+            gc.collect()
+            used = time.ticks_diff(time.ticks_us(), t0)
+            stats.idle_gcs += 1
+            if used > stats.gc_max_us:
+                stats.gc_max_us = used
+            base = gc.mem_alloc()
+
 
 async def main():
+    start_motion_core()
     tasks = []
     tasks = [
         asyncio.create_task(blink_task()),
         asyncio.create_task(peripheral_task()),
+        asyncio.create_task(stall_monitor_task()),
+        asyncio.create_task(record_task()),
+        asyncio.create_task(diagnostics_task()),
+        asyncio.create_task(diag_advertise_task()),
+        asyncio.create_task(gc_task()),
     ]
     await asyncio.gather(*tasks)
 
-def wrist_led_seq():
+async def wrist_led_seq():
     wrist_led.value(0)
-    time.sleep(2)
+    await asyncio.sleep(2)
     wrist_led.value(0)
     for i in range (3):
         wrist_led.value(1)
-        time.sleep(0.1)
+        await asyncio.sleep(0.1)
         wrist_led.value(0)
-        time.sleep(0.1)
+        await asyncio.sleep(0.1)
     wrist_led.value(1)
 
-def straight_fingers():
-    i_b.write(76)
-    i_m.write(15)
-    i_t.write(55)
-
-    m_b.write(87)
-    m_m.write(44)
-    m_t.write(58)
-
-    r_b.write(85)
-    r_m.write(35)
-    r_t.write(60)
-
-    p_b.write(88)
-    p_m.write(45)
-    p_t.write(45)
-    
-    t_b.write(88)
-    t_m.write(48)
-    t_t.write(78)
-    
-    time.sleep(1)
+# ---------- Keyframe gestures -----------
+#
+# A gesture is a table of frames. Each frame holds one offset per joint,
+# relative to the joint's neutral (straight finger) angle, a duration in ms
+# and an easing. STEP frames jump straight to the pose and then wait for the
+# duration; the other easings move there over the duration on the motion
+# tick. Joints set to KEEP are not moved in that frame.
+
+# Easings
+STEP = const(0)
+LINEAR = const(1)
+EASE_IN_OUT = const(2)
+MIN_JERK = const(3)
+
+# Finger offsets (base, middle, tip) shared by many gestures
+STRAIGHT = (0, 0, 0)
+CROUCH = (-12, 104, -2)
+GRIP = (-4, 125, -32)
+LIFT = (-63, 138, 15)
+STAND = (59, 60, -29)
+COUNT = (60, 30, 10)
+
+
+def keyframes(*frames):
+    """ Pack frames of (ms, index, middle, ring, pinky, thumb, wrist) into a gesture.
+    ms may be a (ms, easing) pair; a bare ms is a STEP frame. Fingers left out
+    or None are kept where they are; the wrist is a single offset. """
+    table = array('h')
+    durations = array('H')
+    easings = bytearray()
+    for frame in frames:
+        if isinstance(frame[0], tuple):
+            durations.append(frame[0][0])
+            easings.append(frame[0][1])
+        else:
+            durations.append(frame[0])
+            easings.append(STEP)
+        for f in range(1, 6):
+            finger = frame[f] if f < len(frame) else None
+            # One at a time: MicroPython's array.extend() only takes buffers
+            for value in finger or (KEEP, KEEP, KEEP):
+                table.append(value)
+        table.append(frame[6] if len(frame) > 6 and frame[6] is not None else KEEP)
+    return table, durations, easings
+
+
+_pose = array('h', NEUTRAL)
+
+async def play(gesture, durations=None, repeat=1):
+    """ Play a keyframe gesture. durations overrides the table's frame times. """
+    table, frame_ms, easings = gesture
+    if durations is None:
+        durations = frame_ms
+    for _ in range(repeat):
+        offset = 0
+        for f in range(len(durations)):
+            for j in range(JOINTS):
+                value = table[offset + j]
+                _pose[j] = KEEP if value == KEEP else NEUTRAL[j] + value
+            offset += JOINTS
+            await move_to(_pose, durations[f], easings[f])
+
+# ---------- Motion -----------
+#
+# Interpolated moves run on the RP2040's second core, so servo timing holds
+# steady whatever the radio and the event loop on core 0 are doing. Core 0
+# decides what the hand should do and passes every move, down to the single
+# poses of a walk, through motion_queue; motion_core on core 1 takes them
+# off within a ms and owns the hand: it interpolates and writes every joint
+# once per servo PWM frame. Progress comes from the clock, so a move takes
+# the same time however late core 1 gets to it.
+#
+# Each finger and the wrist is a channel with its own move, so moves on
+# different channels overlap, started together or one after another; a move
+# only takes over the channels its pose touches. Every joint belongs to one
+# channel, so a tick costs at most one update per joint and one easing per
+# channel however many channels are moving.
+#
+# The cores share no locks. motion_queue has one writer per index, and every
+# move carries a sequence number: core 0 records it per channel in
+# _channel_issued as it queues the move, core 1 copies it to _channel_done
+# once the move is over, and a channel is busy while the two differ. Core 1
+# allocates nothing, so it never waits on a garbage collection (and stays
+# off the heap lock; stats.tick only reads the clock).
+# Flash writes from core 0 pause it briefly; MicroPython does that itself.
+# Core 0 never waits for room in the queue, as that would stall the event
+# loop: start_move returns QUEUE_FULL and the gestures sleep a poll and try
+# again, while the streamed walk and recordings drop the pose. halt() and
+# forget() can use the MOTION_SPARE records moves leave free.
+
+TICK_MS = const(20)  # 50 Hz, one servo PWM frame
+TICK_BUDGET_US = 2000  # Ticks that take longer are counted in stats.overruns
+POLL_MS = const(1)  # How often core 1 looks at the queue
+
+CHANNELS = 6  # index, middle, ring, pinky, thumb, wrist
+CHANNEL_OF = bytes((0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 5))
+
+
+class Ring:
+    """ Lock free queue of fixed size int records between one producer and
+    one consumer. The producer fills in the record at reserve() and then
+    push()es it; the consumer reads the record at peek() and then pop()s it.
+    head is only written by the producer and tail by the consumer, each as
+    one word, and they count to twice the size so full and empty differ. """
+
+    def __init__(self, records, width):
+        self.records = records
+        self.width = width
+        self.buf = array('i', [0] * (records * width))
+        self.index = array('i', (0, 0))  # head, tail
+
+    def count(self):
+        return (self.index[0] - self.index[1]) % (2 * self.records)
+
+    def reserve(self, spare=0):
+        """ Offset of the next free record, -1 if no more than spare records
+        are free """
+        head = self.index[0]
+        if (head - self.index[1]) % (2 * self.records) >= self.records - spare:
+            return -1
+        return head % self.records * self.width
+
+    def push(self):
+        self.index[0] = (self.index[0] + 1) % (2 * self.records)
+
+    def peek(self):
+        """ Offset of the oldest record, -1 if the queue is empty """
+        tail = self.index[1]
+        if tail == self.index[0]:
+            return -1
+        return tail % self.records * self.width
+
+    def pop(self):
+        self.index[1] = (self.index[1] + 1) % (2 * self.records)
+
+
+# Move records: what to do, its sequence number, the channels (or for
+# MQ_FORGET the joints) it applies to, then for MQ_MOVE the move
+MQ_MOVE = const(0)    # Move to pose over ms
+MQ_HALT = const(1)    # Stop the channels where they are
+MQ_FORGET = const(2)  # Forget the joints' last angles, so they are written again
+MQ_KIND = const(0)
+MQ_SEQ = const(1)
+MQ_MASK = const(2)
+MQ_MS = const(3)
+MQ_EASING = const(4)
+MQ_POSE = const(5)
+MQ_WIDTH = MQ_POSE + JOINTS
+MOTION_QUEUE = 16
+MOTION_SPARE = 4  # Records moves leave free, so halt() and forget() get in
+QUEUE_FULL = const(-1)
+
+SEQ_MASK = const(0x3FFFFFFF)
+
+motion_queue = Ring(MOTION_QUEUE, MQ_WIDTH)
+_move_seq = 0
+_channel_issued = array('i', [0] * CHANNELS)  # Written by core 0 only
+_channel_done = array('i', [0] * CHANNELS)    # Written by core 1 only
+
+# Core 1's own
+_start = array('h', NEUTRAL)
+_target = array('h', NEUTRAL)
+_channel_seq = array('i', [0] * CHANNELS)
+_channel_t0 = array('i', [0] * CHANNELS)
+_channel_ms = array('i', [0] * CHANNELS)
+_channel_easing = bytearray(CHANNELS)
+_channel_k = array('i', [0] * CHANNELS)  # Eased fraction of the move, out of EASE_ONE
+_moving = 0  # Mask of the channels core 1 is stepping
+motion_core_started = False
+
+
+# Motion runs in fixed point: every float is a heap object on the Pico, and
+# a tick allocating a few dozen of them brings on a collection mid gesture.
+# Fractions are out of EASE_ONE, and every product stays a small int.
+EASE_BITS = const(12)
+EASE_ONE = const(4096)
+EASE_HALF = const(2048)
+
+
+def ease(easing, u):
+    """ Map move progress u (0..EASE_ONE) to the fraction of the distance
+    covered, also out of EASE_ONE """
+    if easing == LINEAR:
+        return u
+    u2 = u * u >> EASE_BITS
+    if easing == EASE_IN_OUT:
+        return u2 * (3 * EASE_ONE - 2 * u) >> EASE_BITS
+    # Minimum jerk
+    u3 = u2 * u >> EASE_BITS
+    return u3 * (10 * EASE_ONE + (u * (6 * u - 15 * EASE_ONE) >> EASE_BITS)) >> EASE_BITS
+
+
+def busy_channels():
+    """ Mask of the channels whose last move hasn't finished yet """
+    busy = 0
+    for c in range(CHANNELS):
+        if _channel_done[c] != _channel_issued[c]:
+            busy |= 1 << c
+    return busy
+
+
+def _queue(kind, mask, channels, spare):
+    """ Fill in and return the next record, to be pushed with
+    motion_queue.push(); QUEUE_FULL if no more than spare records are free.
+    Never waits: this runs on core 0, and sleeping here would stop the
+    event loop, the radio with it, for as long as core 1 is behind. """
+    global _move_seq
+    base = motion_queue.reserve(spare)
+    if base < 0:
+        return QUEUE_FULL
+    _move_seq = (_move_seq + 1) & SEQ_MASK
+    buf = motion_queue.buf
+    buf[base + MQ_KIND] = kind
+    buf[base + MQ_SEQ] = _move_seq
+    buf[base + MQ_MASK] = mask
+    for c in range(CHANNELS):
+        if channels & (1 << c):
+            _channel_issued[c] = _move_seq
+    return base
+
+
+def start_move(pose, ms, easing):
+    """ Queue a move for the motion core. STEP moves and moves shorter than a
+    tick are written as soon as it takes them. Returns the mask of channels
+    the move takes, 0 if none, or QUEUE_FULL if motion_queue has no room;
+    core 1 empties it every POLL_MS, so try again after that. """
+    channels = 0
+    for j in range(JOINTS):
+        if pose[j] != KEEP:
+            channels |= 1 << CHANNEL_OF[j]
+    if not channels:
+        return 0
+    base = _queue(MQ_MOVE, channels, channels, MOTION_SPARE)
+    if base < 0:
+        return QUEUE_FULL
+    buf = motion_queue.buf
+    buf[base + MQ_MS] = ms
+    buf[base + MQ_EASING] = easing
+    base += MQ_POSE
+    for j in range(JOINTS):
+        buf[base + j] = pose[j]
+    motion_queue.push()
+    return channels
+
+
+def halt(channels):
+    """ Stop the channels' moves where they are. Uses the spare records, so
+    it only fails to get in if core 1 has stopped taking them. """
+    if channels > 0 and _queue(MQ_HALT, channels, channels, 0) >= 0:
+        motion_queue.push()
+
+
+def forget(joints):
+    """ Have the joints in the mask written on their next move even if their
+    angle is the same, e.g. after recalibrating them """
+    if _queue(MQ_FORGET, joints, 0, 0) >= 0:
+        motion_queue.push()
+
+
+async def move_to(pose, ms, easing=MIN_JERK):
+    """ Move the joints to the angles in pose over ms; KEEP joints stay put """
+    channels = start_move(pose, ms, easing)
+    try:
+        while channels == QUEUE_FULL:
+            await asyncio.sleep_ms(POLL_MS)
+            channels = start_move(pose, ms, easing)
+        if ms:
+            await asyncio.sleep_ms(ms)
+        # Polling keeps the wait free of allocations
+        while busy_channels() & channels:
+            await asyncio.sleep_ms(POLL_MS)
+    except asyncio.CancelledError:
+        halt(channels)
+        raise
+
+
+def _take(base):
+    """ Core 1: act on the record at base """
+    global _moving
+    buf = motion_queue.buf
+    kind = buf[base + MQ_KIND]
+    seq = buf[base + MQ_SEQ]
+    mask = buf[base + MQ_MASK]
+    if kind == MQ_FORGET:
+        for j in range(JOINTS):
+            if mask & (1 << j):
+                hand.angles[j] = KEEP
+        return
+    _moving &= ~mask
+    ms = buf[base + MQ_MS]
+    easing = buf[base + MQ_EASING]
+    if kind == MQ_MOVE and (easing == STEP or ms < TICK_MS):
+        for j in range(JOINTS):
+            angle = buf[base + MQ_POSE + j]
+            if angle != KEEP:
+                hand.set(j, angle)
+        hand.commit()
+    elif kind == MQ_MOVE:
+        angles = hand.angles
+        now = time.ticks_ms()
+        for j in range(JOINTS):
+            if mask & (1 << CHANNEL_OF[j]):
+                angle = buf[base + MQ_POSE + j]
+                # A joint that was never written has no known start; it jumps
+                _target[j] = angles[j] if angle == KEEP else angle
+                _start[j] = _target[j] if angles[j] == KEEP else angles[j]
+        for c in range(CHANNELS):
+            if mask & (1 << c):
+                _channel_seq[c] = seq
+                _channel_t0[c] = now
+                _channel_ms[c] = ms
+                _channel_easing[c] = easing
+        _moving |= mask
+        return
+    for c in range(CHANNELS):
+        if mask & (1 << c):
+            _channel_done[c] = seq
+
+
+def motion_tick(now):
+    """ Core 1: step every moving channel towards its target """
+    global _moving
+    busy = _moving
+    finished = 0
+    for c in range(CHANNELS):
+        if busy & (1 << c):
+            elapsed = time.ticks_diff(now, _channel_t0[c])
+            ms = _channel_ms[c]
+            if elapsed >= ms:
+                _channel_k[c] = EASE_ONE
+                finished |= 1 << c
+            else:
+                _channel_k[c] = ease(_channel_easing[c], elapsed * EASE_ONE // ms)
+    for j in range(JOINTS):
+        c = CHANNEL_OF[j]
+        if busy & (1 << c):
+            start = _start[j]
+            hand.set(j, start + ((_target[j] - start) * _channel_k[c] + EASE_HALF >> EASE_BITS))
+    hand.commit()
+    if finished:
+        _moving &= ~finished
+        for c in range(CHANNELS):
+            if finished & (1 << c):
+                _channel_done[c] = _channel_seq[c]
+
+
+def motion_core():
+    """ Core 1: take moves off motion_queue as they arrive and step the
+    moving channels once per tick """
+    next_tick = time.ticks_ms()
+    while True:
+        if not _moving:
+            # A move that starts now gets its first tick straight away
+            next_tick = time.ticks_ms()
+        base = motion_queue.peek()
+        while base >= 0:
+            _take(base)
+            motion_queue.pop()
+            base = motion_queue.peek()
+        now = time.ticks_ms()
+        if _moving and time.ticks_diff(now, next_tick) >= 0:
+            t0 = time.ticks_us()
+            motion_tick(now)
+            stats.tick(TASK_MOTION, t0)
+            if time.ticks_diff(time.ticks_us(), t0) > TICK_BUDGET_US:
+                stats.overruns += 1
+            next_tick = time.ticks_add(next_tick, TICK_MS)
+            if time.ticks_diff(now, next_tick) >= 0:
+                # Fell more than a tick behind; don't try to catch up
+                next_tick = time.ticks_add(now, TICK_MS)
+        time.sleep_ms(POLL_MS)
+
+
+def start_motion_core():
+    global motion_core_started
+    if not motion_core_started:
+        motion_core_started = True
+        _thread.start_new_thread(motion_core, ())
+
+
+STRAIGHT_FINGERS = keyframes(
+    (1000, STRAIGHT, STRAIGHT, STRAIGHT, STRAIGHT, STRAIGHT),
+)
+
+CROUCH_POS = keyframes(
+    (0, CROUCH, CROUCH, CROUCH, CROUCH, GRIP),
+)
+
+GET_UP = keyframes(
+    (2000, GRIP, GRIP, GRIP, GRIP, GRIP),
+    (0, STAND, STAND, STAND, STAND, STAND),
+)
+
+RISE_UP = keyframes(
+    (3000, STRAIGHT, STRAIGHT, STRAIGHT, STRAIGHT, STRAIGHT),
+    (2000, None, None, None, None, (-4, 32, 92)),
+    (1000, None, None, None, None, (-54, 100, KEEP)),
+    (1000, None, None, None, None, (-50, 70, 52)),
+    (500, None, None, None, None, (-60, 90, 52)),
+    (1000, (-20, 0, 0)),
+    (1000, None, (-20, 0, 0), (-20, 0, 0), (-20, 0, 0)),
+    (1000, None, None, None, None, GRIP),
+    (1000, None, None, None, (-27, 30, 87)),
+    (1000, (-27, 30, 87), (-27, 30, 87), (-27, 30, 87)),
+    (1000, None, None, None, CROUCH, GRIP),
+    (1000, None, None, CROUCH),
+    (1000, None, CROUCH),
+    (1000, CROUCH),
+    (1000, CROUCH, CROUCH, CROUCH, CROUCH, GRIP),
+)
+
+RISE_UP_THUMB = keyframes(
+    (1000,),
+    (1000, None, None, None, None, (-6, 145, -10)),
+)
+
+FINGER_STAMP = keyframes(
+    (100, GRIP),
+    (100, LIFT),
+    (100, CROUCH, GRIP),
+    (100, None, LIFT),
+    (0, None, CROUCH, GRIP, GRIP, GRIP),
+)
+
+STAND_POSE = keyframes(
+    (0, STAND, STAND, STAND, STAND, STAND),
+)
+
+POINT = keyframes(
+    (200, (-59, 119, 20)),
+    (300, (10, 0, 20)),
+)
+
+POINT_END = keyframes(
+    (1000,),
+    (0, STAND),
+)
+
+# All five bases sweep together between 48 and 139 degrees
+STRUGGLE = keyframes(
+    (0, (-28, 47, 37), (-28, 47, 37), (-28, 47, 37), (-28, 47, 37), (-28, 47, 37)),
+    (0, (-28, KEEP, KEEP), (-39, KEEP, KEEP), (-37, KEEP, KEEP), (-40, KEEP, KEEP), (-40, KEEP, KEEP)),
+    ((920, LINEAR), (63, KEEP, KEEP), (52, KEEP, KEEP), (54, KEEP, KEEP), (51, KEEP, KEEP), (51, KEEP, KEEP)),
+    ((920, LINEAR), (-28, KEEP, KEEP), (-39, KEEP, KEEP), (-37, KEEP, KEEP), (-40, KEEP, KEEP), (-40, KEEP, KEEP)),
+)
+
+BOW_DOWN = keyframes(
+    (2000,),
+    (500, None, None, None, None, None, 0),
+    ((1290, LINEAR), (KEEP, KEEP, 99)),
+    ((800, LINEAR), (KEEP, 20, KEEP)),
+    ((1290, LINEAR), None, (KEEP, KEEP, 99)),
+    ((800, LINEAR), None, (KEEP, 20, KEEP)),
+    (1000,),
+    ((620, LINEAR), None, None, (89, KEEP, KEEP)),
+    ((200, LINEAR), None, None, (KEEP, 69, KEEP)),
+    (1180, None, None, (KEEP, KEEP, 30)),
+)
+
+TAP_FINGERS = keyframes(
+    (0, (-47, 37, 80)),
+    (0, None, (-47, 37, 80)),
+    (0, None, None, (-47, 37, 80)),
+    (0, None, None, None, (-47, 37, 80)),
+    (0, (-25, 25, 70)),
+    (0, None, (-25, 25, 70)),
+    (0, None, None, (-25, 25, 70)),
+    (0, None, None, None, (-25, 25, 70)),
+)
+
+TRICK_OR_TREAT = keyframes(
+    (2000, (10, 20, 20), (10, 40, 20), (10, 50, 20), (10, 70, 20), (10, 20, 20)),
+    (2000, (80, 30, 65), (80, 30, 60), (80, 35, 60), (90, 35, 60), (60, 40, 80)),
+)
+
+TRICK_OR_TREAT_END = keyframes(
+    (0, (10, 20, 20)),
+)
+
+TRICK_OR_TREAT_WAVE = keyframes(
+    (0, (KEEP, 39, KEEP)),
+    ((60, LINEAR), (KEEP, 20, KEEP)),
+    (0, (KEEP, KEEP, 64)),
+    ((135, LINEAR), (KEEP, KEEP, 20)),
+    (100,),
+    ((135, LINEAR), (KEEP, KEEP, 64)),
+    ((60, LINEAR), (KEEP, 39, KEEP)),
+)
+
+INITIAL = ((60, 70, 80), (60, 70, 80), (60, 70, 80), (60, 70, 75), (60, 70, 80))
+
+FINGER_COUNT = keyframes(
+    (1000,) + INITIAL,
+    (1000, COUNT),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (1000, None, None, None, None, None, 0),
+    (1000,) + INITIAL,
+    (1000, COUNT, COUNT),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (1000, None, None, None, None, None, 0),
+    (1000,) + INITIAL,
+    (1000, COUNT, COUNT, COUNT),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (1000, None, None, None, None, None, 0),
+    (1000,) + INITIAL,
+    (1000, COUNT, COUNT, COUNT, COUNT),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (100, None, None, None, None, None, -10),
+    (100, None, None, None, None, None, 10),
+    (1000, None, None, None, None, None, 0),
+    (0,) + INITIAL,
+)
+
+# One step of the crouch walk: plant every finger, then lift and re-plant
+# them one at a time. Walking backward swaps the two planted poses.
+WALK_FORWARD = keyframes(
+    (0, GRIP, GRIP, GRIP, GRIP, CROUCH),
+    (0, LIFT),
+    (0, CROUCH),
+    (0, None, LIFT),
+    (0, None, CROUCH),
+    (0, None, None, LIFT),
+    (0, None, None, CROUCH),
+    (0, None, None, None, LIFT),
+    (0, None, None, None, CROUCH),
+    (0, None, None, None, None, LIFT),
+    (0, None, None, None, None, GRIP),
+    (0, GRIP, GRIP, GRIP, GRIP, CROUCH),
+)
+
+WALK_BACKWARD = keyframes(
+    (0, CROUCH, CROUCH, CROUCH, CROUCH, GRIP),
+    (0, LIFT),
+    (0, GRIP),
+    (0, None, LIFT),
+    (0, None, GRIP),
+    (0, None, None, LIFT),
+    (0, None, None, GRIP),
+    (0, None, None, None, LIFT),
+    (0, None, None, None, GRIP),
+    (0, None, None, None, None, LIFT),
+    (0, None, None, None, None, CROUCH),
+    (0, CROUCH, CROUCH, CROUCH, CROUCH, GRIP),
+)
+
+STAND_WALK = keyframes(
+    (500, None, None, None, None, None, 0),
+    (50, (38, 102, -50), STAND, STAND, STAND, (44, 83, -37)),
+    (50, (-2, 124, -22)),
+    (50, (KEEP, KEEP, 1)),
+    (50, (KEEP, 76, KEEP)),
+    (50, (15, KEEP, KEEP)),
+    (50, None, (34, 111, -54)),
+    (50, None, (-2, 124, -22)),
+    (50, None, (KEEP, KEEP, -3)),
+    (50, None, (KEEP, 84, KEEP)),
+    (50, None, (8, KEEP, KEEP)),
+    (50, None, None, (38, 102, -50)),
+    (50, None, None, (-2, 124, -22)),
+    (50, None, None, (KEEP, KEEP, 1)),
+    (50, None, None, (KEEP, 76, KEEP)),
+    (50, None, None, (15, KEEP, KEEP)),
+    (0, None, None, None, (79, 20, -10)),
+    (20, None, None, None, (9, 112, -31)),
+    (10, None, None, None, (KEEP, KEEP, -10)),
+    (10, None, None, None, (KEEP, 42, KEEP)),
+    (0, None, None, None, (39, KEEP, KEEP)),
+    (0, (38, 102, -50), (34, 111, -54), (38, 102, -50), (17, 105, -50)),
+)
+
+
+def _walk_durations(step_speed, speed):
+    s = int(speed * 1000)
+    step = int(step_speed * 1000)
+    return array('H', (s, step, s, step, s, step, s, 0, s, 0, s, 0))
+
+# ----------------------------------------
+
+async def straight_fingers():
+    await play(STRAIGHT_FINGERS)
    
-def rise_up():
-    straight_fingers()
-    time.sleep(2)
-
-    t_b.write(84)
-    t_m.write(80)
-    t_t.write(170)
-    time.sleep(2)
-
-    t_b.write(84-50)
-    t_m.write(48+100)
-    time.sleep(1)
-    t_b.write(88-50)
-    t_m.write(48+70)
-    t_t.write(78+52)
-    time.sleep(1)
-
-    t_b.write(88-60)
-    t_m.write(48+90)
-    t_t.write(78+52)
-
-    time.sleep(0.5)
-
-    i_b.write(76-20)
-    i_m.write(15)
-    i_t.write(55)
-    time.sleep(1)
-    m_b.write(87-20)
-    m_m.write(44)
-    m_t.write(58)
-
-    r_b.write(85-20)
-    r_m.write(35)
-    r_t.write(60)
-
-    p_b.write(88-20)
-    p_m.write(45)
-    p_t.write(45)
-
-    time.sleep(1)
-
-    t_b.write(88-4)
-    t_m.write(48+125)
-    t_t.write(78-32)
-    time.sleep(1)
-    p_b.write(88-27)
-    p_m.write(45+30)
-    p_t.write(45+87)
-    time.sleep(1)
-    i_b.write(76-27)
-    i_m.write(15+30)
-    i_t.write(55+87)
-
-    m_b.write(87-27)
-    m_m.write(44+30)
-    m_t.write(58+87)
-
-    r_b.write(85-27)
-    r_m.write(35+30)
-    r_t.write(60+87)
-
-    time.sleep(1)
-    p_b.write(88-12)
-    p_m.write(45+104)
-    p_t.write(45-2)
-
-    t_b.write(88-4)
-    t_m.write(48+125)
-    t_t.write(78-32)
-
-    time.sleep(1)
-    r_b.write(85-12)
-    r_m.write(35+104)
-    r_t.write(60-2)
-    time.sleep(1)
-    m_b.write(87-12)
-    m_m.write(44+104)
-    m_t.write(58-2)
-    time.sleep(1)
-    i_b.write(76-12)
-    i_m.write(15+104)
-    i_t.write(55-2)
-
-    time.sleep(1)
-
-    crouch_pos()
-    time.sleep(1)
-    crouch_walk_backward(steps=1)
-
-    time.sleep(1)
-    t_b.write(88-6)
-    t_m.write(48+145)
-    t_t.write(78-10)
-    time.sleep(1)
-    get_up()
-
-def finger_stamp():
-    for i in range(10):
-        i_b.write(76-4)
-        i_m.write(15+125)
-        i_t.write(55-32)
-        time.sleep(0.1)
-        i_b.write(76-63)
-        i_m.write(15+138)
-        i_t.write(55+15)
-        time.sleep(0.1)
-        i_b.write(76-12)
-        i_m.write(15+104)
-        i_t.write(55-2)
-
-        m_b.write(87-4)
-        m_m.write(44+125)
-        m_t.write(58-32)
-        time.sleep(0.1)
-        m_b.write(87-63)
-        m_m.write(44+138)
-        m_t.write(58+15)
-        time.sleep(0.1)
-        m_b.write(87-12)
-        m_m.write(44+104)
-        m_t.write(58-2)
-
-        r_b.write(85-4)
-        r_m.write(35+125)
-        r_t.write(60-32)
-
-        p_b.write(88-4)
-        p_m.write(45+125)
-        p_t.write(45-32)
-
-        t_b.write(88-4)
-        t_m.write(48+125)
-        t_t.write(78-32)
-
-def get_up():
-    i_b.write(76-4)
-    i_m.write(15+125)
-    i_t.write(55-32)
+async def get_up():
+    await play(GET_UP)
     
-    m_b.write(87-4)
-    m_m.write(44+125)
-    m_t.write(58-32)
-
-    r_b.write(85-4)
-    r_m.write(35+125)
-    r_t.write(60-32)
-
-    p_b.write(88-4)
-    p_m.write(45+125)
-    p_t.write(45-32)
-
-    t_b.write(88-4)
-    t_m.write(48+125)
-    t_t.write(78-32)
-    
-    time.sleep(2)
+async def struggle():
+    await play(STRUGGLE)
     
-    m_b.write(87+59)
-    m_m.write(44+60)
-    m_t.write(58-29)
+async def finger_count():
+    await play(FINGER_COUNT)
 
-    r_b.write(85+59)
-    r_m.write(35+60)
-    r_t.write(60-29)
+async def crouch_walk_forward(steps=3, step_speed=0.1, speed=0.3):
+    await play(WALK_FORWARD, _walk_durations(step_speed, speed), repeat=steps)
 
-    p_b.write(88+59)
-    p_m.write(45+60)
-    p_t.write(45-29)
-    
-    t_b.write(88+59)
-    t_m.write(48+60)
-    t_t.write(78-29)
-        
-    i_b.write(76+59)
-    i_m.write(15+60)
-    i_t.write(55-29)
-    
-def point_finger(point_count=4):
-    m_b.write(87+59)
-    m_m.write(44+60)
-    m_t.write(58-29)
-
-    r_b.write(85+59)
-    r_m.write(35+60)
-    r_t.write(60-29)
-
-    p_b.write(88+59)
-    p_m.write(45+60)
-    p_t.write(45-29)
-
-    t_b.write(88+59)
-    t_m.write(48+60)
-    t_t.write(78-29)
-        
-    i_b.write(76+59)
-    i_m.write(15+60)
-    i_t.write(55-29)
-    # time.sleep(2)
-    for i in range(point_count):
-        i_b.write(76-59)
-        i_m.write(15+119)
-        i_t.write(55+20)
-        time.sleep(0.2)
-        i_b.write(76+10)
-        i_m.write(15)
-        i_t.write(55+20)
-        time.sleep(0.3)
-    time.sleep(1)
-    i_b.write(76+59)
-    i_m.write(15+60)
-    i_t.write(55-29)
-    
-def struggle():
-    i_b.write(76-28)
-    i_m.write(15+47)
-    i_t.write(55+37)
-
-    m_b.write(87-28)
-    m_m.write(44+47)
-    m_t.write(58+37)
-
-    r_b.write(85-28)
-    r_m.write(35+47)
-    r_t.write(60+37)
-
-    p_b.write(88-28)
-    p_m.write(45+47)
-    p_t.write(45+37)
-
-    t_b.write(88-28)
-    t_m.write(48+47)
-    t_t.write(78+37)
-
-    for i in range(48, 140):
-        i_b.write(i)
-        m_b.write(i)
-        r_b.write(i)
-        p_b.write(i)
-        t_b.write(i)
-        time.sleep(0.01)
-    for i in reversed(range(48, 140)):
-        i_b.write(i)
-        m_b.write(i)
-        r_b.write(i)
-        p_b.write(i)
-        t_b.write(i)
-        time.sleep(0.01)
-    
-def bow_down(bowTime=2):
-    get_up()
-    time.sleep(2)
-    wrt.write(90)
-    time.sleep(0.5)
-    
-    for i in range(26,155):
-        i_t.write(i)
-        time.sleep(0.01)
-    for i in reversed(range(35,75)):
-        i_m.write(i)
-        time.sleep(0.02)
-    
-    for i in range(29,158):
-        m_t.write(i)
-        time.sleep(0.01)
-    for i in reversed(range(64,104)):
-        m_m.write(i)
-        time.sleep(0.02)
- 
-    time.sleep(1)
-
-    for i in range(144,175):
-        r_b.write(i)
-        time.sleep(0.02)
-    for i in range(95,105):
-        r_m.write(i)
-        time.sleep(0.02)
-    for i in range(31,90):
-        r_t.write(60+30)
-        time.sleep(0.02)
-    
-    time.sleep(bowTime)
-    get_up()
-    
-def tap_fingers(tapCount=8,tapSpeed=0.05):
-    for i in range(tapCount):
-        t = tapSpeed
-        i_t.write(55+80)
-        i_m.write(15+37)
-        i_b.write(76-47)
-
-        time.sleep(t)
-
-        m_t.write(58+80)
-        m_m.write(44+37)
-        m_b.write(87-47)
-
-        time.sleep(t)
-
-        r_t.write(60+80)
-        r_m.write(35+37)
-        r_b.write(85-47)
-
-        time.sleep(t)
-
-        p_t.write(45+80)
-        p_m.write(45+37)
-        p_b.write(88-47)
-
-        time.sleep(t)
-
-        i_b.write(76-25)
-        i_m.write(15+25)
-        i_t.write(55+70)
-
-        time.sleep(t)
-
-        m_b.write(87-25)
-        m_m.write(44+25)
-        m_t.write(58+70)
+async def crouch_walk_backward(steps=3, step_speed=0.1, speed=0.3):
+    await play(WALK_BACKWARD, _walk_durations(step_speed, speed), repeat=steps)
 
-        time.sleep(t)
-
-        r_b.write(85-25)
-        r_m.write(35+25)
-        r_t.write(60+70)
-
-        time.sleep(t)
-
-        p_b.write(88-25)
-        p_m.write(45+25)
-        p_t.write(45+70)
-              
-def trick_or_treat():
-    for i in range(2):
-        i_b.write(76+10)
-        i_m.write(15+20)
-        i_t.write(55+20)
-
-        m_b.write(87+10)
-        m_m.write(44+40)
-        m_t.write(58+20)
+async def crouch_pos():
+    await play(CROUCH_POS)
+    
+async def stand_walk(steps=3):
+    await get_up()
+    await play(STAND_WALK, repeat=steps)
+
+# ---------- Gesture scripts -----------
+#
+# Gestures that chain keyframe tables are written as scripts, one op per line:
+#   gesture NAME        start a gesture
+#   pose GROUP ...      stage a group: index, middle, ring, pinky or thumb
+#                       take a shape (STRAIGHT, CROUCH, ...) or three offsets,
+#                       wrist one offset, all a shape for every finger.
+#                       Groups staged together move in parallel.
+#   set                 move the staged groups straight there
+#   move MS [EASING]    move them over MS; step, linear, ease or minjerk
+#   wait MS
+#   repeat N ... end
+#   call NAME           run another script gesture
+#   play TABLE [MS ...] run a keyframe table, optionally with its own durations
+#   bind NAME BUTTON    run gesture NAME from a remote button: green, red,
+#                       blue, yellow, white or black; allowed anywhere
+# Scripts in SCRIPT_FILE on flash are added to the built-in ones, replacing
+# those with the same name, and their binds replace the built-in ones.
+# Everything is compiled at boot into one bytecode array of signed 16-bit
+# words, so times and counts must fit in 0..32767 and offsets in -180..180;
+# run_script walks it with a fixed stack and allocates nothing.
+
+SCRIPT_FILE = "gestures.txt"
+
+SCRIPTS = """
+bind finger_stamp green
+bind point_finger yellow
+bind bow_down white
+bind rise_up black
+
+gesture rise_up
+    play RISE_UP
+    play WALK_BACKWARD 300 100 300 100 300 100 300 0 300 0 300 0
+    play RISE_UP_THUMB
+    play GET_UP
+
+gesture finger_stamp
+    repeat 10
+        play FINGER_STAMP
+    end
+
+gesture point_finger
+    play STAND_POSE
+    repeat 4
+        play POINT
+    end
+    play POINT_END
+
+gesture bow_down
+    play GET_UP
+    play BOW_DOWN
+    wait 2000
+    play GET_UP
+
+gesture tap_fingers
+    repeat 8
+        play TAP_FINGERS 50 50 50 50 50 50 50 0
+    end
+
+gesture trick_or_treat
+    repeat 2
+        play TRICK_OR_TREAT
+    end
+    play TRICK_OR_TREAT_END
+    repeat 3
+        play TRICK_OR_TREAT_WAVE
+    end
+"""
+
+SCRIPT_TABLES = {
+    "STRAIGHT_FINGERS": STRAIGHT_FINGERS, "CROUCH_POS": CROUCH_POS, "GET_UP": GET_UP,
+    "RISE_UP": RISE_UP, "RISE_UP_THUMB": RISE_UP_THUMB, "FINGER_STAMP": FINGER_STAMP,
+    "STAND_POSE": STAND_POSE, "POINT": POINT, "POINT_END": POINT_END,
+    "STRUGGLE": STRUGGLE, "BOW_DOWN": BOW_DOWN, "TAP_FINGERS": TAP_FINGERS,
+    "TRICK_OR_TREAT": TRICK_OR_TREAT, "TRICK_OR_TREAT_END": TRICK_OR_TREAT_END,
+    "TRICK_OR_TREAT_WAVE": TRICK_OR_TREAT_WAVE, "FINGER_COUNT": FINGER_COUNT,
+    "WALK_FORWARD": WALK_FORWARD, "WALK_BACKWARD": WALK_BACKWARD, "STAND_WALK": STAND_WALK,
+}
+SCRIPT_SHAPES = {
+    "STRAIGHT": STRAIGHT, "CROUCH": CROUCH, "GRIP": GRIP,
+    "LIFT": LIFT, "STAND": STAND, "COUNT": COUNT,
+}
+SCRIPT_GROUPS = {"index": 0, "middle": 3, "ring": 6, "pinky": 9, "thumb": 12, "wrist": 15}
+SCRIPT_EASINGS = {"step": STEP, "linear": LINEAR, "ease": EASE_IN_OUT, "minjerk": MIN_JERK}
+SCRIPT_BUTTONS = {"green": 0, "red": 1, "blue": 2, "yellow": 3, "white": 4, "black": 5}
+
+# Ops. A pose is followed by a joint mask and an offset for each joint in it.
+OP_RETURN = const(0)  # End of a gesture or table
+OP_POSE = const(1)    # mask, offsets...
+OP_MOVE = const(2)    # ms, easing
+OP_WAIT = const(3)    # ms
+OP_REPEAT = const(4)  # count
+OP_NEXT = const(5)    # End of a repeat
+OP_CALL = const(6)    # address
+
+SCRIPT_STACK = 8  # Nested repeats and calls
+SCRIPT_MAX = 0x7FFF  # Largest time, count or address a bytecode word holds
+
+
+def _operand(word, low=0, high=SCRIPT_MAX):
+    """ A number from a script, checked to fit its bytecode word """
+    value = int(word)
+    if not low <= value <= high:
+        raise ValueError
+    return value
+
+
+def _emit_pose(code, offsets):
+    mask = 0
+    for j in range(JOINTS):
+        if offsets[j] != KEEP:
+            mask |= 1 << j
+    code.append(OP_POSE)
+    code.append(mask - 0x10000 if mask & 0x8000 else mask)
+    for j in range(JOINTS):
+        if offsets[j] != KEEP:
+            code.append(offsets[j])
+
+
+def _parse_pose(words):
+    offsets = [KEEP] * JOINTS
+    i = 0
+    while i < len(words):
+        group = words[i]
+        if group == "all":
+            for f in range(5):
+                offsets[f * 3:f * 3 + 3] = SCRIPT_SHAPES[words[i + 1]]
+            i += 2
+        elif group == "wrist":
+            offsets[15] = _operand(words[i + 1], -ANGLES + 1, ANGLES - 1)
+            i += 2
+        elif words[i + 1] in SCRIPT_SHAPES:
+            j = SCRIPT_GROUPS[group]
+            offsets[j:j + 3] = SCRIPT_SHAPES[words[i + 1]]
+            i += 2
+        else:
+            j = SCRIPT_GROUPS[group]
+            offsets[j:j + 3] = [_operand(w, -ANGLES + 1, ANGLES - 1) for w in words[i + 1:i + 4]]
+            i += 4
+    return offsets
+
+
+def compile_scripts(source):
+    """ Compile script source into (bytecode, {gesture name: address},
+    {button mask bit: gesture name}). Raises ValueError naming the
+    offending line. """
+    code = array('h')
+    gestures = {}
+    bindings = {}
+    calls = []  # (position, gesture name)
+    plays = []  # (position, (table name, durations))
+    depth = 0
+    name = None
+    for number, line in enumerate(source.split("\n"), 1):
+        words = line.split("#")[0].split()
+        if not words:
+            continue
+        op = words[0]
+        try:
+            if op == "bind":
+                bindings[SCRIPT_BUTTONS[words[2]]] = words[1]
+            elif op == "gesture":
+                if name is not None:
+                    if depth:
+                        raise ValueError
+                    code.append(OP_RETURN)
+                name = words[1]
+                gestures[name] = len(code)
+            elif name is None:
+                raise ValueError
+            elif op == "pose":
+                _emit_pose(code, _parse_pose(words[1:]))
+            elif op == "set":
+                code.append(OP_MOVE)
+                code.append(0)
+                code.append(STEP)
+            elif op == "move":
+                easing = SCRIPT_EASINGS[words[2]] if len(words) > 2 else MIN_JERK
+                code.append(OP_MOVE)
+                code.append(_operand(words[1]))
+                code.append(easing)
+            elif op == "wait":
+                code.append(OP_WAIT)
+                code.append(_operand(words[1]))
+            elif op == "repeat":
+                code.append(OP_REPEAT)
+                code.append(_operand(words[1], 1))
+                depth += 1
+            elif op == "end":
+                if not depth:
+                    raise ValueError
+                code.append(OP_NEXT)
+                depth -= 1
+            elif op == "call":
+                code.append(OP_CALL)
+                code.append(0)
+                calls.append((len(code) - 1, words[1]))
+            elif op == "play":
+                if words[1] not in SCRIPT_TABLES:
+                    raise ValueError
+                code.append(OP_CALL)
+                code.append(0)
+                plays.append((len(code) - 1, (words[1], tuple(_operand(w) for w in words[2:]))))
+            else:
+                raise ValueError
+        except (ValueError, KeyError, IndexError):
+            raise ValueError("line %d: %s" % (number, line.strip()))
+    if name is not None:
+        if depth:
+            raise ValueError("unclosed repeat in " + name)
+        code.append(OP_RETURN)
+    # Each table is compiled once per set of durations, after the gestures
+    tables = {}
+    for position, key in plays:
+        if key not in tables:
+            tables[key] = len(code)
+            table, frame_ms, easings = SCRIPT_TABLES[key[0]]
+            durations = key[1] or frame_ms
+            offset = 0
+            for f in range(len(frame_ms)):
+                _emit_pose(code, table[offset:offset + JOINTS])
+                code.append(OP_MOVE)
+                code.append(durations[f] if f < len(durations) else 0)
+                code.append(easings[f])
+                offset += JOINTS
+            code.append(OP_RETURN)
+        code[position] = tables[key]
+    if len(code) > SCRIPT_MAX:
+        raise ValueError("scripts too long, %d words" % len(code))
+    for position, target in calls:
+        if target not in gestures:
+            raise ValueError("unknown gesture " + target)
+        code[position] = gestures[target]
+    for target in bindings.values():
+        if target not in gestures:
+            raise ValueError("unknown gesture " + target)
+    return code, gestures, bindings
+
+
+def load_scripts():
+    """ Built-in scripts plus those on flash; a bad file is reported and skipped """
+    try:
+        with open(SCRIPT_FILE) as f:
+            extra = f.read()
+    except OSError:
+        extra = ""
+    if extra:
+        try:
+            return compile_scripts(SCRIPTS + "\n" + extra)
+        except ValueError as e:
+            print("Bad gesture script", SCRIPT_FILE, e)
+    return compile_scripts(SCRIPTS)
+
+
+script_code, script_gestures, script_bindings = load_scripts()
+_script_pose = array('h', [KEEP] * JOINTS)
+_script_stack = array('h', [0] * (SCRIPT_STACK * 2))
+
+
+async def run_script(address):
+    """ Interpret script_code from address until its gesture returns """
+    code = script_code
+    pose = _script_pose
+    stack = _script_stack
+    pc = address
+    sp = 0
+    channels = 0
+    try:
+        while True:
+            op = code[pc]
+            if op == OP_POSE:
+                mask = code[pc + 1] & 0xFFFF
+                pc += 2
+                for j in range(JOINTS):
+                    if mask & (1 << j):
+                        pose[j] = NEUTRAL[j] + code[pc]
+                        pc += 1
+            elif op == OP_MOVE:
+                ms = code[pc + 1]
+                channels = start_move(pose, ms, code[pc + 2])
+                while channels == QUEUE_FULL:
+                    await asyncio.sleep_ms(POLL_MS)
+                    channels = start_move(pose, ms, code[pc + 2])
+                if channels:
+                    # Polling keeps the wait free of allocations
+                    await asyncio.sleep_ms(ms)
+                    while busy_channels() & channels:
+                        await asyncio.sleep_ms(POLL_MS)
+                elif ms:
+                    await asyncio.sleep_ms(ms)
+                for j in range(JOINTS):
+                    pose[j] = KEEP
+                pc += 3
+            elif op == OP_WAIT:
+                await asyncio.sleep_ms(code[pc + 1])
+                pc += 2
+            elif op == OP_REPEAT or op == OP_CALL:
+                if sp == len(stack):
+                    print("gesture script too deeply nested")
+                    return
+                if op == OP_REPEAT:
+                    stack[sp] = pc + 2
+                    stack[sp + 1] = code[pc + 1]
+                    pc += 2
+                else:
+                    stack[sp] = pc + 2
+                    stack[sp + 1] = -1
+                    pc = code[pc + 1]
+                sp += 2
+            elif op == OP_NEXT:
+                stack[sp - 1] -= 1
+                if stack[sp - 1] > 0:
+                    pc = stack[sp - 2]
+                else:
+                    sp -= 2
+                    pc += 1
+            else:
+                if not sp:
+                    return
+                sp -= 2
+                pc = stack[sp]
+    except asyncio.CancelledError:
+        halt(channels)
+        raise
+
+
+def _script(name):
+    async def gesture():
+        await run_script(script_gestures[name])
+    return gesture
+
+rise_up = _script("rise_up")
+finger_stamp = _script("finger_stamp")
+point_finger = _script("point_finger")
+bow_down = _script("bow_down")
+tap_fingers = _script("tap_fingers")
+trick_or_treat = _script("trick_or_treat")
+
+# ---------- Gait -----------
+#
+# Walks started from the remote run as a phase oscillator over one cycle of
+# the keyframe walk. Each motion tick advances the phase by the stride rate,
+# taken from how far the stick is pushed, and the pose is interpolated
+# between the cycle's keyframes. A new stick position changes the rate
+# without restarting the cycle. Walking backward runs the forward cycle with
+# the phase going the other way, so a change of direction reverses the
+# stride from the pose the hand is in. The stick passes through the centre
+# on its way from forward to backward, which ends the walk, so a walk on the
+# same cycle that starts within GAIT_RESUME_MS of the last one stopping
+# carries on from its phase.
+
+# Phases run from 0 to PHASE_ONE over a cycle, and stride rates are
+# multiples of the walk's nominal speed out of RATE_ONE; fixed point, like
+# the motion engine
+PHASE_ONE = const(65536)
+RATE_ONE = const(256)
+
+# Stride rate at the walk threshold and at full stick
+GAIT_MIN_RATE = RATE_ONE // 2
+GAIT_MAX_RATE = RATE_ONE * 2
+
+GAIT_RESUME_MS = 300
+
+
+def gait_cycle(gesture, durations=None):
+    """ Flatten a walk into (poses, phase of each pose, period in ms). Frames
+    with no duration are merged into the frame after them, and poses are
+    clamped to the servo range so interpolation never leaves it. """
+    table, frame_ms, _ = gesture
+    if durations is None:
+        durations = frame_ms
+    period = sum(durations)
+    pose = array('h', [KEEP] * JOINTS)
+    poses = array('h')
+    phases = array('H')
+    elapsed = 0
+    # The first pass only settles joints the cycle leaves over from its end
+    for record in (False, True):
+        offset = 0
+        for ms in durations:
+            for j in range(JOINTS):
+                value = table[offset + j]
+                if value != KEEP:
+                    pose[j] = min(max(NEUTRAL[j] + value, 0), ANGLES - 1)
+            offset += JOINTS
+            if record and ms:
+                poses.extend(pose)
+                phases.append(elapsed * PHASE_ONE // period)
+                elapsed += ms
+    return poses, phases, period
+
+
+CROUCH_GAIT = gait_cycle(WALK_FORWARD, _walk_durations(0.1, 0.3))
+STAND_GAIT = gait_cycle(STAND_WALK)
+
+# Where the last walk stopped: its cycle, phase and when
+_gait_cycle = None
+_gait_phase = 0
+_gait_end_ms = 0
+
+
+def gait_rate(axis):
+    """ Stride rate for a stick position; legacy remotes send no position """
+    value = abs(axes[axis])
+    if value <= AXIS_THRESHOLD:
+        return RATE_ONE
+    return GAIT_MIN_RATE + (GAIT_MAX_RATE - GAIT_MIN_RATE) * \
+        (value - AXIS_THRESHOLD) // (127 - AXIS_THRESHOLD)
+
+
+_gait_pose = array('h', [KEEP] * JOINTS)
+
+
+def gait_pose(cycle, phase):
+    """ Return the pose at phase (0..PHASE_ONE) of a gait cycle """
+    poses, phases, _ = cycle
+    count = len(phases)
+    k = count - 1
+    while phases[k] > phase:
+        k -= 1
+    end = phases[k + 1] if k + 1 < count else PHASE_ONE
+    u = (phase - phases[k]) * EASE_ONE // (end - phases[k])
+    a = k * JOINTS
+    b = ((k + 1) % count) * JOINTS
+    pose = _gait_pose
+    for j in range(JOINTS):
+        start = poses[a + j]
+        if start == KEEP:
+            pose[j] = KEEP
+        else:
+            pose[j] = start + ((poses[b + j] - start) * u + EASE_HALF >> EASE_BITS)
+    return pose
 
-        r_b.write(85+10)
-        r_m.write(35+50)
-        r_t.write(60+20)
 
-        p_b.write(88+10)
-        p_m.write(45+70)
-        p_t.write(45+20)
+def gait_resumes(cycle):
+    """ True if a walk on cycle starting now carries on from the last one """
+    return cycle is _gait_cycle and \
+        time.ticks_diff(time.ticks_ms(), _gait_end_ms) < GAIT_RESUME_MS
 
-        t_b.write(88+10)
-        t_m.write(48+20)
-        t_t.write(78+20)
 
-        time.sleep(2)
-
-        i_b.write(76+80)
-        i_m.write(15+30)
-        i_t.write(55+65)
-
-        m_b.write(87+80)
-        m_m.write(44+30)
-        m_t.write(58+60)
-
-        r_b.write(85+80)
-        r_m.write(35+35)
-        r_t.write(60+60)
-
-        p_b.write(88+90)
-        p_m.write(45+35)
-        p_t.write(45+60)
-
-        t_b.write(88+60)
-        t_m.write(48+40)
-        t_t.write(78+80)
-        
-        time.sleep(2)
-
-    i_b.write(76+10)
-    i_m.write(15+20)
-    i_t.write(55+20)
-
-    for i in range(3):
-        for i in reversed(range(35, 55)):
-            i_m.write(i)
-            time.sleep(0.003)
-        for i in reversed(range(75, 120)):
-            i_t.write(i)
-            time.sleep(0.003)
-
-        time.sleep(0.1)
-        for i in range(75, 120):
-             i_t.write(i)
-             time.sleep(0.003)
-        for i in range(35, 55):
-            i_m.write(i)
-            time.sleep(0.003)
-
-def _initial():  # Private function used in the finger_count function
-    i_b.write(76+60)
-    i_m.write(15+70)
-    i_t.write(55+80)
-
-    m_b.write(87+60)
-    m_m.write(44+70)
-    m_t.write(58+80)
-
-    r_b.write(85+60)
-    r_m.write(35+70)
-    r_t.write(60+80)
-
-    p_b.write(88+60)
-    p_m.write(45+70)
-    p_t.write(45+75)
-
-    t_b.write(88+60)
-    t_m.write(48+70)
-    t_t.write(78+80)
-
-
-def finger_count():
-    _initial()
-    time.sleep(1)
-
-    i_b.write(76+60)
-    i_m.write(15+30)
-    i_t.write(55+10)
-
-    time.sleep(1)
-    for i in range(3):    
-        wrt.write(80)
-        time.sleep(0.1)
-        wrt.write(100)
-        time.sleep(0.1)
-    wrt.write(90)
-
-    time.sleep(1)
-
-    _initial()
-    time.sleep(1)
-
-    i_b.write(76+60)
-    i_m.write(15+30)
-    i_t.write(55+10)
-
-    m_b.write(87+60)
-    m_m.write(44+30)
-    m_t.write(58+10)
-
-    time.sleep(1)
-
-    for i in range(3):    
-        wrt.write(80)
-        time.sleep(0.1)
-        wrt.write(100)
-        time.sleep(0.1)
-    wrt.write(90)
-    time.sleep(1)
-
-    _initial()
-    time.sleep(1)
-
-    i_b.write(76+60)
-    i_m.write(15+30)
-    i_t.write(55+10)
-
-    m_b.write(87+60)
-    m_m.write(44+30)
-    m_t.write(58+10)
-
-    r_b.write(85+60)
-    r_m.write(35+30)
-    r_t.write(60+10)
-
-    time.sleep(1)
-    for i in range(3):    
-        wrt.write(80)
-        time.sleep(0.1)
-        wrt.write(100)
-        time.sleep(0.1)
-    wrt.write(90)
-    time.sleep(1)
-    _initial()
-    time.sleep(1)
-    i_b.write(76+60)
-    i_m.write(15+30)
-    i_t.write(55+10)
-
-    m_b.write(87+60)
-    m_m.write(44+30)
-    m_t.write(58+10)
-
-    r_b.write(85+60)
-    r_m.write(35+30)
-    r_t.write(60+10)
-
-    p_b.write(88+60)
-    p_m.write(45+30)
-    p_t.write(45+10)
-
-    time.sleep(1)
-
-    for i in range(3):    
-        wrt.write(80)
-        time.sleep(0.1)
-        wrt.write(100)
-        time.sleep(0.1)
-    wrt.write(90)
-    time.sleep(1)
-
-    _initial()
-
-    t_b.write(88+60)
-    t_m.write(48+70)
-    t_t.write(78+80)
-
-
-def crouch_walk_forward(steps=3, step_speed=0.1, speed=0.3):
-    for i in range(steps):
-        i_b.write(76-4)
-        i_m.write(15+125)
-        i_t.write(55-32)
-
-        m_b.write(87-4)
-        m_m.write(44+125)
-        m_t.write(58-32)
-        
-        r_b.write(85-4)
-        r_m.write(35+125)
-        r_t.write(60-32)
-        
-        p_b.write(88-4)
-        p_m.write(45+125)
-        p_t.write(45-32)
-        
-        t_b.write(88-12)
-        t_m.write(48+104)
-        t_t.write(78-2)
-        
-        time.sleep(speed)
-
-        i_b.write(76-63)
-        i_m.write(15+138)
-        i_t.write(55+15)
-        time.sleep(step_speed)
-        i_b.write(76-12)
-        i_m.write(15+104)
-        i_t.write(55-2)
-
-        time.sleep(speed)
-        
-        m_b.write(87-63)
-        m_m.write(44+138)
-        m_t.write(58+15)
-        time.sleep(step_speed)
-        m_b.write(87-12)
-        m_m.write(44+104)
-        m_t.write(58-2)
-        
-        time.sleep(speed)
-        
-        r_b.write(85-63)
-        r_m.write(35+138)
-        r_t.write(60+15)
-        time.sleep(step_speed)
-        r_b.write(85-12)
-        r_m.write(35+104)
-        r_t.write(60-2)
-        
-        time.sleep(speed)
-        
-        p_b.write(88-63)
-        p_m.write(45+138)
-        p_t.write(45+15)
-        p_b.write(88-12)
-        p_m.write(45+104)
-        p_t.write(45-2)
-        
-        time.sleep(speed)
-        
-        t_b.write(88-63)
-        t_m.write(48+138)
-        t_t.write(78+15)
-        t_b.write(88-4)
-        t_m.write(48+125)
-        t_t.write(78-32)
-
-        time.sleep(speed)
-
-        i_b.write(76-4)
-        i_m.write(15+125)
-        i_t.write(55-32)
-
-        m_b.write(87-4)
-        m_m.write(44+125)
-        m_t.write(58-32)
-        
-        r_b.write(85-4)
-        r_m.write(35+125)
-        r_t.write(60-32)
-
-        p_b.write(88-4)
-        p_m.write(45+125)
-        p_t.write(45-32)
-
-        t_b.write(88-12)
-        t_m.write(48+104)
-        t_t.write(78-2)
-
-def crouch_walk_backward(steps=3, step_speed=0.1, speed=0.3):
-    for i in range(steps):
-        i_b.write(76-12)
-        i_m.write(15+104)
-        i_t.write(55-2)
-
-        m_b.write(87-12)
-        m_m.write(44+104)
-        m_t.write(58-2)
-        
-        r_b.write(85-12)
-        r_m.write(35+104)
-        r_t.write(60-2)
-        
-        p_b.write(88-12)
-        p_m.write(45+104)
-        p_t.write(45-2)
-        
-        t_b.write(88-4)
-        t_m.write(48+125)
-        t_t.write(78-32)
-        
-        time.sleep(speed)
-
-        i_b.write(76-63)
-        i_m.write(15+138)
-        i_t.write(55+15)
-        time.sleep(step_speed)
-        i_b.write(76-4)
-        i_m.write(15+125)
-        i_t.write(55-32)
-
-        time.sleep(speed)
-        
-        m_b.write(87-63)
-        m_m.write(44+138)
-        m_t.write(58+15)
-        time.sleep(step_speed)
-        m_b.write(87-4)
-        m_m.write(44+125)
-        m_t.write(58-32)
-        
-        time.sleep(speed)
-        
-        r_b.write(85-63)
-        r_m.write(35+138)
-        r_t.write(60+15)
-        time.sleep(step_speed)
-        r_b.write(85-4)
-        r_m.write(35+125)
-        r_t.write(60-32)
-        
-        time.sleep(speed)
-        
-        p_b.write(88-63)
-        p_m.write(45+138)
-        p_t.write(45+15)
-        p_b.write(88-4)
-        p_m.write(45+125)
-        p_t.write(45-32)
-        
-        time.sleep(speed)
-        
-        t_b.write(88-63)
-        t_m.write(48+138)
-        t_t.write(78+15)
-        t_b.write(88-12)
-        t_m.write(48+104)
-        t_t.write(78-2)
-
-        time.sleep(speed)
-
-        i_b.write(76-12)
-        i_m.write(15+104)
-        i_t.write(55-2)
-
-        m_b.write(87-12)
-        m_m.write(44+104)
-        m_t.write(58-2)
-        
-        r_b.write(85-12)
-        r_m.write(35+104)
-        r_t.write(60-2)
-
-        p_b.write(88-12)
-        p_m.write(45+104)
-        p_t.write(45-2)
-
-        t_b.write(88-4)
-        t_m.write(48+125)
-        t_t.write(78-32)
-
-def crouch_pos():
-    i_b.write(76-12)
-    i_m.write(15+104)
-    i_t.write(55-2)
-
-    m_b.write(87-12)
-    m_m.write(44+104)
-    m_t.write(58-2)
-
-    r_b.write(85-12)
-    r_m.write(35+104)
-    r_t.write(60-2)
-
-    p_b.write(88-12)
-    p_m.write(45+104)
-    p_t.write(45-2)
-
-    t_b.write(88-4)
-    t_m.write(48+125)
-    t_t.write(78-32)
-    
-def stand_walk():
-    get_up()
-    for i in range(3):
-        wrt.write(90)
-        time.sleep(0.5)
-        m_b.write(87+59)
-        m_m.write(44+60)
-        m_t.write(58-29)
-
-        r_b.write(85+59)
-        r_m.write(35+60)
-        r_t.write(60-29)
-
-        p_b.write(88+59)
-        p_m.write(45+60)
-        p_t.write(45-29)
-
-        t_b.write(88+44)
-        t_m.write(48+83)
-        t_t.write(78-37)
-        
-        t = 0.05
-        t2 = 0.05
-
-        i_b.write(76+38)
-        i_m.write(15+102)
-        i_t.write(55-50)
-        time.sleep(t)
-        i_b.write(76-2)
-        i_m.write(15+124)
-        i_t.write(55-22)
-        time.sleep(t)
-        i_t.write(55+1)
-        time.sleep(t)
-        i_m.write(15+76)
-        time.sleep(t)
-        i_b.write(76+15)
-
-        time.sleep(t2)
-
-        m_b.write(87+34)
-        m_m.write(44+111)
-        m_t.write(58-54)
-        time.sleep(t)
-        m_b.write(87-2)
-        m_m.write(44+124)
-        m_t.write(58-22)
-        time.sleep(t)
-        m_t.write(58-3)
-        time.sleep(t)
-        m_m.write(44+84)
-        time.sleep(t)
-        m_b.write(87+8)
-
-
-
-        time.sleep(t2)
-
-        r_b.write(85+38)
-        r_m.write(35+102)
-        r_t.write(60-50)
-        time.sleep(t)
-        r_b.write(85-2)
-        r_m.write(35+124)
-        r_t.write(60-22)
-        time.sleep(t)
-        r_t.write(60+1)
-        time.sleep(t)
-        r_m.write(35+76)
-        time.sleep(t)
-        r_b.write(85+15)
-
-        time.sleep(t2)
-
-        p_b.write(88+79)
-        p_m.write(45+20)
-        p_t.write(45-10)
-        p_b.write(88+9)
-        p_m.write(45+112)
-        p_t.write(45-31)
-        time.sleep(0.02)
-        p_t.write(35)
-        time.sleep(0.01)
-        p_m.write(45+42)
-        time.sleep(0.01)
-        p_b.write(88+39)
-        
-        i_b.write(76+38)
-        i_m.write(15+102)
-        i_t.write(55-50)
-        m_b.write(87+34)
-        m_m.write(44+111)
-        m_t.write(58-54)
-        r_b.write(85+38)
-        r_m.write(35+102)
-        r_t.write(60-50)
-        p_b.write(88+17)
-        p_m.write(45+105)
-        p_t.write(45-50)
+async def run_gait(axis, cycle, *commands):
+    """ Walk while any of commands is held, backward for CMD_WALK_BACKWARD """
+    global _gait_cycle, _gait_phase, _gait_end_ms
+    phase = _gait_phase if gait_resumes(cycle) else 0
+    last = time.ticks_ms()
+    next_tick = last
+    try:
+        while True:
+            backward = None
+            for command in commands:
+                if dispatcher.holding(command):
+                    backward = command == CMD_WALK_BACKWARD
+            if backward is None:
+                return
+            now = time.ticks_ms()
+            step = gait_rate(axis) * time.ticks_diff(now, last) * (PHASE_ONE // RATE_ONE) // cycle[2]
+            phase = (phase - step if backward else phase + step) % PHASE_ONE
+            last = now
+            # With the queue full this pose is dropped; the next tick's
+            # supersedes it anyway
+            start_move(gait_pose(cycle, phase), 0, STEP)
+            next_tick = time.ticks_add(next_tick, TICK_MS)
+            delay = time.ticks_diff(next_tick, time.ticks_ms())
+            await asyncio.sleep_ms(delay if delay > 0 else 0)
+    finally:
+        _gait_cycle = cycle
+        _gait_phase = phase
+        _gait_end_ms = time.ticks_ms()
+
+
+async def crouch_gait():
+    await run_gait(0, CROUCH_GAIT, CMD_WALK_FORWARD, CMD_WALK_BACKWARD)
+
+async def stand_gait():
+    # A walk carrying on is already standing
+    if not gait_resumes(STAND_GAIT):
+        await get_up()
+    await run_gait(2, STAND_GAIT, CMD_STAND_WALK)
+
+# ---------- Recording -----------
+#
+# Teach-in gestures. While recording, every joint's last written angle is
+# sampled RECORD_MS apart into a ring of one byte per joint per frame, so
+# whatever drives the hand (gestures, walks, calibration) is captured. The
+# ring is allocated once, before the first recording starts, and sampling
+# allocates nothing. At 20 Hz the 64 KB ring holds 4096 frames, 204.8 s of
+# motion; after that the oldest frames are overwritten.
+#
+# Holding black with red, blue or yellow on the remote starts recording for
+# that button and the same again stops it and saves. From then on the button
+# plays the recording instead of its gesture; a recording shorter than two
+# frames removes it again. Black on its own runs its gesture when let go,
+# unless a recording is going on.
+#
+# Recording files, delta encoded:
+#   0  b"RC", version, frame period in ms, frame count (2 bytes, little endian)
+#   6  first frame, one angle per joint, 255 for a joint never written
+#      then per frame a 2 byte mask of the joints that changed (little
+#      endian) and one byte per changed joint, the change modulo 256
+RECORD_MS = 50
+RECORD_FRAMES = 4096
+RECORD_VERSION = 1
+RECORD_HEADER = 6
+RECORD_FILE = "rec%d.bin"
+RECORD_UNSET = 255
+RECORD_BUTTON = const(0x20)  # black
+RECORD_SLOTS = const(0x0E)   # red, blue, yellow
+
+record_buf = None
+record_head = 0
+record_count = 0
+record_slot = -1  # Button being recorded, -1 when not recording
+record_wake = asyncio.Event()
+recorded = 0  # Mask of the buttons with a recording
+
+
+def find_recordings():
+    global recorded
+    recorded = 0
+    for bit in range(len(BUTTON_COMMANDS)):
+        try:
+            os.stat(RECORD_FILE % bit)
+            recorded |= 1 << bit
+        except OSError:
+            pass
+
+
+def toggle_recording(bit):
+    global record_buf, record_head, record_count, record_slot
+    if record_slot < 0:
+        if record_buf is None:
+            record_buf = bytearray(RECORD_FRAMES * JOINTS)
+        record_head = 0
+        record_count = 0
+        record_slot = bit
+        record_wake.set()
+        print("recording button", bit)
+    else:
+        slot = record_slot
+        record_slot = -1
+        save_recording(slot)
+
+
+def save_recording(slot):
+    """ Write the ring out oldest frame first, or drop a too short recording """
+    global recorded
+    name = RECORD_FILE % slot
+    if record_count < 2:
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+        recorded &= ~(1 << slot)
+        print("recording removed from button", slot)
+        return
+    first = (record_head - record_count) % RECORD_FRAMES
+    frame = bytearray(2 + JOINTS)
+    try:
+        with open(name, "wb") as f:
+            f.write(bytes((ord("R"), ord("C"), RECORD_VERSION, RECORD_MS,
+                           record_count & 0xFF, record_count >> 8)))
+            prev = first * JOINTS
+            f.write(record_buf[prev:prev + JOINTS])
+            for i in range(1, record_count):
+                base = (first + i) % RECORD_FRAMES * JOINTS
+                mask = 0
+                n = 2
+                for j in range(JOINTS):
+                    delta = (record_buf[base + j] - record_buf[prev + j]) & 0xFF
+                    if delta:
+                        mask |= 1 << j
+                        frame[n] = delta
+                        n += 1
+                frame[0] = mask & 0xFF
+                frame[1] = mask >> 8
+                f.write(frame[:n])
+                prev = base
+    except OSError as e:
+        print("Could not save recording:", e)
+        return
+    recorded |= 1 << slot
+    print("recorded", record_count * RECORD_MS, "ms on button", slot)
+
+
+async def record_task():
+    """ Sample the hand into the ring every RECORD_MS while recording """
+    global record_head, record_count
+    while True:
+        while record_slot < 0:
+            record_wake.clear()
+            await record_wake.wait()
+        next_tick = time.ticks_ms()
+        while record_slot >= 0:
+            t0 = time.ticks_us()
+            base = record_head * JOINTS
+            angles = hand.angles
+            for j in range(JOINTS):
+                angle = angles[j]
+                if angle == KEEP:
+                    angle = RECORD_UNSET
+                elif angle < 0:
+                    angle = 0
+                elif angle > 180:
+                    angle = 180
+                record_buf[base + j] = angle
+            record_head = (record_head + 1) % RECORD_FRAMES
+            if record_count < RECORD_FRAMES:
+                record_count += 1
+            stats.tick(TASK_RECORD, t0)
+            next_tick = time.ticks_add(next_tick, RECORD_MS)
+            delay = time.ticks_diff(next_tick, time.ticks_ms())
+            await asyncio.sleep_ms(delay if delay > 0 else 0)
+
+
+# Buffers playback reads each frame into, so replaying allocates nothing
+_play_mask = bytearray(2)
+_play_pose = array('h', [KEEP] * JOINTS)
+_play_delta_buf = bytearray(JOINTS)
+_play_deltas = tuple(memoryview(_play_delta_buf)[:n] for n in range(JOINTS + 1))
+
+
+def _bit_count(mask):
+    n = 0
+    while mask:
+        mask &= mask - 1
+        n += 1
+    return n
+
+
+async def play_recording(slot):
+    try:
+        f = open(RECORD_FILE % slot, "rb")
+    except OSError:
+        return
+    with f:
+        header = f.read(RECORD_HEADER)
+        if len(header) < RECORD_HEADER or header[0:3] != bytes((ord("R"), ord("C"), RECORD_VERSION)):
+            print("bad recording on button", slot)
+            return
+        period = header[3]
+        frames = header[4] | header[5] << 8
+        pose = bytearray(f.read(JOINTS))
+        angles = _play_pose
+        next_tick = time.ticks_ms()
+        for i in range(frames):
+            if i:
+                f.readinto(_play_mask)
+                mask = _play_mask[0] | _play_mask[1] << 8
+                deltas = _play_deltas[_bit_count(mask)]
+                f.readinto(deltas)
+                d = 0
+                for j in range(JOINTS):
+                    if mask & (1 << j):
+                        pose[j] = (pose[j] + deltas[d]) & 0xFF
+                        d += 1
+            for j in range(JOINTS):
+                angles[j] = KEEP if pose[j] == RECORD_UNSET else pose[j]
+            # Dropped if the queue is full, like a walk's poses
+            start_move(angles, 0, STEP)
+            next_tick = time.ticks_add(next_tick, period)
+            delay = time.ticks_diff(next_tick, time.ticks_ms())
+            await asyncio.sleep_ms(delay if delay > 0 else 0)
+
+
+def _playback(slot):
+    async def gesture():
+        await play_recording(slot)
+    return gesture
+
+# Gestures for the recorded buttons, made once so dispatching allocates nothing
+PLAYBACKS = tuple(_playback(bit) for bit in range(len(BUTTON_COMMANDS)))
+
+COMMAND_GESTURES[CMD_CROUCH] = crouch_pos
+COMMAND_GESTURES[CMD_GET_UP] = get_up
+COMMAND_GESTURES[CMD_WALK_FORWARD] = crouch_gait
+COMMAND_GESTURES[CMD_WALK_BACKWARD] = crouch_gait
+COMMAND_GESTURES[CMD_STAND_WALK] = stand_gait
+# Buttons bound by the scripts, the built-in ones and those on flash
+for bit, name in script_bindings.items():
+    COMMAND_GESTURES[BUTTON_COMMANDS[bit]] = _script(name)
+
+find_recordings()
 
     
-while True:
-    asyncio.run(main())
+if __name__ == "__main__":
+    while True:
+        asyncio.run(main())
 
 
 
@@ -0,0 +1,92 @@
+""" Host simulation of the robot and the remote.
+
+install() puts the fake MicroPython modules in sim/modules ahead of
+everything else on sys.path and gives time MicroPython's ticks functions,
+and gc MicroPython's heap figures, so robot.py and remote_control.py
+import and run under CPython. The fakes:
+
+  machine   Pin and ADC read scripted traces, PWM logs timestamped servo
+            angles, I2C counts the bytes written
+  aioble    an in-process BLE link: the remote's advertising events are
+            heard when they fall in the robot's scan windows, and
+            notifications and reads arrive on the connection interval the
+            robot asked for
+  ssd1306   the MicroPython driver's command stream over the fake I2C
+  framebuf  enough of FrameBuffer for the remote's display
+
+sim.run loads both scripts and runs them together in one event loop.
+"""
+import gc
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+
+_t0 = time.monotonic_ns()
+
+
+def ticks_ms():
+    return (time.monotonic_ns() - _t0) // 1_000_000
+
+
+def ticks_us():
+    return (time.monotonic_ns() - _t0) // 1_000
+
+
+def ticks_diff(a, b):
+    return a - b
+
+
+def ticks_add(a, b):
+    return a + b
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1_000_000)
+
+
+def mem_alloc():
+    # CPython has no heap figures like MicroPython's; count live blocks
+    return sys.getallocatedblocks()
+
+
+def mem_free():
+    return 0
+
+
+_threshold = -1
+
+
+def threshold(amount=None):
+    # CPython collects on its own schedule; only remember the setting
+    global _threshold
+    if amount is None:
+        return _threshold
+    _threshold = amount
+
+
+def percentile(values, p):
+    """ The p-th percentile of values, nan if there are none """
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def install():
+    """ Make the fakes importable under the MicroPython module names """
+    if MODULES not in sys.path:
+        sys.path.insert(0, MODULES)
+    if ROOT not in sys.path:
+        sys.path.insert(1, ROOT)
+    for name in ("ticks_ms", "ticks_us", "ticks_diff", "ticks_add", "sleep_ms", "sleep_us"):
+        setattr(time, name, globals()[name])
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = mem_free
+    gc.threshold = threshold
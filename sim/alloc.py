@@ -0,0 +1,196 @@
+""" Heap allocations and garbage collections on the robot while it walks.
+
+    python -m sim.alloc [--walk-ms MS] [--top N] [--state DIR]
+
+CPython is no guide to what allocates on MicroPython: it keeps freed floats
+for reuse and boxes every int above 256, where MicroPython boxes every
+float and no int below 2**30. So robot.py is loaded with every computed
+expression wrapped in a check, and a value counts as a heap allocation when
+MicroPython would have had to allocate it: a new float, big int, string,
+bytes, container, coroutine or task. Values that already exist elsewhere,
+such as a float read from a global, do not count.
+
+The remote then streams a walk: the left stick is held forward for
+--walk-ms, released, the right stick is held as long, released, and the
+robot is left idle. Reported are the allocations per received frame in the
+receive path (which includes aioble's copy of the value), per motion tick,
+and in total, the lines that allocate most, and every gc.collect() the
+robot makes, with the longest and whether any fell inside a gesture. Pause
+times are CPython's, only there to compare runs.
+"""
+import argparse
+import ast
+import asyncio
+import gc
+import importlib
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+
+from . import ROOT, install
+from .run import LEFT_STICK_1, RIGHT_STICK_1
+
+IDLE_MS = 1500
+SMALL_INT = 1 << 30
+
+# Functions whose allocations count towards each path
+RECEIVE = ("receive_notifications", "receive_polling", "decode", "submit", "holding",
+           "lookup_gesture", "command_policy")
+MOTION = ("motion_core", "motion_tick", "_take", "ease", "start_move", "_queue", "move_to",
+          "busy_channels", "run_gait", "gait_pose", "gait_rate", "set", "write", "commit")
+
+counts = Counter()  # Line -> allocations
+
+
+def _allocates(value):
+    kind = type(value)
+    if kind is int:
+        return not -SMALL_INT <= value < SMALL_INT
+    if kind in (float, str, bytes, bytearray, tuple, list, dict, set, memoryview):
+        return True
+    if kind is types.CoroutineType:
+        return value.cr_code.co_filename == ROBOT
+    return isinstance(value, asyncio.Task)
+
+
+def _count(value, line):
+    # A fresh value is only referenced from here and getrefcount's argument
+    if sys.getrefcount(value) <= 2 and _allocates(value):
+        counts[line] += 1
+    return value
+
+
+class Instrument(ast.NodeTransformer):
+    """ Wraps every expression that computes a new value in _count() """
+
+    WRAP = (ast.BinOp, ast.UnaryOp, ast.Call, ast.Await, ast.Subscript, ast.JoinedStr,
+            ast.ListComp, ast.DictComp, ast.SetComp, ast.List, ast.Dict, ast.Set)
+
+    def generic_visit(self, node):
+        node = super().generic_visit(node)
+        constant_tuple = isinstance(node, ast.Tuple) and \
+            all(isinstance(e, ast.Constant) for e in node.elts)
+        wrap = isinstance(node, self.WRAP) or isinstance(node, ast.Tuple) and not constant_tuple
+        if wrap and isinstance(getattr(node, "ctx", ast.Load()), ast.Load):
+            call = ast.Call(ast.Name("__count__", ast.Load()), [node, ast.Constant(node.lineno)], [])
+            return ast.copy_location(call, node)
+        return node
+
+
+ROBOT = os.path.join(ROOT, "robot.py")
+
+
+def functions(tree):
+    """ Line -> name of the innermost function it is in """
+    names = {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            for line in range(node.lineno, node.end_lineno + 1):
+                if line not in names or names[line][0] < node.lineno:
+                    names[line] = (node.lineno, node.name)
+    return {line: name for line, (_, name) in names.items()}
+
+
+def load(state_dir=None):
+    """ Import the remote as it is and the robot instrumented """
+    install()
+    os.chdir(state_dir or tempfile.mkdtemp(prefix="thing-alloc-"))
+    remote = importlib.import_module("remote_control")
+    with open(ROBOT) as f:
+        source = f.read()
+    tree = ast.parse(source, ROBOT)
+    owner = functions(tree)
+    tree = ast.fix_missing_locations(Instrument().visit(tree))
+    robot = types.ModuleType("robot")
+    robot.__file__ = ROBOT
+    robot.__count__ = _count
+    sys.modules["robot"] = robot
+    exec(compile(tree, ROBOT, "exec"), robot.__dict__)
+    return robot, remote, owner, source.splitlines()
+
+
+class Probe:
+    """ Counts frames, motion ticks and the robot's collections """
+
+    def __init__(self, robot):
+        self.frames = 0
+        self.ticks = 0
+        self.collections = []  # (us, during a gesture)
+        decode = robot.decode
+        commit = robot.hand.commit
+        collect = gc.collect
+
+        def probe_decode(data):
+            self.frames += 1
+            decode(data)
+
+        def probe_commit():
+            self.ticks += 1
+            commit()
+
+        def probe_collect(*args):
+            busy = robot.dispatcher.running is not None or bool(robot.busy_channels())
+            t0 = time.perf_counter_ns()
+            result = collect(*args)
+            self.collections.append(((time.perf_counter_ns() - t0) // 1000, busy))
+            return result
+
+        robot.decode = probe_decode
+        robot.hand.commit = probe_commit
+        gc.collect = probe_collect
+
+
+async def walk(robot, remote, walk_ms):
+    import machine
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    try:
+        deadline = time.ticks_ms() + 30000
+        while not (remote.connected and robot.link_state == robot.STATE_STREAM):
+            if time.ticks_ms() > deadline:
+                raise RuntimeError("remote never connected")
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+        # Connecting and the boot are not what is being measured
+        counts.clear()
+        start = time.ticks_ms() + 50
+        machine.trace_adc(LEFT_STICK_1, [(start, 65535), (start + walk_ms, 32768)])
+        start += walk_ms + IDLE_MS
+        machine.trace_adc(RIGHT_STICK_1, [(start, 65535), (start + walk_ms, 32768)])
+        await asyncio.sleep((start + walk_ms + IDLE_MS - time.ticks_ms()) / 1000)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--walk-ms", type=int, default=5000)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--state")
+    args = parser.parse_args()
+    robot, remote, owner, lines = load(args.state)
+    probe = Probe(robot)
+    asyncio.run(walk(robot, remote, args.walk_ms))
+
+    def total(names):
+        return sum(n for line, n in counts.items() if owner.get(line) in names)
+
+    frames = max(probe.frames, 1)
+    ticks = max(probe.ticks, 1)
+    print()
+    print("frames %d, motion ticks %d" % (probe.frames, probe.ticks))
+    print("allocations: %.2f per frame received, %.2f per motion tick, %d in all" % (
+        total(RECEIVE) / frames, total(MOTION) / ticks, sum(counts.values())))
+    for line, n in counts.most_common(args.top):
+        print("  %6d  %-20s %4d: %s" % (n, owner.get(line, ""), line, lines[line - 1].strip()))
+    pauses = [us for us, _ in probe.collections]
+    print("collections %d, longest %d us, during a gesture %d" % (
+        len(pauses), max(pauses, default=0), sum(busy for _, busy in probe.collections)))
+
+
+if __name__ == "__main__":
+    main()
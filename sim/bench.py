@@ -0,0 +1,248 @@
+""" Input-to-motion benchmarks on the host simulation.
+
+    python -m sim.bench [--out FILE] [--profile N] [--only NAME ...]
+
+Connects the simulated remote and robot, then works every remote input in
+turn: each button is pressed for PRESS_MS, each stick is held for HOLD_MS.
+For each input it records, in ms:
+
+  button_to_notify     input change to the remote's notification
+  notify_to_dispatch   notification to the robot's dispatcher
+  dispatch_to_write    dispatch to the first servo write
+  gesture, nominal     gesture run time and the time its tables add up to;
+                       for walks, how long the stick was held
+  release_to_stop      walks: stick released to the walk stopping
+  stall                longest event loop stall during the gesture
+  ble_packets_per_s    notifications while the input was being handled
+
+Results are written as JSON (bench.json by default), with the commit they
+were measured on, so runs can be compared between commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import ROOT
+from . import run as sim
+from .run import WHITE, BLACK, GREEN, RED, BLUE, YELLOW, LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1
+
+PRESS_MS = 200
+HOLD_MS = 3000
+SETTLE_MS = 500
+TIMEOUT_MS = 30000
+
+# (name, kind, pin, value, gesture)
+INPUTS = (
+    ("green", "pin", GREEN, 1, "finger_stamp"),
+    ("red", "pin", RED, 1, "crouch_pos"),
+    ("blue", "pin", BLUE, 1, "get_up"),
+    ("yellow", "pin", YELLOW, 1, "point_finger"),
+    ("white", "pin", WHITE, 1, "bow_down"),
+    ("black", "pin", BLACK, 1, "rise_up"),
+    ("left stick 1 forward", "adc", LEFT_STICK_1, 65535, "crouch_gait"),
+    ("left stick 1 back", "adc", LEFT_STICK_1, 0, "crouch_gait"),
+    ("left stick 2", "adc", LEFT_STICK_2, 65535, None),
+    ("right stick 1 forward", "adc", RIGHT_STICK_1, 65535, "stand_gait"),
+)
+HELD = ("crouch_gait", "stand_gait")
+
+
+def script_ms(robot, address):
+    """ Nominal run time of a compiled gesture script """
+    code = robot.script_code
+    total = 0
+    stack = []
+    pc = address
+    while True:
+        op = code[pc]
+        if op == robot.OP_POSE:
+            mask = code[pc + 1] & 0xFFFF
+            pc += 2 + bin(mask).count("1")
+        elif op == robot.OP_MOVE:
+            total += code[pc + 1]
+            pc += 3
+        elif op == robot.OP_WAIT:
+            total += code[pc + 1]
+            pc += 2
+        elif op == robot.OP_REPEAT:
+            stack.append([pc + 2, code[pc + 1]])
+            pc += 2
+        elif op == robot.OP_NEXT:
+            stack[-1][1] -= 1
+            if stack[-1][1] > 0:
+                pc = stack[-1][0]
+            else:
+                stack.pop()
+                pc += 1
+        elif op == robot.OP_CALL:
+            stack.append([pc + 2, -1])
+            pc = code[pc + 1]
+        else:
+            if not stack:
+                return total
+            pc = stack.pop()[0]
+
+
+def nominal_ms(robot, gesture):
+    if gesture in robot.script_gestures:
+        return script_ms(robot, robot.script_gestures[gesture])
+    tables = {"crouch_pos": robot.CROUCH_POS, "get_up": robot.GET_UP}
+    if gesture in tables:
+        return sum(tables[gesture][1])
+    return HOLD_MS
+
+
+class Probe:
+    """ Timestamps the points the benchmarks measure between """
+
+    def __init__(self, robot, remote):
+        self.notifies = []
+        self.dispatches = []
+        self.gestures = []
+        characteristic = remote.button_characteristic
+        notify = characteristic.notify
+        submit = robot.dispatcher.submit
+        run_gesture = robot.run_gesture
+
+        def probe_notify(connection, data=None):
+            self.notifies.append(time.ticks_ms())
+            notify(connection, data)
+
+        def probe_submit(command):
+            self.dispatches.append((time.ticks_ms(), command))
+            submit(command)
+
+        async def probe_run_gesture(gesture):
+            start = time.ticks_ms()
+            try:
+                await run_gesture(gesture)
+            finally:
+                self.gestures.append((start, time.ticks_ms(), robot.max_stall_ms))
+
+        characteristic.notify = probe_notify
+        robot.dispatcher.submit = probe_submit
+        robot.run_gesture = probe_run_gesture
+
+
+def first_after(times, t):
+    for x in times:
+        if x >= t:
+            return x
+    return None
+
+
+def diff(a, b):
+    return None if a is None or b is None else a - b
+
+
+async def measure(robot, remote, probe, entry):
+    import aioble
+    import machine
+    name, kind, pin, value, gesture = entry
+    held = gesture in HELD
+    start = time.ticks_ms() + 50
+    release = start + (HOLD_MS if held else PRESS_MS)
+    if kind == "pin":
+        machine.trace_pin(pin, [(start, value), (release, 0)])
+    else:
+        machine.trace_adc(pin, [(start, value), (release, 32768)])
+    packets = aioble.stats["notifications"]
+    gestures = len(probe.gestures)
+    deadline = release + (TIMEOUT_MS if gesture else SETTLE_MS)
+    while time.ticks_ms() < deadline:
+        if gesture and len(probe.gestures) > gestures and robot.dispatcher.running is None:
+            break
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(SETTLE_MS / 1000)
+    window = (time.ticks_ms() - start) / 1000
+
+    notify = first_after(probe.notifies, start)
+    dispatch = None
+    if gesture and notify is not None:
+        dispatch = first_after([t for t, _ in probe.dispatches], notify)
+    write = first_after([t for t, _, _ in machine.PWM.log], dispatch) if dispatch is not None else None
+    result = {
+        "gesture": gesture,
+        "button_to_notify": diff(notify, start),
+        "notify_to_dispatch": diff(dispatch, notify),
+        "dispatch_to_write": diff(write, dispatch),
+        "ble_packets_per_s": round((aioble.stats["notifications"] - packets) / window, 2),
+    }
+    if gesture and len(probe.gestures) > gestures:
+        began, ended, stall = probe.gestures[gestures]
+        result["gesture_ms"] = ended - began
+        result["nominal_ms"] = nominal_ms(robot, gesture) if not held else release - began
+        result["stall"] = stall
+        if held:
+            result["release_to_stop"] = ended - release
+    return result
+
+
+async def bench(robot, remote, names):
+    probe = Probe(robot, remote)
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    results = {}
+    try:
+        deadline = time.ticks_ms() + TIMEOUT_MS
+        while not (remote.connected and robot.link_state == robot.STATE_STREAM):
+            if time.ticks_ms() > deadline:
+                raise RuntimeError("remote never connected")
+            await asyncio.sleep(0.01)
+        results["connect_ms"] = time.ticks_ms()
+        # Let the remote's initial frame go through first
+        await asyncio.sleep(SETTLE_MS / 1000)
+        results["inputs"] = {}
+        for entry in INPUTS:
+            if not names or entry[0] in names:
+                print("measuring", entry[0], file=sys.stderr)
+                results["inputs"][entry[0]] = await measure(robot, remote, probe, entry)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--profile", type=int, default=1)
+    parser.add_argument("--only", nargs="*", default=())
+    parser.add_argument("--state")
+    args = parser.parse_args()
+    out = os.path.abspath(args.out)
+    state = args.state or tempfile.mkdtemp(prefix="thing-bench-")
+    # Both ends start on the requested link profile
+    with open(os.path.join(state, "profile.txt"), "w") as f:
+        f.write(str(args.profile))
+    with open(os.path.join(state, "remote.json"), "w") as f:
+        json.dump({"last": None, "remotes": {}, "profile": args.profile}, f)
+    robot, remote = sim.load(state)
+    import aioble
+    results = {
+        "commit": commit(),
+        "python": sys.version.split()[0],
+        "profile": args.profile,
+    }
+    results.update(asyncio.run(bench(robot, remote, args.only)))
+    results["ble"] = dict(aioble.stats)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
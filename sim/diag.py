@@ -0,0 +1,102 @@
+""" Reading the robot's diagnostics record from outside, as a phone would.
+
+    python -m sim.diag [--periods N]
+
+Runs the simulated remote and robot together. Once the link is streaming,
+a third device scans for the robot's diagnostics advert (robot.DIAG_NAME),
+connects, and reads the diagnostics characteristic every
+diagnostics.PERIOD_MS for --periods periods, while the remote keeps
+streaming to the robot.
+
+Every record read is printed the way the robot's _DEBUG line prints it.
+Exits non-zero if the robot can't be found or connected to, a record isn't
+one Stats record long, the records don't move on from one period to the
+next, or the remote link drops while the record is being read.
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from array import array
+
+from . import run as sim
+
+SCAN_MS = 5000
+TIMEOUT_MS = 15000
+
+
+async def streaming(robot):
+    t0 = time.ticks_ms()
+    while not (robot.connected and robot.link_state == robot.STATE_STREAM):
+        if time.ticks_ms() - t0 > TIMEOUT_MS:
+            raise RuntimeError("the robot never connected to the remote")
+        await asyncio.sleep(0.01)
+    return robot.link_connection
+
+
+async def find(robot):
+    """ Scan for the robot's diagnostics advert; returns its device """
+    import aioble
+    # A phone in the foreground scans all the time
+    async with aioble.scan(SCAN_MS, interval_us=30000, window_us=30000, active=True) as scanner:
+        async for result in scanner:
+            if result.name() == robot.DIAG_NAME and robot._DIAG_UUID in result.services():
+                return result.device
+    raise RuntimeError("no %s advert within %d ms" % (robot.DIAG_NAME, SCAN_MS))
+
+
+async def read_records(robot, periods):
+    import diagnostics
+    device = await find(robot)
+    records = []
+    async with await device.connect() as connection:
+        service = await connection.service(robot._DIAG_UUID)
+        characteristic = await service.characteristic(robot._DIAG_STATS_UUID)
+        for _ in range(periods):
+            await asyncio.sleep(diagnostics.PERIOD_MS / 1000)
+            records.append(array("i", bytes(await characteristic.read())))
+    return records
+
+
+async def session(robot, remote, periods):
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    try:
+        link = await streaming(robot)
+        records = await read_records(robot, periods)
+        return records, robot.link_connection is link and robot.connected
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--periods", type=int, default=3)
+    args = parser.parse_args()
+    robot, remote = sim.load(tempfile.mkdtemp(prefix="thing-diag-"))
+    import diagnostics
+    errors = []
+    try:
+        records, linked = asyncio.run(session(robot, remote, args.periods))
+    except RuntimeError as e:
+        records, linked = [], True
+        errors.append(str(e))
+    for record in records:
+        if len(record) != robot.stats.width:
+            errors.append("record of %d fields, expected %d" % (len(record), robot.stats.width))
+            continue
+        print(robot.stats.report(record))
+    stamps = [record[diagnostics.F_MS] for record in records]
+    if records and (not all(stamps) or stamps != sorted(set(stamps))):
+        errors.append("records didn't move on each period: %s" % stamps)
+    if not linked:
+        errors.append("the remote link dropped while reading diagnostics")
+    for error in errors:
+        print(error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+""" The robot's dispatcher and motion queue under streamed remote input.
+
+    python -m sim.dispatch [--seed N]
+
+Runs robot.py's dispatcher with the motion core on a host thread and feeds
+decode() input as the remote would send it, without the radio in between:
+
+  legacy    x every 10 ms for a second, as the old remote sent a held
+            stick, then !
+  timeout   x every 10 ms for a second and then nothing, as when the
+            release is lost; the walk has to end on HOLD_TIMEOUT_MS
+  frames    frames with the left stick held forward, repeated every
+            HEARTBEAT_MS, then a frame with it let go
+  mashing   random buttons pressed and released every 30 ms for two
+            seconds
+
+While each runs, the dispatcher's waiting command and the motion queue's
+depth are sampled every millisecond. Reported per scenario: the deepest
+each got and the release to stop latency, from the last input (the
+release, or for timeout the last x) to the last move the walk queued and
+the motion core finishing it. For mashing it is how long the gestures
+took to drain once the buttons stopped. Exits non-zero if the motion queue
+gets more than MAX_DEPTH deep, more than one command waits, or a walk
+takes longer than the bound to stop.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from . import install
+
+MAX_DEPTH = 4
+STOP_MS = 100  # Release to stop, over HOLD_TIMEOUT_MS for timeout
+DRAIN_MS = 10000
+HOLD_MS = 1000
+QUIET_MS = 300  # No moves and nothing busy for this long means stopped
+
+
+class Probe:
+    """ Samples the queues and notes every move queued """
+
+    def __init__(self, robot):
+        self.robot = robot
+        self.depth = 0
+        self.waiting = 0
+        self.last_move_us = 0
+        self.last_busy_us = 0
+        start_move = robot.start_move
+
+        def probe_start_move(pose, ms, easing):
+            channels = start_move(pose, ms, easing)
+            self.last_move_us = time.ticks_us()
+            self.depth = max(self.depth, robot.motion_queue.count())
+            return channels
+
+        robot.start_move = probe_start_move
+
+    def reset(self):
+        self.depth = self.waiting = 0
+
+    def sample(self):
+        robot = self.robot
+        self.depth = max(self.depth, robot.motion_queue.count())
+        self.waiting = max(self.waiting, 0 if robot.dispatcher.pending is None else 1)
+        if robot.busy_channels():
+            self.last_busy_us = time.ticks_us()
+
+    async def stopped(self, since_us):
+        """ Wait for the hand to go quiet; returns ms from since_us to the
+        last move or busy sample """
+        t0 = time.ticks_ms()
+        while True:
+            self.sample()
+            last = max(self.last_move_us, self.last_busy_us)
+            if time.ticks_us() - last > QUIET_MS * 1000 and self.robot.dispatcher.running is None:
+                return max(0, last - since_us) / 1000
+            if time.ticks_ms() - t0 > DRAIN_MS:
+                raise RuntimeError("the hand never stopped")
+            await asyncio.sleep(0.001)
+
+
+async def feed(probe, inputs):
+    """ Decode each (ms, data) at its time from now; returns the ticks_us of
+    the last """
+    t0 = time.ticks_ms()
+    last = 0
+    for ms, data in inputs:
+        while time.ticks_ms() - t0 < ms:
+            probe.sample()
+            await asyncio.sleep(0.001)
+        probe.robot.decode(data)
+        last = time.ticks_us()
+    return last
+
+
+def frame(robot, seq, buttons=0, left=0):
+    return bytes((0x80 | robot.FRAME_VERSION, seq & 0xFF, robot.link_profile << robot.PROFILE_SHIFT | buttons,
+                  left & 0xFF, 0, 0))
+
+
+def scenarios(robot, rng):
+    """ name -> (inputs, stop bound in ms) """
+    held = [(ms, b"x") for ms in range(0, HOLD_MS, 10)]
+    frames = [(ms, frame(robot, n, left=127)) for n, ms in enumerate(range(0, HOLD_MS * 2, 500))]
+    frames.append((HOLD_MS * 2, frame(robot, len(frames))))
+    mashing = []
+    buttons = 0
+    for n, ms in enumerate(range(0, 2000, 30)):
+        # No black: it is the record modifier and part of the combos
+        buttons = rng.randrange(0x20) if not buttons else 0
+        mashing.append((ms, frame(robot, n, buttons)))
+    mashing.append((2000, frame(robot, len(mashing))))
+    return {
+        "legacy": (held + [(HOLD_MS, b"!")], STOP_MS),
+        "timeout": (held, robot.HOLD_TIMEOUT_MS + STOP_MS),
+        "frames": (frames, STOP_MS),
+        "mashing": (mashing, None),
+    }
+
+
+async def session(robot, rng):
+    probe = Probe(robot)
+    results = {}
+    for name, (inputs, bound) in scenarios(robot, rng).items():
+        robot.reset_decoder()
+        probe.reset()
+        last = await feed(probe, inputs)
+        results[name] = (probe.depth, probe.waiting, await probe.stopped(last), bound)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-dispatch-"))
+    import robot
+    robot.start_motion_core()
+    results = asyncio.run(session(robot, random.Random(args.seed)))
+    failed = False
+    for name, (depth, waiting, stop_ms, bound) in results.items():
+        print("%s: motion queue depth %d, commands waiting %d, %s %.1f ms" % (
+            name, depth, waiting, "drained in" if bound is None else "release to stop", stop_ms))
+        if depth > MAX_DEPTH or waiting > 1 or (bound is not None and stop_ms > bound):
+            print("  over the bounds: depth %d, waiting 1, stop %s ms" % (MAX_DEPTH, bound))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+""" Display traffic on the remote's I2C bus and what it does to the input loop.
+
+    python -m sim.display [--bus-hz HZ]
+
+Runs remote_control.py's input loop connected, with the I2C fake taking as
+long as the bytes would on a --bus-hz bus (400 kHz by default) and blocking
+the event loop while it does, as the Pico's I2C writes do. The same input
+trace is played twice: each button tapped in turn, then the left stick held
+forward and the right stick held out.
+
+  before    the remote as it was: every 10 ms pass clears the whole screen
+            and redraws it with the label of every held input, two full
+            frames each, from inside the input loop
+  after     display_task sends only the pages a label change touched, at
+            most once every DISPLAY_FRAME_MS
+
+Reported per scheme: I2C bytes/s and how late each pass of the input loop
+started against SAMPLE_MS (median, p99 and worst, in ms). Exits non-zero
+if the page scheme doesn't send fewer bytes or its p99 lateness reaches a
+whole SAMPLE_MS. Times are CPython's.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from . import install, percentile
+from .run import WHITE, BLACK, GREEN, RED, BLUE, YELLOW, LEFT_STICK_1, RIGHT_STICK_1
+
+TAP_MS = 200
+GAP_MS = 300
+STICK_MS = 2000
+SETTLE_MS = 300
+
+
+def trace(machine, start):
+    """ Play the input trace from start; returns when it ends """
+    t = start
+    for pin in (GREEN, RED, BLUE, YELLOW, WHITE, BLACK):
+        machine.trace_pin(pin, [(t, 1), (t + TAP_MS, 0)])
+        t += TAP_MS + GAP_MS
+    for pin in (LEFT_STICK_1, RIGHT_STICK_1):
+        machine.trace_adc(pin, [(t, 65535), (t + STICK_MS, 32768)])
+        t += STICK_MS + GAP_MS
+    return t
+
+
+def legacy_display(remote):
+    """ One pass of the old remote's display updates """
+    labels = [label for button, _, label in remote.BUTTONS if button.value()]
+    left = remote.left_thumb1.read_u16()
+    if left > 40000:
+        labels.append("CROUCH FWD")
+    if left < 20000:
+        labels.append("CROUCH BWD")
+    if remote.right_thumb1.read_u16() > 40000:
+        labels.append("STAND WALK")
+    for label in labels:
+        remote.clear_display()
+        remote.display.text(label, 20, 40)
+        remote.display.show()
+
+
+async def play(remote, machine, scheme):
+    """ Returns (I2C bytes/s, input loop lateness in us) """
+    passes = []
+    sample_inputs = remote.sample_inputs
+
+    def probe_sample_inputs():
+        passes.append(time.ticks_us())
+        if scheme == "before":
+            legacy_display(remote)
+        return sample_inputs()
+
+    remote.sample_inputs = probe_sample_inputs
+    tasks = [asyncio.create_task(remote.remote_task())]
+    if scheme == "after":
+        tasks.append(asyncio.create_task(remote.display_task()))
+    try:
+        await asyncio.sleep(SETTLE_MS / 1000)
+        start = time.ticks_ms() + 50
+        first = len(passes)
+        bytes0 = machine.I2C.bytes
+        end = trace(machine, start)
+        await asyncio.sleep((end - time.ticks_ms()) / 1000)
+        bytes_per_s = (machine.I2C.bytes - bytes0) * 1000 / (end - start)
+        await asyncio.sleep(SETTLE_MS / 1000)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        remote.sample_inputs = sample_inputs
+    # Lateness of each pass against the SAMPLE_MS the loop asked to sleep
+    late = [b - a - remote.SAMPLE_MS * 1000 for a, b in zip(passes[first:], passes[first + 1:])]
+    return bytes_per_s, late
+
+
+async def schemes(remote, machine):
+    results = {}
+    for scheme in ("before", "after"):
+        results[scheme] = await play(remote, machine, scheme)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--bus-hz", type=int, default=400_000)
+    args = parser.parse_args()
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-display-"))
+    import machine
+    count = machine.I2C._count
+
+    def timed_count(self, n):
+        # 9 clocks a byte, with the ACK; the CPU waits for the transfer
+        count(self, n)
+        time.sleep(n * 9 / args.bus_hz)
+
+    machine.I2C._count = timed_count
+    import remote_control as remote
+    remote.connected = True
+    remote.intro_done.set()
+    results = asyncio.run(schemes(remote, machine))
+    for scheme, (bytes_per_s, late) in results.items():
+        print("%s: %d I2C bytes/s, input loop late p50 %.1f ms p99 %.1f ms max %.1f ms" % (
+            scheme, bytes_per_s, percentile(late, 50) / 1000, percentile(late, 99) / 1000,
+            max(late) / 1000))
+    before, after = results["before"][0], results["after"][0]
+    failed = after >= before or percentile(results["after"][1], 99) >= remote.SAMPLE_MS * 1000
+    if before:
+        print("page updates send %.1f%% of the bytes" % (100 * after / before))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+""" Servo writes from the duty tables against converting every angle.
+
+    python -m sim.duty [--writes N] [--seed N]
+
+Loads robot.py against the fakes and checks that every joint's duty table
+holds, for every angle, what converting the angle through the joint's
+calibration gives, with the default calibration and with a random one
+(neutral, limits, direction and trim). Then times writes/sec for three
+ways of turning a joint and angle into the packed compare value the hand
+stores:
+
+  table       Hand.pack(): a clamp and one table lookup
+  integer     the same conversion duty_table() does, on every write
+  float       the servo library the hand used before: degrees to radians
+              to a pulse width in floating point
+
+Register stores are left out of all three, so what is timed is the
+conversion. Times are CPython's; on the Pico the float path also puts
+floats on the heap. Exits non-zero if a table entry is wrong.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+from . import install
+
+
+def convert(robot, j, angle, top):
+    """ Compare value for joint j at angle, worked out from its calibration """
+    angle = 0 if angle < 0 else 180 if angle > 180 else angle
+    neutral = robot.cal(robot.CAL_NEUTRAL, j) + robot.cal(robot.CAL_TRIM, j) - robot.CAL_TRIM_BIAS
+    direction = -1 if robot.cal(robot.CAL_REVERSED, j) else 1
+    a = neutral + direction * (angle - robot.NEUTRAL[j])
+    a = min(max(a, robot.cal(robot.CAL_LOW, j), 0), robot.cal(robot.CAL_HIGH, j), 180)
+    min_us = robot.SERVO_MIN_US[j]
+    us = min_us + (robot.SERVO_MAX_US[j] - min_us) * a // 180
+    return us * (top + 1) // (1_000_000 // robot.SERVO_FREQ)
+
+
+def check(robot):
+    hand = robot.hand
+    errors = []
+    for j in range(robot.JOINTS):
+        for angle in range(-5, 186):
+            want = convert(robot, j, angle, hand.top)
+            got = hand.duty[j][min(max(angle, 0), 180)]
+            if got != want:
+                errors.append("joint %d angle %d: table %d, converted %d" % (j, angle, got, want))
+    return errors
+
+
+def randomize(robot):
+    for j in range(robot.JOINTS):
+        robot.set_cal(robot.CAL_LOW, j, random.randrange(0, 60))
+        robot.set_cal(robot.CAL_HIGH, j, random.randrange(120, 181))
+        robot.set_cal(robot.CAL_NEUTRAL, j, random.randrange(30, 150))
+        robot.set_cal(robot.CAL_REVERSED, j, random.randrange(2))
+        robot.set_cal(robot.CAL_TRIM, j, robot.CAL_TRIM_BIAS + random.randrange(-20, 21))
+        robot.hand.recalibrate(j)
+
+
+def pack(hand, j, count):
+    """ The rest of Hand.pack(), once the compare value is known """
+    channel = hand.channel[j]
+    s = channel >> 1
+    if channel & 1:
+        hand.cc[s] = hand.cc[s] & 0xFFFF | count << 16
+    else:
+        hand.cc[s] = hand.cc[s] >> 16 << 16 | count
+    return 1 << s
+
+
+class FloatServo:
+    """ The conversion of the servo library the hand used to drive, which
+    went on to set duty_ns() """
+
+    def __init__(self, min_us=544.0, max_us=2400.0, min_deg=0.0, max_deg=180.0):
+        self._slope = (min_us - max_us) / (math.radians(min_deg) - math.radians(max_deg))
+        self._offset = min_us
+
+    def duty_ns(self, deg):
+        us = math.radians(deg) * self._slope + self._offset
+        return int(us * 1000.0)
+
+
+def rate(write, joints, angles):
+    t0 = time.perf_counter()
+    for j, angle in zip(joints, angles):
+        write(j, angle)
+    return len(angles) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--writes", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-duty-"))
+    import robot
+    hand = robot.hand
+    errors = check(robot)
+    randomize(robot)
+    errors += check(robot)
+    for error in errors[:10]:
+        print(error)
+    print("duty tables: %d errors" % len(errors))
+    joints = [random.randrange(robot.JOINTS) for _ in range(args.writes)]
+    angles = [random.randrange(181) for _ in range(args.writes)]
+    servos = [FloatServo() for _ in range(robot.JOINTS)]
+    table = rate(hand.pack, joints, angles)
+    integer = rate(lambda j, angle: pack(hand, j, convert(robot, j, angle, hand.top)),
+                   joints, angles)
+    period_ns = 1_000_000_000 // robot.SERVO_FREQ
+    floats = rate(lambda j, angle: pack(hand, j, servos[j].duty_ns(angle) * (hand.top + 1) // period_ns),
+                  joints, angles)
+    print("writes/s: table %d, integer conversion %d, float conversion %d; "
+          "the table is %.1fx and %.1fx as fast" % (table, integer, floats, table / integer, table / floats))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+""" The remote's input encoder replayed against input traces.
+
+    python -m sim.encoder [--trace FILE] [--seed N]
+
+Feeds button and thumbstick traces through remote_control.py's encoder on
+a simulated clock, sampling every SAMPLE_MS as remote_task does while
+connected, and counts the notifications it sends, which is also how often
+the robot wakes up to decode one. The same traces go through a model of
+the remote as it was before the encoder, which notified every held button
+and every stick past its threshold on every 10 ms pass. Built-in traces,
+with contact bounce on the buttons and noise on the sticks:
+
+  taps      each button tapped in turn
+  hold      green held for 3 s
+  walk      left stick pushed forward and held, then the right stick
+  idle      nothing pressed, sticks resting off centre
+
+--trace replays a recording instead, in sim.run's trace format. Reported
+per trace: notifications/s before and after. Exits non-zero if the frames
+sent miss a press or a release, or don't end with everything let go.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from . import install
+from .run import WHITE, BLACK, GREEN, RED, BLUE, YELLOW, LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1
+
+STICKS = (LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1)
+TAIL_MS = 1000  # Replayed past the last step of a trace
+
+clock = [0]
+
+
+def bouncy_press(start, length, rng):
+    """ Steps for a press with a few ms of contact bounce at each edge """
+    steps = []
+    for edge, value in ((start, 1), (start + length, 0)):
+        for n in range(rng.randrange(0, 4)):
+            steps += [(edge + 2 * n, value), (edge + 2 * n + 1, 1 - value)]
+        steps.append((edge + 8, value))
+    return steps
+
+
+def noisy(start, end, level, noise, rng):
+    """ ADC steps every 10 ms from start to end around level """
+    return [(ms, min(max(level + rng.randrange(-noise, noise + 1), 0), 65535))
+            for ms in range(start, end, 10)]
+
+
+def traces(rng):
+    """ name -> (pins, adcs, presses) """
+    rest = 32768 + 900
+    idle_adc = {pin: noisy(0, 10000, rest, 1500, rng) for pin in STICKS}
+    taps = {}
+    for n, pin in enumerate((GREEN, RED, BLUE, YELLOW, WHITE, BLACK)):
+        taps[pin] = bouncy_press(500 + n * 800, 150, rng)
+    walk = {pin: noisy(0, 12000, rest, 1500, rng) for pin in STICKS}
+    walk[LEFT_STICK_1] = noisy(0, 500, rest, 1500, rng) + \
+        [(500 + 10 * n, 32768 + 3200 * n) for n in range(10)] + \
+        noisy(600, 5500, 64500, 600, rng) + noisy(5500, 6000, rest, 1500, rng)
+    walk[RIGHT_STICK_1] = noisy(0, 6500, rest, 1500, rng) + noisy(6500, 11500, 64500, 600, rng) + \
+        noisy(11500, 12000, rest, 1500, rng)
+    return {
+        "taps": (taps, {pin: noisy(0, 5500, rest, 1500, rng) for pin in STICKS}, 6),
+        "hold": ({GREEN: bouncy_press(500, 3000, rng)},
+                 {pin: noisy(0, 4000, rest, 1500, rng) for pin in STICKS}, 1),
+        "walk": ({}, walk, 0),
+        "idle": ({}, idle_adc, 0),
+    }
+
+
+def legacy_sends(remote):
+    """ Notifications the remote used to send on one 10 ms pass """
+    sends = 0
+    for button, _, _ in remote.BUTTONS:
+        if button.value():
+            sends += 1
+    left = remote.left_thumb1.read_u16()
+    right = remote.right_thumb1.read_u16()
+    if left > 40000:
+        sends += 1
+    if left < 20000:
+        sends += 1
+    if right > 40000:
+        sends += 1
+    return sends
+
+
+def replay(remote, machine, pins, adcs, presses):
+    """ Replay one trace; returns (seconds, notifications before, after,
+    errors) """
+    machine._pin_traces.clear()
+    machine._adc_traces.clear()
+    for pin, steps in pins.items():
+        machine.trace_pin(pin, steps)
+    for pin, steps in adcs.items():
+        machine.trace_adc(pin, steps)
+    end = max(ms for steps in list(pins.values()) + list(adcs.values()) for ms, _ in steps) + TAIL_MS
+    # Start from a freshly connected remote with nothing held
+    remote.frame[remote.FRAME_BUTTONS] &= ~remote.BUTTON_MASK
+    for i in range(len(remote.STICKS)):
+        remote.frame[remote.FRAME_AXES + i] = 0
+        remote.stick_state[i] = 0
+    for i in range(len(remote.BUTTONS)):
+        remote.button_count[i] = 0
+    sent = []
+    notify = remote.button_characteristic.notify
+
+    def record(connection, data=None):
+        sent.append(bytes(data))
+        notify(connection, data)
+
+    remote.button_characteristic.notify = record
+    before = 0
+    first = True
+    try:
+        for ms in range(0, end, remote.SAMPLE_MS):
+            clock[0] = ms
+            before += legacy_sends(remote)
+            # remote_task, connected
+            changed = remote.sample_inputs() or first
+            first = False
+            if not changed and remote.HEARTBEAT_MS and remote.held():
+                changed = time.ticks_diff(time.ticks_ms(), remote.last_sent_ms) >= remote.HEARTBEAT_MS
+            if changed:
+                remote.send()
+    finally:
+        remote.button_characteristic.notify = notify
+    errors = []
+    mask = remote.BUTTON_MASK
+    down = up = 0
+    last = 0
+    for data in sent:
+        buttons = data[remote.FRAME_BUTTONS] & mask
+        down += bin(buttons & ~last).count("1")
+        up += bin(last & ~buttons).count("1")
+        last = buttons
+    if down != presses or up != presses:
+        errors.append("%d presses sent as %d down and %d up" % (presses, down, up))
+    final = sent[-1] if sent else bytes(remote.FRAME_LEN)
+    if final[remote.FRAME_BUTTONS] & mask or any(final[remote.FRAME_AXES:]):
+        errors.append("last frame still holds something: %s" % final.hex())
+    return end / 1000, before, len(sent), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--trace")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    install()
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+        pins = {int(pin): [tuple(step) for step in steps] for pin, steps in trace.get("pins", {}).items()}
+        adcs = {int(pin): [tuple(step) for step in steps] for pin, steps in trace.get("adc", {}).items()}
+        # A recording's presses are its rising edges
+        presses = sum(1 for steps in pins.values()
+                      for a, b in zip([(0, 0)] + sorted(steps), sorted(steps)) if b[1] and not a[1])
+        runs = {os.path.basename(args.trace): (pins, adcs, presses)}
+    else:
+        runs = traces(random.Random(args.seed))
+    os.chdir(tempfile.mkdtemp(prefix="thing-encoder-"))
+    time.ticks_ms = lambda: clock[0]
+    time.ticks_us = lambda: clock[0] * 1000
+    import machine
+    import remote_control as remote
+    remote.connected = True
+    failed = False
+    for name, (pins, adcs, presses) in runs.items():
+        seconds, before, after, errors = replay(remote, machine, pins, adcs, presses)
+        print("%s: %.1f s, notifications/s before %.1f, after %.1f" % (
+            name, seconds, before / seconds, after / seconds))
+        for error in errors:
+            print("  " + error)
+        failed = failed or bool(errors)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+""" Input frames from the remote's encoder through the robot's decoder.
+
+    python -m sim.frames [--frames N] [--seed N]
+
+Sets the remote's buttons and thumbsticks to random input states, lets
+remote_control.py's encoder sample them and send a frame, and decodes every
+frame with robot.py's decode(), checking what comes out against what went
+in:
+
+  round trip  the robot ends up with the buttons and stick positions the
+              remote sent, submits the command of every newly pressed
+              button and the walk (or idle) the sticks ask for, and keeps
+              its link profile
+  legacy      each old single byte command, g r b y w k x z v and !, and a
+              run of them in one write, is submitted as itself
+  rejected    a repeated sequence number, an unknown frame version and a
+              short frame submit nothing
+
+Black, the record modifier, is left out of the random states, and so are
+its combos. Reported: encoder and decoder frames/s (CPython's). Exits
+non-zero on any mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from . import install
+from .run import WHITE, GREEN, RED, BLUE, YELLOW, LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1
+
+BUTTON_PINS = (GREEN, RED, BLUE, YELLOW, WHITE)  # Mask bits 0 to 4
+STICK_PINS = (LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1)
+LEGACY = b"grbywkxzv!"
+
+
+def random_state(rng):
+    buttons = [rng.random() < 0.3 for _ in BUTTON_PINS]
+    sticks = [32768 if rng.random() < 0.3 else rng.randrange(65536) for _ in STICK_PINS]
+    return buttons, sticks
+
+
+def expected(robot, pressed, buttons, axes):
+    """ What decode() should submit for a frame """
+    commands = [robot.BUTTON_COMMANDS[bit] for bit in range(len(robot.BUTTON_COMMANDS))
+                if pressed & (1 << bit)]
+    if axes[0] > robot.AXIS_THRESHOLD:
+        commands.append(robot.CMD_WALK_FORWARD)
+    elif axes[0] < -robot.AXIS_THRESHOLD:
+        commands.append(robot.CMD_WALK_BACKWARD)
+    elif axes[2] > robot.AXIS_THRESHOLD:
+        commands.append(robot.CMD_STAND_WALK)
+    elif not buttons:
+        commands.append(robot.CMD_IDLE)
+    return commands
+
+
+def round_trip(robot, remote, machine, count, rng, submitted, sent):
+    """ Returns (errors, frames, encode seconds, decode seconds) """
+    errors = []
+    encode = decode = 0.0
+    frames = 0
+    previous = 0
+    for n in range(count):
+        buttons, sticks = random_state(rng)
+        for pin, down in zip(BUTTON_PINS, buttons):
+            machine.trace_pin(pin, [(0, int(down))])
+        for pin, raw in zip(STICK_PINS, sticks):
+            machine.trace_adc(pin, [(0, raw)])
+        t0 = time.perf_counter()
+        changed = False
+        for _ in range(remote.DEBOUNCE_SAMPLES):
+            changed = remote.sample_inputs() or changed
+        if changed:
+            remote.send()
+        encode += time.perf_counter() - t0
+        if not changed:
+            continue
+        frames += 1
+        data = sent[-1]
+        del submitted[:]
+        t0 = time.perf_counter()
+        robot.decode(data)
+        decode += time.perf_counter() - t0
+        mask = sum(1 << bit for bit, down in enumerate(buttons) if down)
+        if robot._last_buttons != mask:
+            errors.append("frame %d: buttons %02x decoded as %02x" % (n, mask, robot._last_buttons))
+        for i, raw in enumerate(sticks):
+            if robot.axes[i] != remote.axis(i) or abs(robot.axes[i] - remote.quantize(raw)) >= remote.AXIS_STEP:
+                errors.append("frame %d: stick %d at %d decoded as %d" % (n, i, raw, robot.axes[i]))
+        want = expected(robot, mask & ~previous, mask, robot.axes)
+        if submitted != want:
+            errors.append("frame %d: submitted %s, not %s" % (n, submitted, want))
+        if robot.link_profile != remote.link_profile:
+            errors.append("frame %d: profile %d became %d" % (n, remote.link_profile, robot.link_profile))
+        previous = mask
+    return errors, frames, encode, decode
+
+
+def legacy_and_rejected(robot, remote, submitted, sent):
+    errors = []
+    for command in LEGACY:
+        del submitted[:]
+        robot.decode(bytes([command]))
+        if submitted != [command]:
+            errors.append("legacy %r submitted %s" % (chr(command), submitted))
+    del submitted[:]
+    robot.decode(LEGACY)
+    if submitted != list(LEGACY):
+        errors.append("legacy run %r submitted %s" % (LEGACY, submitted))
+    last = bytes(sent[-1])
+    other = bytearray(last)
+    other[0] = 0x80 | (remote.FRAME_VERSION + 1)
+    other[1] = (other[1] + 1) & 0xFF
+    for name, data in (("repeated sequence number", last), ("unknown version", bytes(other)),
+                       ("short frame", last[:remote.FRAME_LEN - 1])):
+        del submitted[:]
+        robot.decode(data)
+        if submitted:
+            errors.append("%s submitted %s" % (name, submitted))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-frames-"))
+    import machine
+    import remote_control as remote
+    import robot
+    remote.connected = True
+    robot.link_profile = remote.link_profile
+    submitted = []
+    robot.dispatcher.submit = submitted.append
+    sent = []
+    notify = remote.button_characteristic.notify
+
+    def record(connection, data=None):
+        sent.append(bytes(data))
+        notify(connection, data)
+
+    remote.button_characteristic.notify = record
+    errors, frames, encode, decode = round_trip(
+        robot, remote, machine, args.frames, random.Random(args.seed), submitted, sent)
+    errors += legacy_and_rejected(robot, remote, submitted, sent)
+    for error in errors[:10]:
+        print(error)
+    print("%d frames, %d errors" % (frames, len(errors)))
+    print("frames/s: encode %d, decode %d" % (frames / encode, frames / decode))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+""" The remote-driven walks: joint limits and phase continuity.
+
+    python -m sim.gait
+
+Runs robot.py's dispatcher with the motion core on a host thread and walks
+the hand from decode(), recording the phase and pose of every gait tick:
+
+  speed     the left stick held forward at changing positions
+  reverse   forward, through the centre, backward and forward again, as
+            frames; the stick crossing the centre ends the walk each time
+  legacy    x then z then !, as the old remote sent them, reversing
+            without the walk ending
+  stand     the right stick pushed, let go briefly and pushed again
+
+Checked on every tick:
+
+  limits    every joint stays in 0..180 and within the range the cycle's
+            keyframes span
+  phase     the phase moves the way the walk is going, by no more than the
+            fastest stride rate allows for the time since the last tick,
+            also across a walk ending and the next one starting; the time
+            is the walk's own clock reading, so a loaded host can't make
+            the harness and the walk disagree about it
+  pose      no joint moves further than the steepest part of its cycle
+            allows for the phase step, plus a degree of rounding
+
+Exits non-zero on any failure.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from . import install
+
+HEARTBEAT_MS = 100
+SETTLE_MS = 600  # Past GAIT_RESUME_MS, so each scenario starts afresh
+
+
+class Recorder:
+    """ Wraps gait_pose to record (ms, cycle, phase, backward, pose), with ms
+    the clock reading run_gait stepped the phase by """
+
+    def __init__(self, robot):
+        self.ticks = []
+        gait_pose = robot.gait_pose
+
+        def recorded_gait_pose(cycle, phase):
+            pose = gait_pose(cycle, phase)
+            backward = robot.dispatcher.held == robot.CMD_WALK_BACKWARD
+            now = sys._getframe(1).f_locals["now"]
+            self.ticks.append((now, cycle, phase, backward, list(pose)))
+            return pose
+
+        robot.gait_pose = recorded_gait_pose
+
+
+def frame(robot, seq, axis=0, value=0):
+    data = bytearray((0x80 | robot.FRAME_VERSION, seq & 0xFF, robot.link_profile << robot.PROFILE_SHIFT,
+                      0, 0, 0))
+    data[robot.FRAME_AXES + axis] = value & 0xFF
+    return bytes(data)
+
+
+def held(robot, seq, start, ms, axis, value):
+    """ Frames holding a stick at value for ms, repeated every HEARTBEAT_MS """
+    return [(start + t, frame(robot, seq + n, axis, value))
+            for n, t in enumerate(range(0, ms, HEARTBEAT_MS))]
+
+
+def scenarios(robot):
+    speed = []
+    for n, value in enumerate((40, 80, 127, 60, 127)):
+        speed += held(robot, len(speed), n * 400, 400, 0, value)
+    speed.append((2000, frame(robot, len(speed))))
+    reverse = []
+    for n, value in enumerate((127, -127, 127)):
+        reverse += held(robot, len(reverse), n * 900, 800, 0, value)
+        reverse.append((n * 900 + 800, frame(robot, len(reverse))))
+    legacy = [(t, b"x") for t in range(0, 800, 10)] + [(t, b"z") for t in range(800, 1600, 10)]
+    legacy.append((1600, b"!"))
+    # The first push gets up before walking
+    stand = held(robot, 0, 0, 3000, 2, 127)
+    stand.append((3000, frame(robot, len(stand))))
+    stand += held(robot, len(stand), 3100, 800, 2, 127)
+    stand.append((3900, frame(robot, len(stand))))
+    return {"speed": speed, "reverse": reverse, "legacy": legacy, "stand": stand}
+
+
+async def feed(robot, inputs):
+    t0 = time.ticks_ms()
+    for ms, data in inputs:
+        delay = ms - (time.ticks_ms() - t0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        robot.decode(data)
+
+
+def slopes(robot, cycle):
+    """ Steepest degrees per phase unit of each joint over the cycle, and
+    the range its keyframes span """
+    poses, phases, _ = cycle
+    count = len(phases)
+    steepest = [0.0] * robot.JOINTS
+    spans = [None] * robot.JOINTS
+    for k in range(count):
+        end = phases[k + 1] if k + 1 < count else robot.PHASE_ONE
+        for j in range(robot.JOINTS):
+            a = poses[k * robot.JOINTS + j]
+            if a == robot.KEEP:
+                continue
+            b = poses[(k + 1) % count * robot.JOINTS + j]
+            steepest[j] = max(steepest[j], abs(b - a) / (end - phases[k]))
+            low, high = spans[j] or (a, a)
+            spans[j] = (min(low, a), max(high, a))
+    return steepest, spans
+
+
+def check(robot, ticks):
+    errors = []
+    limits = {}
+    half = robot.PHASE_ONE // 2
+    previous = None
+    for t, cycle, phase, backward, pose in ticks:
+        if id(cycle) not in limits:
+            limits[id(cycle)] = slopes(robot, cycle)
+        steepest, spans = limits[id(cycle)]
+        for j, angle in enumerate(pose):
+            if angle == robot.KEEP:
+                continue
+            low, high = spans[j]
+            if not 0 <= angle < robot.ANGLES or not low <= angle <= high:
+                errors.append("joint %d at %d, outside %d..%d" % (j, angle, low, high))
+        if previous and previous[1] is cycle:
+            t0, _, phase0, _, pose0 = previous
+            step = (phase - phase0 + half) % robot.PHASE_ONE - half
+            # A walk that resumes steps from when it started, which is no
+            # earlier than the last tick of the walk before
+            most = robot.GAIT_MAX_RATE * (t - t0) * (robot.PHASE_ONE // robot.RATE_ONE) // cycle[2]
+            if abs(step) > most:
+                errors.append("phase jumped %d in %d ms, at most %d" % (step, t - t0, most))
+            elif step and (step < 0) != backward:
+                errors.append("phase went %s walking %s" % (
+                    "back" if step < 0 else "on", "backward" if backward else "forward"))
+            for j, angle in enumerate(pose):
+                if angle == robot.KEEP:
+                    continue
+                if abs(angle - pose0[j]) > steepest[j] * abs(step) + 1:
+                    errors.append("joint %d moved %d degrees for a phase step of %d" % (
+                        j, angle - pose0[j], step))
+        previous = (t, cycle, phase, backward, pose)
+    return errors
+
+
+async def session(robot, recorder):
+    results = {}
+    for name, inputs in scenarios(robot).items():
+        robot.reset_decoder()
+        del recorder.ticks[:]
+        await feed(robot, inputs)
+        await asyncio.sleep(SETTLE_MS / 1000)
+        results[name] = (len(recorder.ticks), check(robot, recorder.ticks))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.parse_args()
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-gait-"))
+    import robot
+    recorder = Recorder(robot)
+    robot.start_motion_core()
+    results = asyncio.run(session(robot, recorder))
+    failed = False
+    for name, (ticks, errors) in results.items():
+        print("%s: %d gait ticks, %d errors" % (name, ticks, len(errors)))
+        for error in errors[:5]:
+            print("  " + error)
+        failed = failed or bool(errors) or not ticks
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
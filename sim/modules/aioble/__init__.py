@@ -0,0 +1,13 @@
+""" Fake aioble: one peripheral and one central in the same process.
+
+Connections, discovery, reads and notifications are delivered on the
+connection events of the interval the central asked for, and advertising
+and scanning meet on the peripheral's advertising interval, so link
+profiles show up in measured latency. stats counts what crossed the link.
+"""
+from .core import GattError, DeviceDisconnectedError, stats
+from .device import ADDR_PUBLIC, ADDR_RANDOM, Device, DeviceConnection
+from .central import scan
+from .peripheral import advertise
+from .server import Service, Characteristic, register_services
+from . import client
@@ -0,0 +1,68 @@
+import asyncio
+
+from . import core
+
+
+class ScanResult:
+    def __init__(self, advert):
+        self.device = advert.device
+        self._name = advert.name
+        self._services = advert.services
+        self.rssi = -50
+        self.connectable = True
+
+    def name(self):
+        return self._name
+
+    def services(self):
+        for uuid in self._services:
+            yield uuid
+
+
+class scan:
+    """ Yields each advertising peripheral once, at its first advertising
+    event after the scan started that falls in one of the scan's windows,
+    which open for window_us every interval_us from the start. A device
+    doesn't hear its own adverts. """
+
+    def __init__(self, duration_ms, interval_us=1280000, window_us=11250, active=False):
+        self._duration = duration_ms / 1000 if duration_ms else None
+        self._interval = interval_us / 1_000_000
+        self._window = window_us / 1_000_000
+        self._seen = []
+        self._next = {}  # Advert -> its next event to look at
+        self._module = core.caller()
+
+    async def __aenter__(self):
+        self._t0 = core.now()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while self._duration is None or core.now() - self._t0 < self._duration:
+            for advert in core.adverts:
+                if advert not in self._seen and advert.module != self._module and self._heard(advert):
+                    self._seen.append(advert)
+                    return ScanResult(advert)
+            await asyncio.sleep(0.005)
+        raise StopAsyncIteration
+
+    def _heard(self, advert):
+        """ True once an event of advert's has gone out in a scan window """
+        now = core.now()
+        k = self._next.get(advert)
+        if k is None:
+            k = advert.first_event(self._t0)
+        while True:
+            t = advert.event(k)
+            if t > now:
+                self._next[advert] = k
+                return False
+            if t >= self._t0 and (t - self._t0) % self._interval < self._window:
+                return True
+            k += 1
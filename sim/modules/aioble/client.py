@@ -0,0 +1,79 @@
+import asyncio
+from collections import deque
+
+from . import core
+
+
+class ClientService:
+    def __init__(self, connection, start_handle, end_handle, uuid):
+        self.connection = connection
+        self._start_handle = start_handle
+        self._end_handle = end_handle
+        self.uuid = uuid
+
+    def __repr__(self):
+        return "ClientService(%d, %d, %r)" % (self._start_handle, self._end_handle, self.uuid)
+
+    async def characteristic(self, uuid, timeout_ms=2000):
+        await self.connection._link.round_trip()
+        core.stats["discoveries"] += 1
+        for handle, characteristic in sorted(self.connection._link.server.characteristics.items()):
+            if self._start_handle <= handle <= self._end_handle and characteristic.uuid == uuid:
+                return ClientCharacteristic(self, characteristic._end_handle, handle,
+                                            characteristic.properties, uuid)
+        return None
+
+
+class ClientCharacteristic:
+    def __init__(self, service, end_handle, value_handle, properties, uuid):
+        self.service = service
+        self.connection = service.connection
+        self._end_handle = end_handle
+        self._value_handle = value_handle
+        self.properties = properties
+        self.uuid = uuid
+        # Like aioble, only the latest unread notification is kept
+        self._notify_queue = deque((), 1)
+        self._notify_event = asyncio.Event()
+        self.connection._link.clients.append(self)
+
+    def __repr__(self):
+        return "ClientCharacteristic(%d, %d, %r)" % (self._value_handle, self._end_handle, self.uuid)
+
+    def _server(self, flag):
+        characteristic = self.connection._link.server.characteristics.get(self._value_handle)
+        if characteristic is None or characteristic.uuid != self.uuid or not characteristic.properties & flag:
+            raise core.GattError
+        return characteristic
+
+    async def read(self, timeout_ms=1000):
+        link = self.connection._link
+        # The value is the one the peripheral holds when the request
+        # arrives; anything written while the answer travels back is missed
+        await link.request()
+        data = self._server(core.FLAG_READ)._value
+        await link.response()
+        core.stats["reads"] += 1
+        core.stats["bytes"] += len(data)
+        return data
+
+    async def subscribe(self, notify=True, indicate=False):
+        if notify and not self.properties & core.FLAG_NOTIFY:
+            raise ValueError("Not supported")
+        link = self.connection._link
+        await link.round_trip()
+        self._server(core.FLAG_NOTIFY)
+        link.subscribed.add(self._value_handle)
+
+    async def notified(self, timeout_ms=None):
+        link = self.connection._link
+        while not self._notify_queue:
+            if not link.connected:
+                raise core.DeviceDisconnectedError
+            self._notify_event.clear()
+            await self._notify_event.wait()
+        return self._notify_queue.popleft()
+
+    def _notify(self, data):
+        self._notify_queue.append(data)
+        self._notify_event.set()
@@ -0,0 +1,118 @@
+""" State shared by the fake stack: the GATT table and what is on air """
+import asyncio
+
+
+class GattError(Exception):
+    pass
+
+
+class DeviceDisconnectedError(Exception):
+    pass
+
+
+FLAG_READ = 0x02
+FLAG_WRITE_NO_RESPONSE = 0x04
+FLAG_WRITE = 0x08
+FLAG_NOTIFY = 0x10
+FLAG_INDICATE = 0x20
+
+PERIPHERAL_ADDR = b"\x28\xcd\xc1\x0e\x5a\x01"  # The remote's
+CENTRAL_ADDR = b"\x28\xcd\xc1\x0e\x5a\x02"
+
+stats = {"connections": 0, "discoveries": 0, "reads": 0, "notifications": 0, "bytes": 0}
+
+servers = {}  # Module that registered services -> its GATT table
+addresses = {"remote_control": PERIPHERAL_ADDR}  # Module -> its address
+adverts = []  # Advertising peripherals
+links = []  # Open connections
+
+
+def address(module):
+    """ The address a module advertises from; every module is a device of
+    its own """
+    if module not in addresses:
+        addresses[module] = PERIPHERAL_ADDR[:5] + bytes((PERIPHERAL_ADDR[5] + 0x10 * len(addresses),))
+    return addresses[module]
+
+
+def now():
+    return asyncio.get_event_loop().time()
+
+
+def next_event(t0, interval):
+    """ Seconds to the next event of a schedule that started at t0 """
+    return interval - (now() - t0) % interval
+
+
+class Server:
+    """ A device's GATT table """
+
+    def __init__(self, services):
+        self.services = services
+        self.characteristics = {}  # Value handle -> server Characteristic
+
+
+def caller():
+    """ Name of the module that called into aioble; stands in for the device """
+    import sys
+    frame = sys._getframe(2)
+    while frame.f_globals.get("__name__", "").startswith("aioble"):
+        frame = frame.f_back
+    return frame.f_globals.get("__name__")
+
+
+class Link:
+    """ One connection to a peripheral. Everything crossing it waits for a
+    connection event. """
+
+    def __init__(self, interval_us, server):
+        self.server = server
+        self.interval = max(interval_us or 30_000, 7_500) / 1_000_000
+        self.t0 = now()
+        self.connected = True
+        self.closed = asyncio.Event()
+        self.subscribed = set()
+        self.clients = []  # ClientCharacteristics waiting for notifications
+        links.append(self)
+
+    async def request(self):
+        """ Wait for the next event, when a request goes out and the
+        peripheral answers it """
+        if not self.connected:
+            raise DeviceDisconnectedError
+        await asyncio.sleep(next_event(self.t0, self.interval))
+        if not self.connected:
+            raise DeviceDisconnectedError
+
+    async def response(self):
+        """ Wait for the event after, which brings the answer back """
+        await asyncio.sleep(self.interval)
+        if not self.connected:
+            raise DeviceDisconnectedError
+
+    async def round_trip(self):
+        """ A request goes out on the next event, its response on the one after """
+        await self.request()
+        await self.response()
+
+    def send(self, handle, data):
+        if handle not in self.subscribed:
+            return
+        stats["notifications"] += 1
+        stats["bytes"] += len(data)
+        asyncio.get_event_loop().call_later(next_event(self.t0, self.interval),
+                                            self._deliver, handle, data)
+
+    def _deliver(self, handle, data):
+        if self.connected:
+            for client in self.clients:
+                if client._value_handle == handle:
+                    client._notify(data)
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            self.closed.set()
+            links.remove(self)
+            for client in self.clients:
+                client._notify_event.set()
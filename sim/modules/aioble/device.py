@@ -0,0 +1,72 @@
+import asyncio
+
+from . import core
+
+ADDR_PUBLIC = 0
+ADDR_RANDOM = 1
+
+
+class Device:
+    def __init__(self, addr_type, addr):
+        self.addr_type = addr_type
+        self.addr = bytes(addr)
+
+    def __eq__(self, other):
+        return isinstance(other, Device) and self.addr_type == other.addr_type and self.addr == other.addr
+
+    def __hash__(self):
+        return hash((self.addr_type, self.addr))
+
+    def addr_hex(self):
+        return ":".join("%02x" % b for b in self.addr)
+
+    def __repr__(self):
+        return "Device(%s, %s)" % ("ADDR_PUBLIC" if self.addr_type == ADDR_PUBLIC else "ADDR_RANDOM",
+                                   self.addr_hex())
+
+    async def connect(self, timeout_ms=10000, scan_duration_ms=None,
+                      min_conn_interval_us=None, max_conn_interval_us=None):
+        """ Connect on the peripheral's next advertising event """
+        start = core.now()
+        while True:
+            for advert in core.adverts:
+                if advert.device == self:
+                    await asyncio.sleep(core.next_event(advert.t0, advert.interval))
+                    if advert in core.adverts:
+                        return advert.accept(min_conn_interval_us)
+            if timeout_ms and (core.now() - start) * 1000 >= timeout_ms:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(0.005)
+
+
+class DeviceConnection:
+    def __init__(self, device, link):
+        self.device = device
+        self._link = link
+
+    def is_connected(self):
+        return self._link.connected
+
+    async def disconnect(self, timeout_ms=2000):
+        self._link.close()
+
+    async def disconnected(self, timeout_ms=None):
+        if timeout_ms:
+            await asyncio.wait_for(self._link.closed.wait(), timeout_ms / 1000)
+        else:
+            await self._link.closed.wait()
+
+    async def service(self, uuid, timeout_ms=2000):
+        from .client import ClientService
+        await self._link.round_trip()
+        core.stats["discoveries"] += 1
+        for service in self._link.server.services:
+            if service.uuid == uuid:
+                return ClientService(self, service._start_handle, service._end_handle, uuid)
+        return None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
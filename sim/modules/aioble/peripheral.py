@@ -0,0 +1,56 @@
+import asyncio
+import itertools
+import random
+
+from . import core
+from .device import ADDR_PUBLIC, Device, DeviceConnection
+
+
+ADV_DELAY = 0.010  # The spec's random advDelay, up to 10 ms on every event
+_seeds = itertools.count()
+
+
+class Advert:
+    def __init__(self, interval_us, name, services, module):
+        self.module = module
+        self.seed = next(_seeds)
+        self.server = core.servers.get(module) or core.Server([])
+        self.device = Device(ADDR_PUBLIC, core.address(module))
+        self.interval = interval_us / 1_000_000
+        self.name = name
+        self.services = list(services or ())
+        self.t0 = core.now()
+        self.connection = asyncio.get_event_loop().create_future()
+
+    def first_event(self, t):
+        """ Number of the first advertising event that can go out at or
+        after t """
+        return max(0, int((t - self.t0 - ADV_DELAY) // self.interval))
+
+    def event(self, k):
+        """ When the k-th advertising event goes out, advDelay included;
+        the same every run """
+        delay = random.Random(hash((self.seed, k))).random() * ADV_DELAY
+        return self.t0 + k * self.interval + delay
+
+    def accept(self, conn_interval_us):
+        link = core.Link(conn_interval_us, self.server)
+        core.stats["connections"] += 1
+        self.connection.set_result(DeviceConnection(Device(ADDR_PUBLIC, core.CENTRAL_ADDR), link))
+        core.adverts.remove(self)
+        return DeviceConnection(self.device, link)
+
+
+async def advertise(interval_us, adv_data=None, resp_data=None, connectable=True,
+                    limited_disc=False, include_tx_power=False, name=None,
+                    services=None, appearance=0, manufacturer=None, timeout_ms=None):
+    """ Advertise until a central connects and return the connection """
+    advert = Advert(interval_us, name, services, core.caller())
+    core.adverts.append(advert)
+    try:
+        if timeout_ms:
+            return await asyncio.wait_for(asyncio.shield(advert.connection), timeout_ms / 1000)
+        return await advert.connection
+    finally:
+        if advert in core.adverts:
+            core.adverts.remove(advert)
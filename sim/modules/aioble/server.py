@@ -0,0 +1,58 @@
+from . import core
+
+
+class Service:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.characteristics = []
+
+
+class Characteristic:
+    def __init__(self, service, uuid, read=False, write=False, write_no_response=False,
+                 notify=False, indicate=False, initial=None, capture=False):
+        service.characteristics.append(self)
+        self.service = service
+        self.uuid = uuid
+        self.properties = ((core.FLAG_READ if read else 0) |
+                           (core.FLAG_WRITE if write else 0) |
+                           (core.FLAG_WRITE_NO_RESPONSE if write_no_response else 0) |
+                           (core.FLAG_NOTIFY if notify else 0) |
+                           (core.FLAG_INDICATE if indicate else 0))
+        self._value = b""
+        if initial is not None:
+            self.write(initial)
+
+    def read(self):
+        return self._value
+
+    def write(self, data, send_update=False):
+        self._value = data.encode() if isinstance(data, str) else bytes(data)
+        if send_update:
+            for link in core.links:
+                if self in link.server.characteristics.values():
+                    link.send(self._value_handle, self._value)
+
+    def notify(self, connection, data=None):
+        if connection is None or not connection.is_connected():
+            return
+        data = self._value if data is None else bytes(data)
+        connection._link.send(self._value_handle, data)
+
+
+def register_services(*services):
+    """ Lay the services out in a GATT table: a declaration and a value handle
+    per characteristic, plus a CCCD for those that notify or indicate """
+    server = core.Server(list(services))
+    core.servers[core.caller()] = server
+    handle = 1
+    for service in services:
+        service._start_handle = handle
+        handle += 1
+        for characteristic in service.characteristics:
+            characteristic._value_handle = handle + 1
+            handle += 2
+            if characteristic.properties & (core.FLAG_NOTIFY | core.FLAG_INDICATE):
+                handle += 1
+            characteristic._end_handle = handle - 1
+            server.characteristics[characteristic._value_handle] = characteristic
+        service._end_handle = handle - 1
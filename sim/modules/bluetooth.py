@@ -0,0 +1,21 @@
+""" Fake bluetooth module: UUIDs only, the link itself is in aioble """
+
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, UUID):
+            value = value._value
+        if isinstance(value, str):
+            value = value.lower()
+        self._value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self._value == other._value
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def __repr__(self):
+        if isinstance(self._value, int):
+            return "UUID(0x%04x)" % self._value
+        return "UUID(%r)" % self._value
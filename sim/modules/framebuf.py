@@ -0,0 +1,75 @@
+""" Fake framebuf module: MONO_VLSB and MONO_HLSB only. Text is drawn as a
+pattern made from each character code rather than the real font, which is
+enough to see which pages a label touches. """
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = width if stride is None else stride
+
+    def _index(self, x, y):
+        if self.format == MONO_VLSB:
+            return (y >> 3) * self.stride + x, y & 7
+        return (y * ((self.stride + 7) & ~7) + x) >> 3, 7 - (x & 7)
+
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        i, bit = self._index(x, y)
+        if c is None:
+            return (self.buffer[i] >> bit) & 1
+        if c:
+            self.buffer[i] |= 1 << bit
+        else:
+            self.buffer[i] &= ~(1 << bit)
+
+    def fill(self, c):
+        value = 0xFF if c else 0
+        for i in range(len(self.buffer)):
+            self.buffer[i] = value
+
+    def fill_rect(self, x, y, w, h, c):
+        for yy in range(max(y, 0), min(y + h, self.height)):
+            for xx in range(max(x, 0), min(x + w, self.width)):
+                self.pixel(xx, yy, c)
+
+    def rect(self, x, y, w, h, c, f=False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+            return
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def text(self, s, x, y, c=1):
+        for n, ch in enumerate(s):
+            code = ord(ch)
+            for col in range(8):
+                bits = (code * (col + 1)) & 0xFF if ch != " " else 0
+                for row in range(8):
+                    if bits & (1 << row):
+                        self.pixel(x + n * 8 + col, y + row, c)
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        for yy in range(fbuf.height):
+            for xx in range(fbuf.width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
+
+    def scroll(self, xstep, ystep):
+        pass
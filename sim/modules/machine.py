@@ -0,0 +1,201 @@
+""" Fake machine module.
+
+Input pins and ADCs read from traces set with trace_pin() and trace_adc():
+lists of (ms, value) steps, timed from the start of the simulation. PWM
+outputs append (ms, pin, angle) to PWM.log, with the angle the servo would
+turn to for the pulse width, whether it was set with duty_u16() or by
+storing to a slice's CC register through mem32, which models the RP2040's
+PWM registers and counts the stores in mem32.stores. I2C counts the bytes
+written in I2C.bytes.
+"""
+import time
+
+# Nominal servo pulse range, 0 to 180 degrees
+SERVO_MIN_US = 544
+SERVO_MAX_US = 2400
+
+# RP2040 PWM block
+CLOCK_HZ = 125_000_000
+PWM_BASE = 0x40050000
+PWM_SLICE = 0x14
+PWM_CSR, PWM_DIV, PWM_CTR, PWM_CC, PWM_TOP = 0x00, 0x04, 0x08, 0x0C, 0x10
+PWM_EN = 0x400500A0
+
+_pin_traces = {}
+_adc_traces = {}
+
+
+def trace_pin(pin, steps):
+    """ Drive an input pin from a list of (ms, value) steps """
+    _pin_traces[pin] = sorted(steps)
+
+
+def trace_adc(pin, steps):
+    """ Drive an ADC from a list of (ms, raw 0..65535) steps """
+    _adc_traces[pin] = sorted(steps)
+
+
+def _traced(steps, default):
+    now = time.ticks_ms()
+    value = default
+    for ms, step in steps:
+        if ms > now:
+            break
+        value = step
+    return value
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x7a\x2b\x2c"
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = 0 if value is None else value
+
+    def value(self, value=None):
+        if value is None:
+            if self.id in _pin_traces:
+                return _traced(_pin_traces[self.id], 0)
+            return self._value
+        self._value = 1 if value else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def __repr__(self):
+        return "Pin(%r)" % self.id
+
+
+class ADC:
+    def __init__(self, pin):
+        self.id = pin.id if isinstance(pin, Pin) else pin
+
+    def read_u16(self):
+        return _traced(_adc_traces.get(self.id, ()), 32768)
+
+
+class PWM:
+    log = []  # (ms, pin, angle) for every duty change, all outputs
+    channels = {}  # slice * 2 + channel -> the PWM on it
+
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.pin = pin.id if isinstance(pin, Pin) else pin
+        self.slice = self.pin >> 1 & 7
+        self.channel = self.pin & 1
+        PWM.channels[self.slice * 2 + self.channel] = self
+        self._freq = 50
+        self._duty = 0
+        self._count = 0
+        self.top = 0xFFFF
+        self.writes = 0
+        if freq is not None:
+            self.freq(freq)
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, freq=None):
+        if freq is None:
+            return self._freq
+        # As the rp2 port does it: the smallest divider that fits TOP in 16 bits
+        self._freq = freq
+        div = -(-CLOCK_HZ // (freq * 65536))
+        self.top = CLOCK_HZ // (div * freq) - 1
+        for pwm in PWM.channels.values():
+            if pwm.slice == self.slice:
+                pwm._freq = freq
+                pwm.top = self.top
+
+    def duty_u16(self, duty=None):
+        if duty is None:
+            return self._duty
+        self._duty = duty
+        self._log(duty * 1_000_000 / self._freq / 65535)
+
+    def _compare(self, count):
+        """ A new CC value for this channel """
+        if count != self._count:
+            self._count = count
+            self._log(count * 1_000_000 / self._freq / (self.top + 1))
+
+    def _log(self, us):
+        self.writes += 1
+        angle = (us - SERVO_MIN_US) * 180 / (SERVO_MAX_US - SERVO_MIN_US)
+        PWM.log.append((time.ticks_ms(), self.pin, round(angle, 1)))
+
+    def deinit(self):
+        pass
+
+
+class _Mem32:
+    """ 32 bit register access. The PWM block is modelled: TOP reads back
+    what freq() chose, and storing CC sets the compare value of both of the
+    slice's channels. Anything else is plain memory. """
+
+    def __init__(self):
+        self.words = {}
+        self.stores = 0
+
+    def _slice(self, address):
+        if PWM_BASE <= address < PWM_BASE + 8 * PWM_SLICE:
+            return divmod(address - PWM_BASE, PWM_SLICE)
+        return None, None
+
+    def __getitem__(self, address):
+        s, offset = self._slice(address)
+        if offset == PWM_TOP:
+            for pwm in PWM.channels.values():
+                if pwm.slice == s:
+                    return pwm.top
+        return self.words.get(address, 0)
+
+    def __setitem__(self, address, value):
+        value &= 0xFFFFFFFF
+        self.stores += 1
+        self.words[address] = value
+        s, offset = self._slice(address)
+        if offset == PWM_CC:
+            for channel in (0, 1):
+                pwm = PWM.channels.get(s * 2 + channel)
+                if pwm is not None:
+                    pwm._compare(value >> 16 * channel & 0xFFFF)
+
+
+mem32 = _Mem32()
+
+
+class I2C:
+    bytes = 0  # Written by every bus since the start
+
+    def __init__(self, id, scl=None, sda=None, freq=400_000):
+        self.id = id
+        self.written = 0
+
+    def _count(self, n):
+        self.written += n
+        I2C.bytes += n
+
+    def writeto(self, addr, buf, stop=True):
+        self._count(len(buf))
+        return 1
+
+    def writevto(self, addr, vector, stop=True):
+        for buf in vector:
+            self._count(len(buf))
+        return 1
+
+    def scan(self):
+        return [0x3C]
@@ -0,0 +1,5 @@
+""" Fake micropython module """
+
+
+def const(value):
+    return value
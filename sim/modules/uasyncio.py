@@ -0,0 +1,7 @@
+""" uasyncio on top of CPython's asyncio """
+from asyncio import *  # noqa: F401,F403
+from asyncio import sleep
+
+
+async def sleep_ms(ms):
+    await sleep(ms / 1000)
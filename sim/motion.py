@@ -0,0 +1,188 @@
+""" The motion core's tick timing and trajectories, on a host thread.
+
+    python -m sim.motion [--seed N] [--rounds N]
+
+Starts robot.py's motion core on a thread, as it runs on the Pico's second
+core, and queues moves to it with start_move(): first whole-hand moves to
+random poses, with every easing over a range of durations, one after the
+other; then --rounds rounds of all six channels moving at once, each
+channel's move starting STAGGER_MS after the last one's with its own
+duration and easing. Every motion tick is timestamped and the angles it
+commits are recorded, and checked:
+
+  timing    ticks fall every TICK_MS from the first tick of a move; each
+            tick's error against that schedule is reported. After a tick a
+            whole TICK_MS late the core starts a new schedule, and so does
+            the check; more than LATE_TICKS of them fail
+  path      every committed angle is within a degree of the easing's curve,
+            worked out in floating point, at the tick's time
+  arrival   every joint is at its target on the tick that ends the move,
+            which comes within a tick of the move's duration
+
+The time each tick takes is reported against TICK_BUDGET_US, overall and
+by how many channels were moving. Times are CPython's, and its thread
+switching adds to the error; the Pico's second core runs nothing else.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from . import install, percentile
+
+DURATIONS = (60, 200, 500, 1000)
+STAGGER_MS = 30
+LATE_TICKS = 0.01  # Of all ticks; a busy host can hold up the thread
+TIMEOUT_MS = 5000
+
+
+def curve(robot, easing, u):
+    """ The easings as defined, in floating point """
+    if easing == robot.LINEAR:
+        return u
+    if easing == robot.EASE_IN_OUT:
+        return u * u * (3 - 2 * u)
+    return u * u * u * (10 + u * (6 * u - 15))
+
+
+class Recorder:
+    """ Wraps motion_tick to record each tick: (ticks_us at the start, the
+    now it was given, us it took, channels moving, committed angles, and the
+    channels' moves as they stood) """
+
+    def __init__(self, robot):
+        self.ticks = []
+        tick = robot.motion_tick
+
+        def recorded_tick(now):
+            moving = robot._moving
+            moves = (list(robot._start), list(robot._target), list(robot._channel_t0),
+                     list(robot._channel_ms), list(robot._channel_easing))
+            t0 = time.ticks_us()
+            tick(now)
+            used = time.ticks_diff(time.ticks_us(), t0)
+            self.ticks.append((t0, now, used, moving, list(robot.hand.angles), moves))
+
+        robot.motion_tick = recorded_tick
+
+
+def wait_idle(robot):
+    deadline = time.ticks_ms() + TIMEOUT_MS
+    while robot.busy_channels():
+        if time.ticks_ms() > deadline:
+            raise RuntimeError("motion core never finished the move")
+        time.sleep(0.001)
+
+
+def check_ticks(robot, ticks):
+    """ Check the recorded ticks; returns (errors, per tick timing errors in
+    us, us each tick took, ticks a whole TICK_MS late) """
+    errors = []
+    late_ticks = 0
+    timing = []
+    used = []
+    first = None
+    n = 0
+    previous = 0
+    for t0, now, us, moving, angles, moves in ticks:
+        used.append(us)
+        if not previous:
+            first = t0
+            n = 0
+        late = t0 - (first + n * robot.TICK_MS * 1000)
+        timing.append(late)
+        if late >= robot.TICK_MS * 1000:
+            late_ticks += 1
+            # The core doesn't catch up; its schedule starts again here
+            first = t0
+            n = 0
+        n += 1
+        starts, targets, channel_t0, channel_ms, easings = moves
+        finished = 0
+        for j in range(robot.JOINTS):
+            c = robot.CHANNEL_OF[j]
+            if not moving & (1 << c):
+                continue
+            elapsed = now - channel_t0[c]
+            ms = channel_ms[c]
+            if elapsed >= ms:
+                finished |= 1 << c
+                if angles[j] != targets[j]:
+                    errors.append("joint %d ended at %d, not %d" % (j, angles[j], targets[j]))
+                # A tick that is late itself ends the move that much later
+                if elapsed >= ms + robot.TICK_MS + (max(late, 0) + 999) // 1000:
+                    errors.append("move of %d ms ended after %d ms" % (ms, elapsed))
+                continue
+            want = starts[j] + (targets[j] - starts[j]) * curve(robot, easings[c], elapsed / ms)
+            if abs(angles[j] - want) > 1:
+                errors.append("joint %d at %d, %d ms into a %d ms move: %d, not %.1f" % (
+                    j, elapsed, elapsed, ms, angles[j], want))
+        previous = moving & ~finished
+    if late_ticks > LATE_TICKS * len(ticks):
+        errors.append("%d ticks a whole tick late" % late_ticks)
+    return errors, timing, used, late_ticks
+
+
+def concurrent_round(robot):
+    """ Start a move on every channel, STAGGER_MS apart, and wait for them """
+    easings = (robot.LINEAR, robot.EASE_IN_OUT, robot.MIN_JERK)
+    for c in range(robot.CHANNELS):
+        pose = [robot.KEEP] * robot.JOINTS
+        for j in range(robot.JOINTS):
+            if robot.CHANNEL_OF[j] == c:
+                pose[j] = random.randrange(181)
+        robot.start_move(pose, random.choice(DURATIONS), random.choice(easings))
+        time.sleep(STAGGER_MS / 1000)
+    wait_idle(robot)
+
+
+def by_channels(ticks):
+    """ us each tick took, by the number of channels moving """
+    used = {}
+    for _, _, us, moving, _, _ in ticks:
+        used.setdefault(bin(moving).count("1"), []).append(us)
+    return used
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-motion-"))
+    import robot
+    recorder = Recorder(robot)
+    robot.start_motion_core()
+    pose = [random.randrange(181) for _ in range(robot.JOINTS)]
+    robot.start_move(pose, 0, robot.STEP)
+    wait_idle(robot)
+    moves = 0
+    for easing in (robot.LINEAR, robot.EASE_IN_OUT, robot.MIN_JERK):
+        for ms in DURATIONS:
+            pose = [random.randrange(181) for _ in range(robot.JOINTS)]
+            robot.start_move(pose, ms, easing)
+            wait_idle(robot)
+            moves += 1
+    for _ in range(args.rounds):
+        concurrent_round(robot)
+        moves += robot.CHANNELS
+    errors, timing, used, late_ticks = check_ticks(robot, recorder.ticks)
+    for error in errors[:10]:
+        print(error)
+    print("%d moves, %d ticks, %d errors" % (moves, len(recorder.ticks), len(errors)))
+    print("tick timing error us: mean %d p99 %d max %d; %d ticks a whole tick late" % (
+        sum(timing) / len(timing), percentile(timing, 99), max(timing), late_ticks))
+    print("tick time us: mean %d max %d, budget %d" % (
+        sum(used) / len(used), max(used), robot.TICK_BUDGET_US))
+    for count, channel_used in sorted(by_channels(recorder.ticks).items()):
+        print("  %d channels moving: %d ticks, mean %d max %d" % (
+            count, len(channel_used), sum(channel_used) / len(channel_used), max(channel_used)))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
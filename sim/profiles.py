@@ -0,0 +1,147 @@
+""" Discovery time and air traffic of each link profile, on the simulation.
+
+    python -m sim.profiles [--connects N] [--hold-ms MS]
+
+Runs the simulated remote and robot once per link profile, each in its own
+process with the profile saved on both sides. The fake stack schedules
+advertising events on the remote's interval (plus the spec's random
+advDelay), hears them only inside the robot's scan windows, and runs the
+link on the connection interval the robot asks for. For each profile:
+
+  discovery  from the robot starting to look for the remote, with nothing
+             cached, to the remote being found, over --connects connects
+             (mean and worst, in ms); a scan that ends empty and the
+             backoff after it count towards the time. The link is dropped
+             from the robot's side between connects.
+  air        advertising events/s while the remote waits, connection
+             events/s once linked, and with the left stick held for
+             --hold-ms, notifications/s and packets/s. Every connection
+             event carries at least one packet each way, and a
+             notification rides in the remote's, so a link sends twice
+             its event rate whether or not anything happens.
+
+Exits non-zero if a profile doesn't connect within TIMEOUT_MS or the held
+stick sends nothing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import ROOT
+from . import run as sim
+from .run import LEFT_STICK_1
+
+TIMEOUT_MS = 30000
+SETTLE_MS = 300
+
+
+async def streaming(robot, old=None):
+    t0 = time.ticks_ms()
+    while not (robot.connected and robot.link_state == robot.STATE_STREAM
+               and robot.link_connection is not old):
+        if time.ticks_ms() - t0 > TIMEOUT_MS:
+            raise RuntimeError("no connection within %d ms" % TIMEOUT_MS)
+        await asyncio.sleep(0.002)
+
+
+async def measure(robot, remote, connects, hold_ms):
+    import aioble
+    import machine
+    looking = []  # ticks_ms the robot started looking, one per connect
+    found = []  # ticks_ms it found the remote
+    find_remote = robot.find_remote
+
+    async def timed_find_remote():
+        if len(looking) == len(found):
+            looking.append(time.ticks_ms())
+        device = await find_remote()
+        if device:
+            found.append(time.ticks_ms())
+        return device
+
+    robot.find_remote = timed_find_remote
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    try:
+        await streaming(robot)
+        for _ in range(connects - 1):
+            await asyncio.sleep(SETTLE_MS / 1000)
+            robot.forget_remote(robot.load_cache())
+            old = robot.link_connection
+            await old.disconnect()
+            await streaming(robot, old)
+        await asyncio.sleep(SETTLE_MS / 1000)
+        before = dict(aioble.stats)
+        now = time.ticks_ms()
+        machine.trace_adc(LEFT_STICK_1, [(now, 65535), (now + hold_ms, 32768)])
+        await asyncio.sleep(hold_ms / 1000)
+        notifications = (aioble.stats["notifications"] - before["notifications"]) * 1000 / hold_ms
+        interval = robot.link_connection._link.interval
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    discovery = [b - a for a, b in zip(looking, found)]
+    return {
+        "discovery_ms": discovery,
+        "adv_per_s": round(1_000_000 / remote.LINK_PROFILES[remote.link_profile][1], 1),
+        "events_per_s": round(1 / interval, 1),
+        "notifications_per_s": round(notifications, 1),
+    }
+
+
+def run_profile(args):
+    """ One profile, in this process; prints its results as JSON """
+    state = tempfile.mkdtemp(prefix="thing-profiles-")
+    with open(os.path.join(state, "profile.txt"), "w") as f:
+        f.write(str(args.profile))
+    with open(os.path.join(state, "remote.json"), "w") as f:
+        json.dump({"last": None, "remotes": {}, "profile": args.profile}, f)
+    robot, remote = sim.load(state)
+    try:
+        results = asyncio.run(measure(robot, remote, args.connects, args.hold_ms))
+    except RuntimeError as e:
+        results = {"error": str(e)}
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--connects", type=int, default=5)
+    parser.add_argument("--hold-ms", type=int, default=2000)
+    parser.add_argument("--profile", type=int)
+    args = parser.parse_args()
+    if args.profile is not None:
+        run_profile(args)
+        return
+    sim.load()
+    import remote_control
+    failed = False
+    for profile, (label, _) in enumerate(remote_control.LINK_PROFILES):
+        output = subprocess.run(
+            [sys.executable, "-m", "sim.profiles", "--profile", str(profile),
+             "--connects", str(args.connects), "--hold-ms", str(args.hold_ms)],
+            cwd=ROOT, capture_output=True, text=True)
+        if output.returncode:
+            print(output.stderr, file=sys.stderr)
+            sys.exit(output.returncode)
+        r = json.loads(output.stdout.strip().splitlines()[-1])
+        if "error" in r:
+            print("%s: %s" % (label, r["error"]))
+            failed = True
+            continue
+        discovery = r["discovery_ms"]
+        print("%s: discovery mean %d ms, worst %d ms over %d connects; %.1f advertising events/s, "
+              "%.1f connection events/s, %.1f packets/s, %.1f notifications/s with a stick held" % (
+                  label, sum(discovery) / len(discovery), max(discovery), len(discovery),
+                  r["adv_per_s"], r["events_per_s"], 2 * r["events_per_s"], r["notifications_per_s"]))
+        failed = failed or not r["notifications_per_s"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
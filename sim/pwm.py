@@ -0,0 +1,126 @@
+""" The robot's packed PWM writes, checked and timed against the fake slices.
+
+    python -m sim.pwm [--poses N]
+
+Loads robot.py against the fake machine module, whose mem32 models the
+RP2040's PWM registers, and checks:
+
+  packing   for every joint and angle, write() puts the joint's duty table
+            entry in its half of its slice's CC register and leaves the
+            other half alone; random poses read back from the registers
+            as what was committed
+  small     no packed word reaches 2**30, so packing never makes a big int
+  alignment all the hand's slices were enabled together with their
+            counters at zero
+
+then times whole pose commits, every joint changing, against a commit that
+makes one duty_u16() call per joint as the hand used to, and counts the
+register stores per pose. Times are CPython's and mostly the fakes' own;
+the counts are what carries over to the Pico.
+"""
+import argparse
+import random
+import sys
+import time
+
+from . import install
+
+
+def registers(robot, machine):
+    """ Joint -> compare value, as read back from the CC registers """
+    hand = robot.hand
+    counts = []
+    for j in range(robot.JOINTS):
+        channel = hand.channel[j]
+        word = machine.mem32[hand.cc_address[channel >> 1]]
+        counts.append(word >> 16 * (channel & 1) & 0xFFFF)
+    return counts
+
+
+def check(robot, machine, poses):
+    hand = robot.hand
+    errors = []
+    for j in range(robot.JOINTS):
+        other = hand.channel[j] ^ 1
+        for angle in range(-5, 186):
+            before = registers(robot, machine)
+            hand.write(j, angle)
+            after = registers(robot, machine)
+            want = hand.duty[j][min(max(angle, 0), 180)]
+            if after[j] != want:
+                errors.append("joint %d angle %d: %d, not %d" % (j, angle, after[j], want))
+            for k in range(robot.JOINTS):
+                if k != j and hand.channel[k] == other and after[k] != before[k]:
+                    errors.append("joint %d angle %d changed joint %d" % (j, angle, k))
+    for _ in range(poses):
+        pose = [random.randrange(181) for _ in range(robot.JOINTS)]
+        hand.set_pose(pose)
+        hand.commit()
+        if registers(robot, machine) != [hand.duty[j][pose[j]] for j in range(robot.JOINTS)]:
+            errors.append("pose %s read back wrong" % pose)
+    largest = max(hand.duty[j][a] for j in range(robot.JOINTS) for a in range(181)) << 16
+    if largest >= 1 << 30:
+        errors.append("a packed word reaches %d" % largest)
+    slices = 0
+    for j in range(robot.JOINTS):
+        slices |= 1 << (hand.channel[j] >> 1)
+    if machine.mem32[machine.PWM_EN] & slices != slices:
+        errors.append("slices not all enabled")
+    return errors
+
+
+def timing(robot, machine, poses):
+    hand = robot.hand
+    pwms = [machine.PWM(machine.Pin(pin)) for pin in robot.JOINT_PINS]
+    # Two alternating poses, so every joint changes on every commit
+    a = [60] * robot.JOINTS
+    b = [120] * robot.JOINTS
+    stores = machine.mem32.stores
+    t0 = time.perf_counter()
+    for n in range(poses):
+        hand.set_pose(a if n & 1 else b)
+        hand.commit()
+    packed = (time.perf_counter() - t0) / poses
+    stores = (machine.mem32.stores - stores) / poses
+    t0 = time.perf_counter()
+    for n in range(poses):
+        hand.set_pose(a if n & 1 else b)
+        per_joint_commit(hand, pwms)
+    separate = (time.perf_counter() - t0) / poses
+    return packed, stores, separate
+
+
+def per_joint_commit(hand, pwms):
+    """ Hand.commit() as it was, one duty_u16() call per changed joint. Its
+    tables held duty_u16 values rather than compare values, which costs the
+    same to look up. """
+    angles = hand.angles
+    pending = hand._pending
+    for j in range(len(pwms)):
+        angle = pending[j]
+        if angle == angles[j]:
+            continue
+        angles[j] = angle
+        angle = 0 if angle < 0 else 180 if angle > 180 else angle
+        pwms[j].duty_u16(hand.duty[j][angle])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--poses", type=int, default=2000)
+    args = parser.parse_args()
+    install()
+    import machine
+    import robot
+    errors = check(robot, machine, args.poses)
+    for error in errors[:10]:
+        print(error)
+    print("packing: %d errors" % len(errors))
+    packed, stores, separate = timing(robot, machine, args.poses)
+    print("whole pose: packed %.1f us, %.0f register stores; duty_u16 per joint %.1f us, 16 calls" % (
+        packed * 1e6, stores, separate * 1e6))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+""" Remote commands over notifications against polling, on the simulation.
+
+    python -m sim.receive [--presses N] [--press-ms MS] [--gap-ms MS] [--profile N]
+
+Connects the simulated remote and robot and presses green, red, blue and
+yellow in turn, each for --press-ms with --gap-ms between presses, first
+with the robot subscribed to the remote's notifications and then with the
+subscription refused, so the robot falls back to reading the
+characteristic every 10 ms. Each mode runs in its own process. Reported per
+mode: commands dispatched per second, press to dispatch latency (median
+and p99, in ms) and what went over the air per second. A polled read sees
+the value the remote held when its request went out, so a press shorter
+than the time between reads can fall between two of them; polling's lost
+presses are reported, not failed on. Exits non-zero if a press never
+reaches the dispatcher over notifications or a mode didn't take the path
+it was meant to.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import ROOT, percentile
+from . import run as sim
+from .run import GREEN, RED, BLUE, YELLOW
+
+BUTTONS = ((GREEN, 0), (RED, 1), (BLUE, 2), (YELLOW, 3))  # (pin, mask bit)
+TIMEOUT_MS = 30000
+SETTLE_MS = 500
+
+
+async def presses(robot, remote, count, press_ms, gap_ms):
+    import machine
+    dispatched = []  # (us, command)
+    submit = robot.dispatcher.submit
+
+    def probe_submit(command):
+        dispatched.append((time.ticks_us(), command))
+        submit(command)
+
+    robot.dispatcher.submit = probe_submit
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    try:
+        deadline = time.ticks_ms() + TIMEOUT_MS
+        while not (remote.connected and robot.link_state == robot.STATE_STREAM):
+            if time.ticks_ms() > deadline:
+                raise RuntimeError("remote never connected")
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(SETTLE_MS / 1000)
+        import aioble
+        before = dict(aioble.stats)
+        first = time.ticks_ms() + 50
+        schedule = []  # (press ms, command)
+        steps = {pin: [] for pin, _ in BUTTONS}
+        for n in range(count):
+            pin, bit = BUTTONS[n % len(BUTTONS)]
+            start = first + n * (press_ms + gap_ms)
+            steps[pin] += [(start, 1), (start + press_ms, 0)]
+            schedule.append((start, robot.BUTTON_COMMANDS[bit]))
+        for pin, pin_steps in steps.items():
+            machine.trace_pin(pin, pin_steps)
+        end = first + count * (press_ms + gap_ms)
+        await asyncio.sleep((end + SETTLE_MS - time.ticks_ms()) / 1000)
+        seconds = (end - first) / 1000
+        air = {key: (aioble.stats[key] - before[key]) / seconds for key in ("reads", "notifications")}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = []
+    for n, (start, command) in enumerate(schedule):
+        # A slow path can dispatch after the next press starts; the press
+        # is lost only if the button comes round again first
+        later = n + len(BUTTONS)
+        until = schedule[later][0] if later < len(schedule) else None
+        for us, dispatched_command in dispatched:
+            ms = us / 1000
+            if until is not None and ms >= until:
+                break
+            if ms >= start and dispatched_command == command:
+                latencies.append(ms - start)
+                break
+    return {
+        "presses": count,
+        "dispatched": len(latencies),
+        "commands_per_s": round(len(latencies) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "reads_per_s": round(air["reads"], 1),
+        "notifications_per_s": round(air["notifications"], 1),
+        "receive": "polling" if air["reads"] else "notifications",
+    }
+
+
+def run_mode(args):
+    """ One mode, in this process; prints its results as JSON """
+    state = tempfile.mkdtemp(prefix="thing-receive-")
+    with open(os.path.join(state, "profile.txt"), "w") as f:
+        f.write(str(args.profile))
+    with open(os.path.join(state, "remote.json"), "w") as f:
+        json.dump({"last": None, "remotes": {}, "profile": args.profile}, f)
+    robot, remote = sim.load(state)
+    if args.mode == "polling":
+        import aioble
+
+        async def refuse(self, notify=True, indicate=False):
+            raise aioble.GattError
+
+        aioble.client.ClientCharacteristic.subscribe = refuse
+    results = asyncio.run(presses(robot, remote, args.presses, args.press_ms, args.gap_ms))
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--presses", type=int, default=40)
+    parser.add_argument("--press-ms", type=int, default=60)
+    parser.add_argument("--gap-ms", type=int, default=60)
+    parser.add_argument("--profile", type=int, default=1)
+    parser.add_argument("--mode", choices=("notifications", "polling"))
+    args = parser.parse_args()
+    if args.mode:
+        run_mode(args)
+        return
+    failed = False
+    for mode in ("notifications", "polling"):
+        output = subprocess.run(
+            [sys.executable, "-m", "sim.receive", "--mode", mode, "--presses", str(args.presses),
+             "--press-ms", str(args.press_ms), "--gap-ms", str(args.gap_ms),
+             "--profile", str(args.profile)],
+            cwd=ROOT, capture_output=True, text=True)
+        if output.returncode:
+            print(output.stderr, file=sys.stderr)
+            sys.exit(output.returncode)
+        r = json.loads(output.stdout.strip().splitlines()[-1])
+        print("%s: %d/%d presses dispatched, %.2f commands/s, press to dispatch p50 %.1f ms "
+              "p99 %.1f ms; %.1f reads/s, %.1f notifications/s" % (
+                  mode, r["dispatched"], r["presses"], r["commands_per_s"], r["p50_ms"],
+                  r["p99_ms"], r["reads_per_s"], r["notifications_per_s"]))
+        if mode == "polling" and r["dispatched"] != r["presses"]:
+            print("  polling missed %d presses between reads" % (r["presses"] - r["dispatched"]))
+        failed = failed or r["receive"] != mode or (
+            mode == "notifications" and r["dispatched"] != r["presses"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+""" The robot's connection supervisor against dropped links and faults.
+
+    python -m sim.reconnect [--drops N] [--profile N]
+
+Connects the simulated remote and robot, then drops the link --drops times
+from the robot's side and times how long the robot takes to get back to
+streaming, along each path back:
+
+  known     the cache holds the remote, so the robot connects straight to
+            its address and checks the cached handles
+  scan      the cache is emptied before each drop, so the robot scans
+
+  bump      the remote's model number goes up before the drop, as it does
+            when its GATT layout changes, so the cached handles are stale
+  rebumped  the drop after that, with the rediscovered handles cached
+
+Every reconnect counts the discovery round trips the robot makes
+(aioble.stats["discoveries"]): the first connect and the scan and bump
+paths must discover, the known and rebumped paths must not.
+
+Then injects faults the supervisor must live through, each followed by
+another reconnect:
+
+  connect   an OSError from the connect on the scan path
+  decode    an exception raised while decoding the remote's frame
+
+Reported: reconnect time per path (mean and worst, in ms; the backoff
+after a drop is included) and discoveries per reconnect. Exits non-zero if
+a path discovers when it shouldn't or doesn't when it should, a reconnect
+doesn't happen within TIMEOUT_MS or the robot's main() ends.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from . import run as sim
+from .run import GREEN
+
+# Path -> whether its reconnects must run discovery
+DISCOVERS = {"first": True, "known": False, "scan": True, "bump": True, "rebumped": False}
+
+TIMEOUT_MS = 15000
+SETTLE_MS = 300
+
+
+async def streaming(robot, main, old=None):
+    """ Wait for a link other than old to be streaming; returns (ms waited,
+    discovery round trips made meanwhile) """
+    import aioble
+    t0 = time.ticks_ms()
+    discoveries = aioble.stats["discoveries"]
+    while not (robot.connected and robot.link_state == robot.STATE_STREAM
+               and robot.link_connection is not old):
+        if main.done():
+            raise RuntimeError("robot main() ended: %r" % (main.exception(),))
+        if time.ticks_ms() - t0 > TIMEOUT_MS:
+            raise RuntimeError("no reconnect within %d ms" % TIMEOUT_MS)
+        await asyncio.sleep(0.002)
+    return time.ticks_ms() - t0, aioble.stats["discoveries"] - discoveries
+
+
+async def drop(robot, main):
+    """ Drop the link and time the reconnect """
+    old = robot.link_connection
+    await old.disconnect()
+    return await streaming(robot, main, old)
+
+
+async def connect_fault(robot, main):
+    """ The scan path's connect raises an OSError once """
+    connect = robot.connect
+
+    async def failing_connect(device):
+        robot.connect = connect
+        raise OSError("injected connect failure")
+
+    robot.forget_remote(robot.load_cache())
+    robot.connect = failing_connect
+    return await drop(robot, main)
+
+
+async def decode_fault(robot, main):
+    """ decode() raises once, on the next frame the remote sends """
+    import machine
+    decode = robot.decode
+
+    def failing_decode(data):
+        robot.decode = decode
+        raise ValueError("injected decode failure")
+
+    robot.decode = failing_decode
+    old = robot.link_connection
+    now = time.ticks_ms()
+    machine.trace_pin(GREEN, [(now, 1), (now + 100, 0)])
+    return await streaming(robot, main, old)
+
+
+def bump_model(remote):
+    """ Raise the remote's model number, as a GATT layout change would """
+    for characteristic in remote.device_info.characteristics:
+        if characteristic.uuid == remote.bluetooth.UUID(remote.MODEL_NUMBER_ID):
+            major, minor = characteristic.read().decode().split(".")
+            characteristic.write("%s.%d" % (major, int(minor) + 1))
+
+
+async def session(robot, remote, drops):
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    main = tasks[1]
+    results = {"first": [], "known": [], "scan": [], "bump": [], "rebumped": []}
+    errors = []
+    try:
+        results["first"].append(await streaming(robot, main))
+        for _ in range(drops):
+            await asyncio.sleep(SETTLE_MS / 1000)
+            results["known"].append(await drop(robot, main))
+        for _ in range(drops):
+            await asyncio.sleep(SETTLE_MS / 1000)
+            robot.forget_remote(robot.load_cache())
+            results["scan"].append(await drop(robot, main))
+        await asyncio.sleep(SETTLE_MS / 1000)
+        bump_model(remote)
+        results["bump"].append(await drop(robot, main))
+        await asyncio.sleep(SETTLE_MS / 1000)
+        results["rebumped"].append(await drop(robot, main))
+        for name, fault in (("connect", connect_fault), ("decode", decode_fault)):
+            await asyncio.sleep(SETTLE_MS / 1000)
+            try:
+                results[name] = [await fault(robot, main)]
+            except RuntimeError as e:
+                errors.append("%s fault: %s" % (name, e))
+                break
+    except RuntimeError as e:
+        errors.append(str(e))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drops", type=int, default=5)
+    parser.add_argument("--profile", type=int, default=1)
+    args = parser.parse_args()
+    state = tempfile.mkdtemp(prefix="thing-reconnect-")
+    with open(os.path.join(state, "profile.txt"), "w") as f:
+        f.write(str(args.profile))
+    with open(os.path.join(state, "remote.json"), "w") as f:
+        json.dump({"last": None, "remotes": {}, "profile": args.profile}, f)
+    robot, remote = sim.load(state)
+    results, errors = asyncio.run(session(robot, remote, args.drops))
+    for name, reconnects in results.items():
+        if not reconnects:
+            continue
+        times = [ms for ms, _ in reconnects]
+        discoveries = [n for _, n in reconnects]
+        print("%s: %d reconnects, mean %d ms, worst %d ms, discoveries %s" % (
+            name, len(times), sum(times) / len(times), max(times), discoveries))
+        if name in DISCOVERS and any(bool(n) != DISCOVERS[name] for n in discoveries):
+            errors.append("%s reconnects %s discover" % (name, "should" if DISCOVERS[name] else "shouldn't"))
+    for error in errors:
+        print(error)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+""" Run robot.py and remote_control.py together on the host.
+
+    python -m sim.run [--seconds S] [--trace FILE] [--state DIR] [--log FILE]
+
+The trace is JSON: {"pins": {pin: [[ms, value], ...]}, "adc": {pin: [[ms,
+raw], ...]}}, timed from the start of the simulation. Without one, the
+remote's buttons are pressed in turn once the robot has had time to
+connect. Files the scripts keep on flash go in --state, a fresh temporary
+directory by default. --log writes every servo write as CSV: ms, pin, angle.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+
+from . import install
+
+# Remote inputs
+WHITE, BLACK, GREEN, RED, BLUE, YELLOW = 2, 3, 4, 5, 6, 7
+LEFT_STICK_1, LEFT_STICK_2, RIGHT_STICK_1 = 26, 27, 28
+
+
+DEMO_TRACE = {
+    "pins": {
+        GREEN: [[8000, 1], [8200, 0]],
+        RED: [[16000, 1], [16200, 0]],
+        BLUE: [[18000, 1], [18200, 0]],
+    },
+    "adc": {
+        LEFT_STICK_1: [[21000, 65535], [24000, 32768]],
+    },
+}
+
+
+def load(state_dir=None):
+    """ Import both scripts against the fakes and return (robot, remote) """
+    install()
+    os.chdir(state_dir or tempfile.mkdtemp(prefix="thing-sim-"))
+    remote = importlib.import_module("remote_control")
+    robot = importlib.import_module("robot")
+    return robot, remote
+
+
+def apply_trace(trace):
+    import machine
+    for pin, steps in trace.get("pins", {}).items():
+        machine.trace_pin(int(pin), [tuple(step) for step in steps])
+    for pin, steps in trace.get("adc", {}).items():
+        machine.trace_adc(int(pin), [tuple(step) for step in steps])
+
+
+async def run(robot, remote, seconds):
+    """ Run both mains side by side for seconds """
+    tasks = [asyncio.create_task(remote.main()), asyncio.create_task(robot.main())]
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=26)
+    parser.add_argument("--trace")
+    parser.add_argument("--state")
+    parser.add_argument("--log")
+    args = parser.parse_args()
+    trace = DEMO_TRACE
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    log_path = os.path.abspath(args.log) if args.log else None
+    robot, remote = load(args.state)
+    apply_trace(trace)
+    asyncio.run(run(robot, remote, args.seconds))
+
+    import aioble
+    import machine
+    print()
+    print("servo writes", len(machine.PWM.log), "hand commits skipped", robot.hand.skipped)
+    print("i2c bytes", machine.I2C.bytes)
+    print("ble", aioble.stats)
+    if log_path:
+        with open(log_path, "w") as f:
+            for ms, pin, angle in machine.PWM.log:
+                f.write("%d,%d,%s\n" % (ms, pin, angle))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+""" The gesture script interpreter against the direct calls it replaced.
+
+    python -m sim.script [--runs N]
+
+Loads robot.py against the fakes and runs every built-in script gesture
+twice: through run_script, and as the chain of play() calls it was written
+as before the scripts. The motion core is left out: start_move records the
+move and returns at once, and waits return straight away, so what is timed
+is the cost of getting each keyframe to start_move.
+
+  moves     every move and wait the two issue, in order, must be the same
+  overhead  us per keyframe for each, over --runs runs of every gesture,
+            and the script's cost over the direct calls'
+
+Times are CPython's; on the Pico both paths run as bytecode and the
+script's word reads take the place of play()'s table reads. Exits non-zero
+if a gesture issues different moves or waits from its direct calls.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from array import array
+
+from . import install
+
+
+def direct(robot):
+    """ The gestures as they were written before the scripts """
+    play = robot.play
+
+    async def rise_up():
+        await play(robot.RISE_UP)
+        await robot.crouch_walk_backward(steps=1)
+        await play(robot.RISE_UP_THUMB)
+        await robot.get_up()
+
+    async def finger_stamp():
+        await play(robot.FINGER_STAMP, repeat=10)
+
+    async def point_finger():
+        await play(robot.STAND_POSE)
+        await play(robot.POINT, repeat=4)
+        await play(robot.POINT_END)
+
+    async def bow_down():
+        await robot.get_up()
+        await play(robot.BOW_DOWN)
+        await robot.asyncio.sleep_ms(2000)
+        await robot.get_up()
+
+    async def tap_fingers():
+        await play(robot.TAP_FINGERS, array('H', (50, 50, 50, 50, 50, 50, 50, 0)), repeat=8)
+
+    async def trick_or_treat():
+        await play(robot.TRICK_OR_TREAT, repeat=2)
+        await play(robot.TRICK_OR_TREAT_END)
+        await play(robot.TRICK_OR_TREAT_WAVE, repeat=3)
+
+    return {"rise_up": rise_up, "finger_stamp": finger_stamp, "point_finger": point_finger,
+            "bow_down": bow_down, "tap_fingers": tap_fingers, "trick_or_treat": trick_or_treat}
+
+
+class Recorder:
+    """ Stands in for the motion core and the clock: notes every move and
+    wait, and returns from both at once """
+
+    def __init__(self, robot):
+        self.log = []
+        self.moves = 0
+
+        def recorded_start_move(pose, ms, easing):
+            self.moves += 1
+            if self.log is not None:
+                self.log.append(("move", tuple(pose), ms, easing))
+            return 0
+
+        async def recorded_sleep_ms(ms):
+            if self.log is not None:
+                self.log.append(("wait", ms))
+
+        robot.start_move = recorded_start_move
+        robot.asyncio.sleep_ms = recorded_sleep_ms
+
+    def take(self):
+        log, self.log = self.log, []
+        return log
+
+
+async def compare(robot, recorder, gestures):
+    """ name -> differences between the script's moves and the direct ones """
+    errors = {}
+    for name, gesture in gestures.items():
+        recorder.take()
+        await robot.run_script(robot.script_gestures[name])
+        scripted = recorder.take()
+        await gesture()
+        called = recorder.take()
+        # The script waits out a move's time itself when start_move takes
+        # no channels; move_to always does
+        scripted = [step for step in scripted if step != ("wait", 0)]
+        called = [step for step in called if step != ("wait", 0)]
+        errors[name] = [] if scripted == called else [
+            "%d steps scripted, %d called; first difference at %d" % (
+                len(scripted), len(called),
+                next((i for i, (a, b) in enumerate(zip(scripted, called)) if a != b),
+                     min(len(scripted), len(called))))]
+    return errors
+
+
+async def overhead(robot, recorder, gestures, runs):
+    """ (us per keyframe scripted, us per keyframe called) """
+    recorder.log = None
+    results = []
+    for run in (lambda name: robot.run_script(robot.script_gestures[name]),
+                lambda name: gestures[name]()):
+        recorder.moves = 0
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            for name in gestures:
+                await run(name)
+        results.append((time.perf_counter() - t0) * 1_000_000 / recorder.moves)
+    recorder.log = []
+    return results
+
+
+async def session(robot, runs):
+    recorder = Recorder(robot)
+    gestures = direct(robot)
+    errors = await compare(robot, recorder, gestures)
+    return errors, await overhead(robot, recorder, gestures, runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+    install()
+    os.chdir(tempfile.mkdtemp(prefix="thing-script-"))
+    import robot
+    errors, (scripted, called) = asyncio.run(session(robot, args.runs))
+    failed = False
+    for name, differences in errors.items():
+        print("%s: %s" % (name, "same moves and waits" if not differences else differences[0]))
+        failed = failed or bool(differences)
+    print("per keyframe: script %.2f us, direct calls %.2f us, script overhead %+.2f us (%+.0f%%)" % (
+        scripted, called, scripted - called, 100 * (scripted - called) / called))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
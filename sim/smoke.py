@@ -0,0 +1,133 @@
+""" Import robot.py and remote_control.py under the MicroPython unix port.
+
+    python -m sim.smoke [--micropython PATH]
+    python -m sim.smoke --footprint [--before REV] [--mpy-cross PATH]
+
+The rest of the simulation runs the scripts under CPython, which accepts
+things MicroPython doesn't, such as an int looked for in a bytearray or a
+tuple passed to array.extend(). This runs sim/upy/smoke.py on the unix
+port instead, with the stand-ins in sim/upy for the modules only the Pico
+has, from a fresh directory so nothing on flash is found. It imports both
+scripts and runs the robot's hot paths once (see the script).
+
+--footprint compares robot.py at --before (the repository's first commit by
+default, when every gesture was written out servo by servo) with the
+working tree's:
+
+  ram       heap the imported module holds after a collection, on the
+            unix port (sim/upy/footprint.py)
+  flash     bytes of source, and of the .mpy that mpy-cross compiles it to,
+            which is what freezing or precompiling puts on flash
+
+The older scripts start their event loop at import; that line is dropped
+before measuring. micropython and mpy-cross are looked for on PATH unless
+--micropython or $MICROPYTHON, --mpy-cross or $MPY_CROSS name them; build
+them from ports/unix and mpy-cross of the MicroPython source. Exits
+non-zero if micropython can't be found or a run fails; without mpy-cross
+the .mpy sizes are left out.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from . import ROOT
+
+UPY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upy")
+
+# The event loop the older scripts start at the bottom of the module
+RUN_AT_IMPORT = re.compile(r"^(while True:\s*\n\s+)?asyncio\.run\(main\(\)\)[ \t]*$", re.M)
+
+
+def environment(*path):
+    env = dict(os.environ)
+    # .frozen keeps the port's own frozen modules, uasyncio among them
+    env["MICROPYPATH"] = os.pathsep.join((".frozen",) + path + (UPY, ROOT))
+    return env
+
+
+def smoke(binary):
+    with tempfile.TemporaryDirectory(prefix="thing-smoke-") as state:
+        result = subprocess.run([binary, os.path.join(UPY, "smoke.py")], cwd=state,
+                                env=environment())
+    return result.returncode
+
+
+def source(rev):
+    """ robot.py at rev, or the working tree's for None """
+    if rev is None:
+        with open(os.path.join(ROOT, "robot.py")) as f:
+            return f.read()
+    return subprocess.run(["git", "show", "%s:robot.py" % rev], cwd=ROOT, check=True,
+                          capture_output=True, text=True).stdout
+
+
+def measure(binary, mpy_cross, rev):
+    """ (heap bytes held, source bytes, .mpy bytes or None) for robot.py at rev """
+    with tempfile.TemporaryDirectory(prefix="thing-footprint-") as work:
+        module = os.path.join(work, "module")
+        state = os.path.join(work, "state")
+        os.mkdir(module)
+        os.mkdir(state)
+        path = os.path.join(module, "robot.py")
+        with open(path, "w") as f:
+            f.write(RUN_AT_IMPORT.sub("", source(rev)))
+        result = subprocess.run([binary, os.path.join(UPY, "footprint.py")], cwd=state,
+                                env=environment(module), capture_output=True, text=True)
+        lines = [line for line in result.stdout.splitlines() if line.startswith("footprint ")]
+        if result.returncode or not lines:
+            print(result.stdout + result.stderr, file=sys.stderr)
+            raise RuntimeError("robot.py at %s didn't import" % (rev or "the working tree"))
+        ram = int(lines[-1].split()[1])
+        mpy = None
+        if mpy_cross:
+            compiled = os.path.join(work, "robot.mpy")
+            subprocess.run([mpy_cross, "-o", compiled, path], check=True)
+            mpy = os.path.getsize(compiled)
+        return ram, os.path.getsize(path), mpy
+
+
+def footprint(binary, mpy_cross, before):
+    rows = []
+    for label, rev in (("before (%s)" % before, before), ("after (working tree)", None)):
+        try:
+            rows.append((label,) + measure(binary, mpy_cross, rev))
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            print(e, file=sys.stderr)
+            return 1
+    for label, ram, size, mpy in rows:
+        print("%s: ram %d bytes, source %d bytes, mpy %s" % (
+            label, ram, size, "%d bytes" % mpy if mpy is not None else "not built"))
+    (_, ram0, size0, mpy0), (_, ram1, size1, mpy1) = rows
+    print("change: ram %+d bytes, source %+d bytes%s" % (
+        ram1 - ram0, size1 - size0, ", mpy %+d bytes" % (mpy1 - mpy0) if mpy0 is not None else ""))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--micropython", default=os.environ.get("MICROPYTHON", "micropython"))
+    parser.add_argument("--footprint", action="store_true")
+    parser.add_argument("--before", help="a git revision; the first commit by default")
+    parser.add_argument("--mpy-cross", default=os.environ.get("MPY_CROSS", "mpy-cross"))
+    args = parser.parse_args()
+    binary = shutil.which(args.micropython)
+    if binary is None:
+        print("micropython not found; build ports/unix and pass --micropython", file=sys.stderr)
+        sys.exit(2)
+    if args.footprint:
+        mpy_cross = shutil.which(args.mpy_cross)
+        if mpy_cross is None:
+            print("mpy-cross not found; leaving out the .mpy sizes", file=sys.stderr)
+        before = args.before or subprocess.run(
+            ["git", "rev-list", "--max-parents=0", "HEAD"], cwd=ROOT, check=True,
+            capture_output=True, text=True).stdout.split()[0][:7]
+        sys.exit(footprint(binary, mpy_cross, before))
+    sys.exit(smoke(binary))
+
+
+if __name__ == "__main__":
+    main()
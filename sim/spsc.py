@@ -0,0 +1,96 @@
+""" The motion queue between the robot's two cores, on CPython threads.
+
+    python -m sim.spsc [--records N] [--interval-us US]
+
+Runs robot.py's Ring, at the motion queue's size and record width, between
+a producer thread that stands in for core 0 and a consumer thread that
+stands in for core 1. Every record carries a sequence number and the
+ticks_us it was pushed at. The consumer checks that records arrive
+complete, in order and without gaps, and times each handoff from push to
+peek. It runs twice: polling every POLL_MS like motion_core, and spinning,
+which shows what the queue itself costs. The producer pushes every
+--interval-us, and in a final burst as fast as it can, so the queue fills
+and wraps.
+
+CPython's GIL switches threads every few ms, which bounds the latencies
+here from below; on the Pico both cores run at once.
+"""
+import argparse
+import sys
+import threading
+import time
+
+from . import install, percentile
+
+
+def handoff(robot, records, interval_us, poll):
+    ring = robot.Ring(robot.MOTION_QUEUE, robot.MQ_WIDTH)
+    width = robot.MQ_WIDTH
+    latencies = []
+    errors = []
+    full = [0]
+
+    def produce():
+        for n in range(records):
+            burst = n >= records // 2
+            base = ring.reserve()
+            while base < 0:
+                full[0] += 1
+                time.sleep(0)
+                base = ring.reserve()
+            ring.buf[base] = n
+            for i in range(1, width - 1):
+                ring.buf[base + i] = n + i
+            ring.buf[base + width - 1] = time.ticks_us()
+            ring.push()
+            if not burst:
+                time.sleep(interval_us / 1_000_000)
+
+    def consume():
+        expected = 0
+        while expected < records:
+            base = ring.peek()
+            if base < 0:
+                if poll:
+                    time.sleep_ms(robot.POLL_MS)
+                continue
+            now = time.ticks_us()
+            buf = ring.buf
+            n = buf[base]
+            if n != expected:
+                errors.append("got record %d, expected %d" % (n, expected))
+            elif any(buf[base + i] != n + i for i in range(1, width - 1)):
+                errors.append("record %d torn" % n)
+            latencies.append(time.ticks_diff(now, buf[base + width - 1]))
+            ring.pop()
+            expected = n + 1
+
+    threads = [threading.Thread(target=consume), threading.Thread(target=produce)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, full[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--interval-us", type=int, default=200)
+    args = parser.parse_args()
+    install()
+    import robot
+    failed = False
+    for poll in (True, False):
+        latencies, errors, full = handoff(robot, args.records, args.interval_us, poll)
+        print("%s: %d records, %d errors, queue full %d times, handoff us p50 %d p99 %d max %d" % (
+            "polling" if poll else "spinning", len(latencies), len(errors), full,
+            percentile(latencies, 50), percentile(latencies, 99), max(latencies)))
+        for error in errors[:5]:
+            print("  " + error)
+        failed = failed or bool(errors) or len(latencies) != args.records
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+""" Stand-in aioble for the unix port: services and characteristics can be
+made and hold their values, but there is no radio, so nothing connects """
+
+ADDR_PUBLIC = 0
+ADDR_RANDOM = 1
+
+
+class GattError(Exception):
+    pass
+
+
+class DeviceDisconnectedError(Exception):
+    pass
+
+
+class Service:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.characteristics = []
+
+
+class Characteristic:
+    def __init__(self, service, uuid, read=False, write=False, write_no_response=False,
+                 notify=False, indicate=False, initial=None, capture=False):
+        service.characteristics.append(self)
+        self.uuid = uuid
+        self._value = b""
+        if initial is not None:
+            self.write(initial)
+
+    def read(self):
+        return self._value
+
+    def write(self, data, send_update=False):
+        self._value = data.encode() if isinstance(data, str) else bytes(data)
+
+    def notify(self, connection, data=None):
+        pass
+
+
+def register_services(*services):
+    pass
+
+
+class Device:
+    def __init__(self, addr_type, addr):
+        self.addr_type = addr_type
+        self.addr = bytes(addr)
+
+    async def connect(self, timeout_ms=10000, scan_duration_ms=None,
+                      min_conn_interval_us=None, max_conn_interval_us=None):
+        raise OSError("no radio")
+
+
+class scan:
+    def __init__(self, duration_ms, interval_us=1280000, window_us=11250, active=False):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+async def advertise(interval_us, adv_data=None, resp_data=None, connectable=True,
+                    limited_disc=False, include_tx_power=False, name=None,
+                    services=None, appearance=0, manufacturer=None, timeout_ms=None):
+    raise OSError("no radio")
@@ -0,0 +1,16 @@
+""" Stand-in bluetooth module for the unix port: UUIDs only """
+
+
+class UUID:
+    def __init__(self, value):
+        if isinstance(value, UUID):
+            value = value._value
+        if isinstance(value, str):
+            value = value.lower()
+        self._value = value
+
+    def __eq__(self, other):
+        return isinstance(other, UUID) and self._value == other._value
+
+    def __hash__(self):
+        return hash(self._value)
@@ -0,0 +1,22 @@
+""" Run by sim.smoke --footprint under the unix port, with the robot.py to
+measure first on the path. Prints the heap robot.py holds once imported:
+everything it allocated at import that a collection doesn't free. The
+stand-ins are imported first, so only robot.py and what it imports of this
+repository is counted. """
+import gc
+
+import machine
+import bluetooth
+import aioble
+import uasyncio
+import micropython
+try:
+    import servo
+except ImportError:
+    pass
+
+gc.collect()
+base = gc.mem_alloc()
+import robot
+gc.collect()
+print("footprint", gc.mem_alloc() - base)
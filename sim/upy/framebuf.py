@@ -0,0 +1,27 @@
+""" Stand-in framebuf, for unix port builds without the built-in one (which
+is used instead where there is one). Draws nothing. """
+
+MONO_VLSB = 0
+MONO_HLSB = 3
+
+
+class FrameBuffer:
+    def __init__(self, buffer, width, height, format, stride=None):
+        self._buffer = buffer
+        self.width = width
+        self.height = height
+
+    def fill(self, c):
+        pass
+
+    def fill_rect(self, x, y, w, h, c):
+        pass
+
+    def pixel(self, x, y, c=None):
+        return 0
+
+    def text(self, s, x, y, c=1):
+        pass
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        pass
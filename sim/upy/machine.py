@@ -0,0 +1,97 @@
+""" Stand-in machine module for the unix port: just enough of the Pico's for
+robot.py and remote_control.py to import and run their hot paths. Inputs
+read idle, outputs are dropped, and mem32 is plain memory except that the
+PWM slices' TOP registers read back what rp2's PWM.freq(50) sets. """
+
+PWM_BASE = 0x40050000
+PWM_SLICE = 0x14
+PWM_TOP = 0x10
+SERVO_TOP = 64101  # 125 MHz / (divider 39 * 50 Hz) - 1
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x7a\x2b\x2c"
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self._value = 0 if value is None else value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+
+class ADC:
+    def __init__(self, pin):
+        self.id = pin
+
+    def read_u16(self):
+        return 32768
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.pin = pin
+        self._freq = freq or 0
+        self._duty = duty_u16 or 0
+
+    def freq(self, freq=None):
+        if freq is None:
+            return self._freq
+        self._freq = freq
+
+    def duty_u16(self, duty=None):
+        if duty is None:
+            return self._duty
+        self._duty = duty
+
+    def deinit(self):
+        pass
+
+
+class I2C:
+    def __init__(self, id, scl=None, sda=None, freq=400000):
+        self.id = id
+
+    def writeto(self, addr, buf, stop=True):
+        return 1
+
+    def writevto(self, addr, vector, stop=True):
+        return 1
+
+    def scan(self):
+        return [0x3C]
+
+
+class _Mem32:
+    def __init__(self):
+        self.words = {}
+
+    def __getitem__(self, address):
+        offset = address - PWM_BASE
+        if 0 <= offset < 8 * PWM_SLICE and offset % PWM_SLICE == PWM_TOP:
+            return SERVO_TOP
+        return self.words.get(address, 0)
+
+    def __setitem__(self, address, value):
+        self.words[address] = value & 0xFFFFFFFF
+
+
+mem32 = _Mem32()
@@ -0,0 +1,14 @@
+""" Stand-in for the servo library robot.py drove the joints through before
+the keyframe tables, for sim.smoke --footprint to import that version """
+
+
+class Servo:
+    def __init__(self, pin_id, min_us=544.0, max_us=2400.0, min_deg=0.0, max_deg=180.0, freq=50):
+        self.pin_id = pin_id
+        self.angle = None
+
+    def write(self, deg):
+        self.angle = deg
+
+    def read(self):
+        return self.angle
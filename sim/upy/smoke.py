@@ -0,0 +1,108 @@
+""" Run by sim.smoke under the MicroPython unix port, with the stand-ins next
+to this file ahead of the Pico's modules. Imports both scripts, which
+builds every table they make at boot, then runs the robot's hot paths once:
+a script with every op, the motion core's side of a move, the gait, a frame
+and legacy commands through decode(), and a recording saved and played back.
+Core 1 is stood in for by draining the motion queue on this thread. Any
+exception is a failure; the last line printed is "smoke ok". """
+import time
+from array import array
+
+import uasyncio as asyncio
+
+import robot
+import remote_control
+
+SCRIPT = """
+bind smoke red
+gesture smoke_inner
+    pose index STRAIGHT wrist 5
+    set
+gesture smoke
+    pose all CROUCH
+    move 40 linear
+    pose thumb 1 2 3
+    move 30
+    wait 5
+    repeat 2
+        call smoke_inner
+    end
+    play CROUCH_POS
+    play TAP_FINGERS 5 5 5 5 5 5 5 0
+"""
+
+
+def drain():
+    """ Core 1's side: take every queued record """
+    queue = robot.motion_queue
+    base = queue.peek()
+    while base >= 0:
+        robot._take(base)
+        queue.pop()
+        base = queue.peek()
+
+
+async def core1():
+    while True:
+        drain()
+        if robot._moving:
+            robot.motion_tick(time.ticks_ms())
+        await asyncio.sleep_ms(1)
+
+
+async def run():
+    motion = asyncio.create_task(core1())
+    # Scripts
+    code, gestures, bindings = robot.compile_scripts(SCRIPT)
+    assert bindings == {1: "smoke"}
+    builtin = robot.script_code, robot.script_gestures
+    robot.script_code, robot.script_gestures = code, gestures
+    try:
+        await asyncio.wait_for(robot.run_script(gestures["smoke"]), 5)
+    finally:
+        robot.script_code, robot.script_gestures = builtin
+    # Keyframe tables and the walk
+    await robot.play(robot.FINGER_STAMP, array('H', [5] * 5))
+    for cycle in (robot.CROUCH_GAIT, robot.STAND_GAIT):
+        for phase in range(0, robot.PHASE_ONE, 997):
+            robot.start_move(robot.gait_pose(cycle, phase), 0, robot.STEP)
+            drain()
+    # Frames and legacy commands
+    frame = bytearray(robot.FRAME_LEN)
+    frame[0] = 0x80 | robot.FRAME_VERSION
+    frame[robot.FRAME_BUTTONS] = robot.link_profile << robot.PROFILE_SHIFT
+    for buttons, stick in ((0x01, 0), (0, 100), (0, 0), (0x04, 0xA0), (0, 0)):
+        frame[1] += 1
+        frame[robot.FRAME_BUTTONS] = buttons | robot.link_profile << robot.PROFILE_SHIFT
+        frame[robot.FRAME_AXES] = stick
+        robot.decode(frame)
+        await asyncio.sleep_ms(5)
+    robot.decode(b"gx!")
+    await asyncio.sleep_ms(5)
+    robot.dispatcher.stop()
+    # A recording of a few frames, saved and played back
+    robot.toggle_recording(1)
+    robot.hand.set_pose(robot.NEUTRAL)
+    robot.hand.commit()
+    for _ in range(3):
+        base = robot.record_head * robot.JOINTS
+        for j in range(robot.JOINTS):
+            robot.record_buf[base + j] = robot.hand.angles[j]
+        robot.record_head += 1
+        robot.record_count += 1
+    robot.toggle_recording(1)
+    await robot.play_recording(1)
+    motion.cancel()
+
+
+def main():
+    asyncio.run(run())
+    robot.stats.snapshot()
+    robot.hand.write(0, 90)
+    remote_control.sample_inputs()
+    remote_control.send()
+    remote_control.stats.snapshot()
+    print("smoke ok")
+
+
+main()